@@ -0,0 +1,290 @@
+"""
+Columnar per-dart analytics over the game archive.
+
+Every archived dart is held in a set of NumPy arrays (one per column), so
+questions like "where does Alice's dart land", "how often does Bob hit T20"
+or "which doubles does Carol check out on" are answered with vectorized
+counts over the whole history instead of Python loops.
+
+The store is loaded from the archive on first use and then topped up before
+each query with the games archived or changed since, as listed in the
+archive's change log, so it stays in sync across Gunicorn workers without
+any coordination.
+"""
+
+import threading
+
+import numpy as np
+
+import archive
+
+# Column codes for the game mode
+MODE_X01, MODE_CRICKET, MODE_AROUND_THE_WORLD = 0, 1, 2
+# Segments indexed by base score; 25 is the bull
+SEGMENT_COUNT = 26
+# Above this, a player throwing at an X01 score is aiming at treble 20
+TREBLE_20_ZONE = 60
+INITIAL_CAPACITY = 4096
+# The double that finishes from each score up to the bull's 50, or 0 if none does
+CHECKOUT_TARGETS = np.array(
+    [archive.checkout_double(score) or 0 for score in range(archive.BULL_FINISH + 1)]
+)
+# Darts the columns can hold; anything else in the archive is left out
+VALID_DART = """(t.base_score BETWEEN 1 AND 20 AND t.multiplier BETWEEN 1 AND 3
+    OR t.base_score = 25 AND t.multiplier IN (1, 2)
+    OR t.base_score = 0 AND t.multiplier = 1)
+    AND t.dart BETWEEN 0 AND 65535"""
+
+COLUMNS = {
+    "player": np.int32,
+    "game": np.int32,
+    "segment": np.uint8,
+    "multiplier": np.uint8,
+    "dart": np.uint16,
+    "remaining": np.int16,  # X01 score (or ATW target) before the dart
+    "mode": np.uint8,
+}
+
+
+def _remaining(score_before):
+    """The score before a dart, or -1 where it is unknown or can't be a real score."""
+    if isinstance(score_before, int) and 0 <= score_before <= np.iinfo(np.int16).max:
+        return score_before
+    return -1
+
+
+def _mode_code(mode):
+    if mode == "cricket":
+        return MODE_CRICKET
+    if mode == "around_the_world":
+        return MODE_AROUND_THE_WORLD
+    return MODE_X01
+
+
+class DartStore:
+    """Append-only, array-backed columns holding one row per dart."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.size = 0
+        self.columns = {
+            name: np.zeros(INITIAL_CAPACITY, dtype) for name, dtype in COLUMNS.items()
+        }
+        self.player_ids = {}  # Player name -> id used in the player column
+        self.game_ids = {}  # Archive game id -> id used in the game column
+        self.loaded = False
+        self.last_change = 0  # Newest entry of the archive's change log already loaded
+
+    def player_id(self, name):
+        return self.player_ids.setdefault(name, len(self.player_ids))
+
+    def append(self, rows):
+        """Appends rows given as a dict of column name -> sequence of equal length."""
+        count = len(rows["player"])
+        if count == 0:
+            return
+        needed = self.size + count
+        if needed > len(self.columns["player"]):
+            capacity = len(self.columns["player"])
+            while capacity < needed:
+                capacity *= 2
+            for name, column in self.columns.items():
+                grown = np.zeros(capacity, column.dtype)
+                grown[: self.size] = column[: self.size]
+                self.columns[name] = grown
+        for name, column in self.columns.items():
+            column[self.size : needed] = rows[name]
+        self.size = needed
+
+    def remove_games(self, game_ids):
+        """Drops the rows of the given archive games, e.g. before loading them again."""
+        codes = [self.game_ids[g] for g in game_ids if g in self.game_ids]
+        if not codes:
+            return
+        keep = ~np.isin(self.columns["game"][: self.size], codes)
+        count = int(keep.sum())
+        for column in self.columns.values():
+            column[:count] = column[: self.size][keep]
+        self.size = count
+
+    def refresh(self, conn):
+        """Loads the darts of games archived, or changed, since the last refresh."""
+        # Read the newest change first: a game written after it is loaded again next time
+        latest = conn.execute("SELECT max(seq) FROM game_changes").fetchone()[0] or 0
+        if self.loaded and latest == self.last_change:
+            return
+        if self.loaded:
+            changed = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT game_id FROM game_changes WHERE seq > ? AND seq <= ?",
+                    (self.last_change, latest),
+                )
+            ]
+            self.remove_games(changed)
+            where = "g.id IN (SELECT game_id FROM game_changes WHERE seq > ? AND seq <= ?)"
+            params = (self.last_change, latest)
+        else:
+            where, params = "1", ()
+        rows = conn.execute(
+            f"""SELECT g.id, g.mode, t.dart, t.base_score, t.multiplier, t.score_before,
+                       CASE t.player WHEN 1 THEN g.player1_name WHEN 2 THEN g.player2_name
+                                     WHEN 3 THEN g.player3_name ELSE g.player4_name END
+                FROM games g JOIN throws t ON t.game_id = g.id
+                WHERE {where} AND {VALID_DART}
+                ORDER BY g.rowid, t.dart""",
+            params,
+        ).fetchall()
+        self.loaded, self.last_change = True, latest
+        if not rows:
+            return
+        game_ids, modes, darts, segments, multipliers, befores, names = zip(*rows)
+        self.append(
+            {
+                "player": [self.player_id(name or "Unknown") for name in names],
+                "game": [self.game_ids.setdefault(g, len(self.game_ids)) for g in game_ids],
+                "segment": segments,
+                "multiplier": multipliers,
+                "dart": darts,
+                "remaining": [_remaining(b) for b in befores],
+                "mode": [_mode_code(mode) for mode in modes],
+            }
+        )
+
+    def view(self, player=None):
+        """Returns the filled part of each column, optionally for one player only."""
+        columns = {name: column[: self.size] for name, column in self.columns.items()}
+        if player is not None:
+            mask = columns["player"] == self.player_ids.get(player, -1)
+            columns = {name: column[mask] for name, column in columns.items()}
+        return columns
+
+
+def segment_heatmap(columns):
+    """Counts hits per segment as {"20": [singles, doubles, trebles], ...}."""
+    counts = np.bincount(
+        columns["segment"].astype(np.intp) * 3 + columns["multiplier"] - 1,
+        minlength=SEGMENT_COUNT * 3,
+    ).reshape(SEGMENT_COUNT, 3)
+    return {
+        str(segment): counts[segment].tolist()
+        for segment in range(SEGMENT_COUNT)
+        if counts[segment].any()
+    }
+
+
+def _treble_20_attempts(columns):
+    """Masks of X01 darts thrown from above 60, and of those that hit treble 20."""
+    attempt = (columns["mode"] == MODE_X01) & (columns["remaining"] > TREBLE_20_ZONE)
+    hit = attempt & (columns["segment"] == 20) & (columns["multiplier"] == 3)
+    return attempt, hit
+
+
+def _double_attempts(columns):
+    """
+    Masks of X01 darts thrown at a finishing double and of those that won the
+    leg, plus the segment of the double each dart needed (25 for the bull).
+    """
+    remaining = columns["remaining"].astype(np.intp)
+    finishable = (remaining >= 0) & (remaining <= archive.BULL_FINISH)
+    target = np.where(
+        finishable, CHECKOUT_TARGETS[np.clip(remaining, 0, archive.BULL_FINISH)], 0
+    )
+    attempt = (columns["mode"] == MODE_X01) & (target > 0)
+    hit = attempt & (columns["multiplier"] == 2) & (columns["segment"] == target)
+    return attempt, hit, target
+
+
+def _rate(hits, attempts):
+    return float(hits / attempts) if attempts else 0.0
+
+
+def treble_20_rate(columns):
+    """How often darts aimed at treble 20 hit it."""
+    attempt, hit = _treble_20_attempts(columns)
+    attempts, hits = int(attempt.sum()), int(hit.sum())
+    return {"attempts": attempts, "hits": hits, "rate": _rate(hits, attempts)}
+
+
+def double_success(columns):
+    """
+    Finishing attempts grouped by the double that would have won, e.g. D16 from
+    32, with how often it was hit. The bull is reported as "DB".
+    Returns (per double, overall).
+    """
+    attempt, hit, target = _double_attempts(columns)
+    attempts = np.bincount(target[attempt], minlength=SEGMENT_COUNT)
+    hits = np.bincount(target[hit], minlength=SEGMENT_COUNT)
+    doubles = {
+        ("DB" if segment == 25 else f"D{segment}"): {
+            "attempts": int(attempts[segment]),
+            "hits": int(hits[segment]),
+            "rate": _rate(hits[segment], attempts[segment]),
+        }
+        for segment in np.flatnonzero(attempts)
+    }
+    overall = {
+        "attempts": int(attempts.sum()),
+        "hits": int(hits.sum()),
+        "rate": _rate(hits.sum(), attempts.sum()),
+    }
+    return doubles, overall
+
+
+def player_summary(store):
+    """Darts, treble 20 rate and double success for every player in one pass."""
+    with store.lock:
+        columns = store.view()
+        player_ids = dict(store.player_ids)
+    player = columns["player"]
+    count = len(player_ids)
+
+    def per_player(mask):
+        return np.bincount(player[mask], minlength=count)
+
+    t20_attempt, t20_hit = _treble_20_attempts(columns)
+    double_attempt, double_hit, _ = _double_attempts(columns)
+    darts = np.bincount(player, minlength=count)
+    # Each distinct (player, game) pair is one game played
+    pairs = np.unique(player.astype(np.int64) << 32 | columns["game"])
+    games = np.bincount((pairs >> 32).astype(np.intp), minlength=count)
+    t20_attempts, t20_hits = per_player(t20_attempt), per_player(t20_hit)
+    double_attempts, double_hits = per_player(double_attempt), per_player(double_hit)
+    return {
+        name: {
+            "darts": int(darts[pid]),
+            "games": int(games[pid]),
+            "treble_20_rate": _rate(t20_hits[pid], t20_attempts[pid]),
+            "double_rate": _rate(double_hits[pid], double_attempts[pid]),
+        }
+        for name, pid in sorted(player_ids.items())
+    }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path):
+    """Returns this process's store for an archive, topped up with new games."""
+    with _stores_lock:
+        store = _stores.setdefault(path, DartStore())
+    with store.lock:
+        store.refresh(archive.connect(path))
+    return store
+
+
+def player_report(store, player):
+    """Everything /api/analytics shows for one player."""
+    with store.lock:
+        columns = store.view(player)
+    doubles, overall = double_success(columns)
+    return {
+        "player": player,
+        "darts": int(len(columns["player"])),
+        "games": int(len(np.unique(columns["game"]))),
+        "heatmap": segment_heatmap(columns),
+        "treble_20": treble_20_rate(columns),
+        "doubles": doubles,
+        "double_success": overall,
+    }
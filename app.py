@@ -1,10 +1,38 @@
 import os
+import gzip
+import hashlib
 import json
 import logging
-from flask import Flask, render_template_string, jsonify, request, session
+import math
+import pickle
+import re
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import (
+    Flask,
+    Response,
+    abort,
+    render_template,
+    jsonify,
+    request,
+    session,
+    stream_with_context,
+)
+from jinja2 import TemplateNotFound
+from flask.sessions import SecureCookieSessionInterface
+
+import profiler
 
-# Initialize the Flask app
-app = Flask(__name__)
+try:
+    import brotli  # Optional: preferred over gzip when installed
+except ImportError:
+    brotli = None
+
+# Initialize the Flask app. Static files are served by the asset pipeline below.
+app = Flask(__name__, static_folder=None)
 # A secret key is required for Flask to use 'session'
 SECRET_KEY = os.environ.get("SECRET_KEY")
 if not SECRET_KEY:
@@ -15,6 +43,25 @@ if not SECRET_KEY:
 
 app.secret_key = SECRET_KEY
 
+# Finished games are archived to SQLite (see archive.py)
+app.config["ARCHIVE_PATH"] = os.environ.get(
+    "DARTS_DB", os.path.join(app.root_path, "darts.db")
+)
+
+# Where game state lives between requests: "cookie" keeps it all in the signed
+# session cookie; "memory" also keeps it in the worker's memory (see GameStore),
+# which is what shard.py relies on to keep each game hot in one worker.
+app.config["SESSION_STORE"] = os.environ.get("DARTS_SESSION_STORE", "cookie")
+# In "memory" mode, games in progress are also saved to the archive database
+# this often (see livegames.py); a crash loses at most this window. 0 disables it.
+app.config["LIVE_FLUSH_MS"] = int(os.environ.get("DARTS_FLUSH_MS", "50"))
+# When run by shard.py: this backend's address and those of all backends, so a
+# restarted backend only recovers the games the router sends to it
+app.config["SHARD"] = os.environ.get("DARTS_SHARD")
+app.config["SHARDS"] = [b for b in os.environ.get("DARTS_SHARDS", "").split(",") if b]
+# Bearer token for the /admin routes, which are disabled when it isn't set
+app.config["ADMIN_TOKEN"] = os.environ.get("DARTS_ADMIN_TOKEN")
+
 # Configure basic logging
 if not app.debug:
     app.logger.setLevel(logging.INFO)
@@ -22,27 +69,101 @@ if not app.debug:
 
 # --- App Logic ---
 
-# Load checkouts from JSON file
-try:
-    with open("checkouts.json", "r") as f:
-        CHECKOUTS = json.load(f)
-except (FileNotFoundError, json.JSONDecodeError):
-    print(
-        "WARNING: checkouts.json not found or is invalid. Checkout suggestions will be unavailable."
-    )
-    CHECKOUTS = {}
+# Checkout suggestions are kept as a table indexed by score. build_checkouts.py
+# precompiles it from checkouts.json into a pickle at build time, which is used
+# whenever it is at least as new as the JSON file.
+CHECKOUTS_JSON_PATH = os.path.join(app.root_path, "checkouts.json")
+CHECKOUTS_PICKLE_PATH = os.path.join(app.root_path, "checkouts.pickle")
+MAX_CHECKOUT = 170
+
+
+def build_checkout_table(checkouts):
+    """
+    Converts the checkouts.json mapping into a tuple indexed by score.
+    Each entry holds (suggestion, darts needed) pairs, so suggestions can be
+    filtered by the darts left without splitting strings on every throw.
+    """
+    table = [()] * (MAX_CHECKOUT + 1)
+    for score, suggestions in checkouts.items():
+        table[int(score)] = tuple((s, len(s.split(","))) for s in suggestions)
+    return tuple(table)
+
+
+def _checkout_pickle_is_fresh():
+    """Checks that the precompiled table exists and is not older than the JSON."""
+    try:
+        pickle_mtime = os.path.getmtime(CHECKOUTS_PICKLE_PATH)
+    except OSError:
+        return False
+    try:
+        return pickle_mtime >= os.path.getmtime(CHECKOUTS_JSON_PATH)
+    except OSError:
+        return True  # Only the precompiled table was shipped
+
+
+def _load_checkout_table():
+    """Loads the precompiled checkout table, falling back to checkouts.json."""
+    if _checkout_pickle_is_fresh():
+        try:
+            with open(CHECKOUTS_PICKLE_PATH, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError):
+            pass  # Rebuild from the JSON below
+    try:
+        with open(CHECKOUTS_JSON_PATH, "r") as f:
+            return build_checkout_table(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError):
+        print(
+            "WARNING: checkouts.json not found or is invalid. Checkout suggestions will be unavailable."
+        )
+        return build_checkout_table({})
+
+
+CHECKOUT_TABLE = _load_checkout_table()
+# The same data keyed by score string, as exported to the client by /api/rules
+CHECKOUTS = {
+    str(score): [s for s, _ in entries]
+    for score, entries in enumerate(CHECKOUT_TABLE)
+    if entries
+}
+
+# Rule tables shared with the client so it can score throws offline (see /api/rules)
+VALID_MODES = ["101", "201", "301", "401", "501", "around_the_world", "cricket"]
+CRICKET_NUMBERS = [20, 19, 18, 17, 16, 15, 25]
+DARTS_PER_TURN = 3
+# Maximum number of queued throws accepted in one /api/score/batch request
+MAX_BATCH_SIZE = 50
+# Number of recent idempotency keys remembered per game to absorb retries
+DEDUP_WINDOW = 16
+MAX_IDEMPOTENCY_KEY_LENGTH = 64
+# Sequence numbers this close to the highest one seen are each remembered, so
+# throws sent in parallel may arrive out of order; older ones count as retries
+SEQ_WINDOW = 64
+SEQ_WINDOW_FULL = (1 << SEQ_WINDOW) - 1
+# Number of scorers sharing a game (e.g. tablets bound to one board) whose
+# sequence numbers are remembered; the longest idle one is forgotten first
+MAX_CLIENTS = 16
+MAX_CLIENT_ID_LENGTH = 64
+# Keys describing the sync position rather than the game. They are left out of
+# undo snapshots and survive an undo, so a retried throw stays deduplicated and
+# the state version (used for ETags) keeps moving forward.
+SYNC_KEYS = ("last_seq", "last_seqs", "seq_mask", "seq_masks", "recent_keys", "state_version")
+# Every dart of the game, packed by _pack_throw(). Like the sync keys it is kept
+# out of undo snapshots; an undo just drops its last entry.
+THROWS_KEY = "throws"
+# Responses smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 500
+COMPRESSIBLE_MIMETYPES = ("text/html", "text/css", "application/json", "text/javascript")
+# Board segments in dart-code order: a dart is stored as one byte holding the
+# segment's index in the high bits and the multiplier in the low two bits.
+SEGMENTS = list(range(21)) + [25]
 
 
 def get_checkout_suggestions(score, darts_left=3):
     """Returns a list of checkout suggestions for a given score and number of darts remaining."""
-    if 1 < score <= 170:
-        # Keys in the JSON-loaded dictionary are strings
-        all_suggestions = CHECKOUTS.get(str(score), [])
+    if 1 < score <= MAX_CHECKOUT:
         # Filter suggestions based on the number of darts left
-        valid_suggestions = [
-            s for s in all_suggestions if len(s.split(",")) <= darts_left
-        ]
-        return valid_suggestions
+        return [s for s, darts in CHECKOUT_TABLE[score] if darts <= darts_left]
     return []
 
 
@@ -64,6 +185,442 @@ def get_throw_string(base_score, multiplier):
     return f"{prefix}{base_score}"
 
 
+def encode_dart(base_score, multiplier):
+    """Packs a dart into a one-byte code (e.g. T20 -> 83); raises ValueError for T25, D0, ..."""
+    import archive  # Loaded on first use to keep startup light
+
+    archive.validate_dart(base_score, multiplier)
+    return SEGMENTS.index(base_score) << 2 | multiplier
+
+
+def decode_dart(code):
+    """Unpacks a dart code into (base_score, multiplier)."""
+    return SEGMENTS[code >> 2], code & 3
+
+
+def _dart_score(code):
+    """Returns the points scored by a dart code."""
+    base_score, multiplier = decode_dart(code)
+    return base_score * multiplier
+
+
+def _pack_throw(player_num, code, score_before):
+    """
+    Packs one dart of the game's throw list into an int: the dart code in the
+    low 7 bits, the player in the next 3, and the thrower's team score (or
+    Around the World target) before the dart above that.
+    """
+    return score_before << 10 | player_num << 7 | code
+
+
+def _unpack_throw(packed):
+    """Unpacks a throw list entry into (player, dart code, score before)."""
+    return (packed >> 7) & 7, packed & 127, packed >> 10
+
+
+def _log_turn(state, player_num, is_bust=False):
+    """Adds the current turn to the turn log as [player, dart codes, bust flag]."""
+    state.get("turn_log", []).insert(
+        0, [player_num, list(state["turn_scores"]), int(is_bust)]
+    )
+
+
+def _render_turn_log_entry(state, entry):
+    """Formats a compact turn log entry, e.g. 'Player 1: 60 (S20 S20 S20)'."""
+    player_num, codes, is_bust = entry
+    player_name = state.get(f"player{player_num}_name", f"Player {player_num}")
+    turn_reprs = " ".join(get_throw_string(*decode_dart(c)) for c in codes)
+    turn_total = "BUST" if is_bust else sum(_dart_score(c) for c in codes)
+    return f"{player_name}: {turn_total} ({turn_reprs})"
+
+
+def _render_state(state):
+    """
+    Builds the client view of a game state.
+    Throw strings, the turn log text and checkout suggestions are derived from
+    the compact stored state here, at render time, instead of being stored.
+    """
+    view = {k: v for k, v in state.items() if k != "history"}
+    view["can_undo"] = len(state.get("history", [])) > 1
+    if "game_mode" not in state:
+        return view
+
+    view["turn_scores"] = [
+        {"score": _dart_score(c), "repr": get_throw_string(*decode_dart(c))}
+        for c in state.get("turn_scores", [])
+    ]
+    view["turn_log"] = [
+        _render_turn_log_entry(state, entry) for entry in state.get("turn_log", [])
+    ]
+
+    view["checkout_suggestions"] = []
+    if state["game_mode"] not in ("cricket", "around_the_world") and not state.get(
+        "game_over"
+    ):
+        current_team = 1 if state["current_player"] in [1, 3] else 2
+        view["checkout_suggestions"] = get_checkout_suggestions(
+            state[f"team{current_team}_score"],
+            DARTS_PER_TURN - len(state.get("turn_scores", [])),
+        )
+    return view
+
+
+# Stored session keys are shortened; anything not listed is stored as is.
+# Bump STATE_VERSION whenever the stored layout changes, so old cookies are
+# discarded (a fresh game is started) instead of being misread.
+STATE_VERSION = 3
+_SHORT_KEYS = {
+    "game_mode": "gm",
+    "teams_mode": "tm",
+    "player1_name": "p1",
+    "player2_name": "p2",
+    "player3_name": "p3",
+    "player4_name": "p4",
+    "current_player": "cp",
+    "turn_scores": "ts",
+    "history": "h",
+    "game_over": "go",
+    "winner": "w",
+    "turn_log": "tl",
+    "cricket_marks": "cm",
+    "team1_score": "s1",
+    "team2_score": "s2",
+    "team1_target": "t1",
+    "team2_target": "t2",
+    "win_on_double": "wd",
+    "message": "m",
+    "is_bust_turn": "bt",
+    "last_seq": "ls",
+    "last_seqs": "lq",
+    "seq_mask": "sm",
+    "seq_masks": "sq",
+    "recent_keys": "rk",
+    "state_version": "sv",
+    "game_id": "id",
+    "throws": "th",
+    "tournament_match": "tx",
+    "board": "bd",
+}
+_LONG_KEYS = {v: k for k, v in _SHORT_KEYS.items()}
+
+
+def _pack_state(state, keys):
+    """Renames the top-level keys of a state (and its undo snapshots)."""
+    packed = {}
+    for k, v in state.items():
+        name = keys.get(k, k)
+        if "history" in (k, name):
+            v = [_pack_state(snapshot, keys) for snapshot in v]
+        packed[name] = v
+    return packed
+
+
+class CompactSessionSerializer:
+    """Versioned, short-key JSON form of the game state used for the cookie."""
+
+    def dumps(self, value):
+        payload = {"v": STATE_VERSION, "d": _pack_state(value, _SHORT_KEYS)}
+        return json.dumps(payload, separators=(",", ":"))
+
+    def loads(self, value):
+        payload = json.loads(value)
+        if not isinstance(payload, dict) or payload.get("v") != STATE_VERSION:
+            return {}  # Unknown layout; start a fresh game
+        return _pack_state(payload["d"], _LONG_KEYS)
+
+
+class CompactSessionInterface(SecureCookieSessionInterface):
+    serializer = CompactSessionSerializer()
+
+
+# Cookie naming the game in "memory" mode as <game key>.<state version>. The key
+# is stable across resets, so shard.py can route on it.
+GAME_COOKIE_NAME = "darts_game"
+# Game key of the game bound to a physical board (see /api/boards/<board>/bind)
+BOARD_KEY_PREFIX = "board-"
+# Games kept in memory per worker; the least recently used are dropped first
+MAX_LIVE_GAMES = 10000
+
+
+class GameStore:
+    """A worker's live games, keyed by game key, least recently used first."""
+
+    def __init__(self, capacity=MAX_LIVE_GAMES):
+        self.capacity = capacity
+        self.games = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            state = self.games.get(key)
+            if state is not None:
+                self.games.move_to_end(key)
+            return state
+
+    def put(self, key, state):
+        with self.lock:
+            self.games[key] = state
+            self.games.move_to_end(key)
+            while len(self.games) > self.capacity:
+                self.games.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.games.clear()
+
+
+game_store = GameStore()
+
+# How often each worker looks for boards changed by other workers and backends
+BOARD_OVERVIEW_REFRESH = 0.25
+# Boards whose game hasn't changed for this long are left off the overview
+BOARD_IDLE_SECONDS = 12 * 3600
+# Game state keys shown for each board on the spectator overview
+BOARD_VIEW_KEYS = (
+    "board", "game_mode", "teams_mode", "current_player", "game_over", "winner",
+    "message", "team1_score", "team2_score", "team1_target", "team2_target",
+    "cricket_marks", "state_version",
+)
+
+
+def _board_view(state):
+    """A board's game as shown on the spectator overview."""
+    view = {k: state[k] for k in BOARD_VIEW_KEYS if k in state}
+    view["players"] = [
+        state.get(f"player{n}_name") for n in range(1, 5 if state.get("teams_mode") else 3)
+    ]
+    view["turn"] = [get_throw_string(*decode_dart(c)) for c in state.get("turn_scores", [])]
+    turn_log = state.get("turn_log")
+    view["last_turn"] = _render_turn_log_entry(state, turn_log[0]) if turn_log else None
+    return view
+
+
+class BoardOverview:
+    """
+    The overview of every board's game, as polled by spectator screens. Boards
+    are read from the saved games every backend and worker writes to (see
+    livegames.py), so each serves all of them, merged with the copies in this
+    worker's memory. The overview is rebuilt only when a board's game changes
+    and kept as immutable, pre-compressed JSON, so a poll costs the same
+    however many screens are watching.
+    """
+
+    def __init__(self):
+        self.keys = set()  # Game keys of the boards changed in this worker
+        self.version = 0  # Moved on by each change in this worker
+        self.snapshot = None
+        self.built_from = None  # (version, saved boards) the snapshot was built from
+        self.checked = 0.0  # When the saved boards were last looked at
+        self.lock = threading.Lock()
+
+    def changed(self, key):
+        with self.lock:
+            self.keys.add(key)
+            self.version += 1
+
+    def _current(self):
+        return (
+            self.snapshot is not None
+            and self.built_from[0] == self.version
+            and time.monotonic() - self.checked < BOARD_OVERVIEW_REFRESH
+        )
+
+    def get(self):
+        if self._current():
+            return self.snapshot
+        with self.lock:  # One request rebuilds it; the others wait and reuse it
+            if not self._current():
+                live = _live_games()
+                saved = {}
+                if live is not None:
+                    saved = live.changed_since(BOARD_KEY_PREFIX, time.time() - BOARD_IDLE_SECONDS)
+                self.checked = time.monotonic()
+                built_from = (self.version, saved)
+                if self.snapshot is None or built_from != self.built_from:
+                    self.snapshot = self._build(live, saved)
+                    self.built_from = built_from
+            return self.snapshot
+
+    def clear(self):
+        with self.lock:
+            self.keys.clear()
+            self.version += 1
+
+    def _build(self, live, saved):
+        interface = app.session_interface
+        boards = []
+        for key in sorted(self.keys | saved.keys()):
+            state = game_store.get(key)
+            if key in saved:
+                # Another backend (or worker) may have moved the game on since
+                # this one last held it
+                stored = live.load(key)
+                stored = interface.serializer.loads(stored) if stored else None
+                if stored and (
+                    state is None
+                    or stored.get("state_version", 0) > state.get("state_version", 0)
+                ):
+                    state = stored
+            if state is None:  # Dropped from memory; it returns on its next change
+                self.keys.discard(key)
+                continue
+            if _holds_game(state):
+                boards.append(_board_view(state))
+        content = json.dumps(boards, separators=(",", ":")).encode("utf-8")
+        # Tagged by content, so every worker and backend tags the same overview alike
+        version = hashlib.sha256(content).hexdigest()[:16]
+        data = b'{"version":"%s","boards":%s}' % (version.encode(), content)
+        compress = len(data) >= COMPRESS_MIN_SIZE
+        return {
+            "version": version,
+            "etag": version,
+            "identity": data,
+            "gzip": gzip.compress(data, compresslevel=6) if compress else None,
+            "br": brotli.compress(data, quality=5) if compress and brotli is not None else None,
+        }
+
+
+board_overview = BoardOverview()
+
+
+class GameSessionInterface(CompactSessionInterface):
+    """
+    In "memory" mode, loads the game from this worker's GameStore instead of
+    decoding the cookie. The signed cookie is still written on every change,
+    so when a game arrives at a worker that doesn't hold it (a restart, or a
+    shard moving), or holds an older version of it, it carries on from the
+    cookie. A copy newer than the cookie (e.g. darts scored by /api/ingest)
+    is used as is.
+    """
+
+    def open_session(self, app, request):
+        if app.config["SESSION_STORE"] != "memory":
+            return super().open_session(app, request)
+        key, _, version = request.cookies.get(GAME_COOKIE_NAME, "").partition(".")
+        state = game_store.get(key) if key else None
+        cookie_version = int(version) if version.isdigit() else -1
+        if state is not None and state.get("state_version", 0) >= cookie_version:
+            state.modified = False
+            return state
+        session = super().open_session(app, request)
+        live = _live_games()
+        if key and not session and live is not None:
+            saved = live.load(key)  # The cookie was lost; use the last saved state
+            if saved:
+                session = self.session_class(self.serializer.loads(saved))
+        session.game_key = key or secrets.token_hex(16)
+        if key and _holds_game(session):
+            game_store.put(key, session)  # The game has moved to this worker
+        return session
+
+    def save_session(self, app, session, response):
+        super().save_session(app, session, response)
+        if app.config["SESSION_STORE"] != "memory" or not session.modified:
+            return
+        if not _holds_game(session):
+            return
+        _save_stored_game(session.game_key, session)
+        response.set_cookie(
+            GAME_COOKIE_NAME,
+            f"{session.game_key}.{session.get('state_version')}",
+            httponly=True,
+            samesite=self.get_cookie_samesite(app),
+            secure=self.get_cookie_secure(app),
+        )
+
+
+app.session_interface = GameSessionInterface()
+
+
+def _holds_game(state):
+    """
+    Whether a session holds a game, rather than nothing or only the version a
+    POST moved on (e.g. a hit posted with the cookie of a board nobody bound).
+    """
+    return "game_mode" in state
+
+
+_write_behind = {}
+
+
+def _live_games():
+    """This process's write-behind store for games in progress, or None if disabled."""
+    interval = app.config["LIVE_FLUSH_MS"]
+    if app.config["SESSION_STORE"] != "memory" or not interval:
+        return None
+    path = app.config["ARCHIVE_PATH"]
+    if path not in _write_behind:
+        import livegames  # Loaded on first use to keep startup light
+
+        _write_behind[path] = livegames.WriteBehind(path, interval / 1000)
+    return _write_behind[path]
+
+
+def _stored_game(key):
+    """Returns a game kept server-side in "memory" mode, from memory or its last save."""
+    state = game_store.get(key)
+    live = _live_games()
+    if state is None and live is not None:
+        saved = live.load(key)
+        if saved:
+            interface = app.session_interface
+            state = interface.session_class(interface.serializer.loads(saved))
+            state.game_key = key
+            game_store.put(key, state)
+    return state
+
+
+def _save_stored_game(key, state):
+    """Keeps a changed game in memory and queues it to be saved (see livegames.py)."""
+    game_store.put(key, state)
+    if key.startswith(BOARD_KEY_PREFIX):
+        board_overview.changed(key)
+    live = _live_games()
+    if live is not None:
+        live.save(
+            key,
+            app.session_interface.serializer.dumps(dict(state)),
+            finished=state.get("game_over", False),
+        )
+
+
+def recover_live_games():
+    """
+    Loads the saved games in progress into memory, e.g. when a worker starts.
+    A shard.py backend only loads the games it owns: a copy of another
+    backend's game would go stale as that backend carries on with it.
+    """
+    live = _live_games()
+    if live is None:
+        return 0
+    owned = None
+    if app.config["SHARD"]:
+        import shard  # Loaded on first use to keep startup light
+
+        ring = shard.HashRing(app.config["SHARDS"])
+
+        def owned(key):
+            return ring.node_for(key) == app.config["SHARD"]
+
+    interface = app.session_interface
+    rows = live.recover(MAX_LIVE_GAMES, owned)
+    for key, saved in reversed(rows):  # Oldest first, so the newest stay in memory
+        state = interface.serializer.loads(saved)
+        if state:
+            session = interface.session_class(state)
+            session.game_key = key
+            game_store.put(key, session)
+            if key.startswith(BOARD_KEY_PREFIX):
+                board_overview.changed(key)
+    return len(rows)
+
+
+def flush_live_games():
+    """Writes any game changes not yet saved, e.g. when a worker exits."""
+    for live in _write_behind.values():
+        live.flush()
+
+
 def _get_target_display(target):
     """Returns 'Bull' for target 25, otherwise the number."""
     if target == 25:
@@ -71,192 +628,231 @@ def _get_target_display(target):
     return str(target)
 
 
-def _start_game(game_mode="501"):
-    """Helper function to initialize or reset the game state in the session."""
-    session["game_mode"] = game_mode
-    session["teams_mode"] = session.get("teams_mode", False)
-    session["player1_name"] = session.get(
+def _start_game(state, game_mode="501"):
+    """Helper function to initialize or reset the game state."""
+    state["game_mode"] = game_mode
+    state["teams_mode"] = state.get("teams_mode", False)
+    state["player1_name"] = state.get(
         "player1_name", "Player 1"
     )  # Keep names on reset
-    session["player2_name"] = session.get("player2_name", "Player 2")
-    session["player3_name"] = session.get("player3_name", "Player 3")
-    session["player4_name"] = session.get("player4_name", "Player 4")
+    state["player2_name"] = state.get("player2_name", "Player 2")
+    state["player3_name"] = state.get("player3_name", "Player 3")
+    state["player4_name"] = state.get("player4_name", "Player 4")
 
-    session["current_player"] = 1
-    session[
+    state["current_player"] = 1
+    state[
         "turn_scores"
-    ] = []  # List to hold scores for the current turn (max 3 darts)
-    session["history"] = []  # List to store previous states for the 'undo' feature
-    session["game_over"] = False
-    session["winner"] = None
-    session["turn_log"] = []  # A log of completed turns
+    ] = []  # Dart codes for the current turn (max 3 darts), see encode_dart()
+    state["history"] = []  # List to store previous states for the 'undo' feature
+    state["game_over"] = False
+    state["winner"] = None
+    state["turn_log"] = []  # A log of completed turns, newest first
+    state["game_id"] = uuid.uuid4().hex
+    state[THROWS_KEY] = []
+    state.pop("tournament_match", None)  # Set again by /start for tournament games
 
     # Cricket specific setup
     if game_mode == "cricket":
-        session["cricket_marks"] = {
+        state["cricket_marks"] = {
             "team1": {"20": 0, "19": 0, "18": 0, "17": 0, "16": 0, "15": 0, "25": 0},
             "team2": {"20": 0, "19": 0, "18": 0, "17": 0, "16": 0, "15": 0, "25": 0},
         }
-        session["team1_score"] = 0
-        session["team2_score"] = 0
-        session["win_on_double"] = False
-        session["checkout_suggestions"] = []
-        player_name = session[f"player{session['current_player']}_name"]
-        session["message"] = f"{player_name} to throw."
-        _save_state_to_history()
+        state["team1_score"] = 0
+        state["team2_score"] = 0
+        state["win_on_double"] = False
+        player_name = state[f"player{state['current_player']}_name"]
+        state["message"] = f"{player_name} to throw."
+        _save_state_to_history(state)
         return
 
     # Determine current player name and team for message
-    player_name = session[f"player{session['current_player']}_name"]
+    player_name = state[f"player{state['current_player']}_name"]
 
     if game_mode == "around_the_world":
         # In teams mode, targets are per-team
-        session["team1_target"] = 1
-        session["team2_target"] = 1
-        session["win_on_double"] = False  # Not applicable
-        session["checkout_suggestions"] = []
-        target_display = _get_target_display(session["team1_target"])
-        session["message"] = f"{session['player1_name']} to throw for {target_display}."
+        state["team1_target"] = 1
+        state["team2_target"] = 1
+        state["win_on_double"] = False  # Not applicable
+        target_display = _get_target_display(state["team1_target"])
+        state["message"] = f"{state['player1_name']} to throw for {target_display}."
     else:  # 501, 301, etc.
         try:
             score = int(game_mode)
         except ValueError:
             score = 501  # Default to 501 if mode is invalid
-        session["team1_score"] = score
-        session["team2_score"] = score
-        session["win_on_double"] = True  # X01 games always require a double out
-        session["checkout_suggestions"] = get_checkout_suggestions(
-            session["team1_score"], 3
-        )
-        session["message"] = f"{player_name} to throw."
+        state["team1_score"] = score
+        state["team2_score"] = score
+        state["win_on_double"] = True  # X01 games always require a double out
+        state["message"] = f"{player_name} to throw."
 
     # Save the initial state for the very first 'undo'
-    _save_state_to_history()
+    _save_state_to_history(state)
 
 
-def _save_state_to_history():
-    """Helper function to save the current game state to the history list."""
-    # We create a copy of the session to avoid reference issues
-    current_state = session.copy()
-    # We don'm_t need to save the history within the history itself
-    current_state.pop("history", None)
+def _copy_state_value(value):
+    """Deep-copies the JSON-like values of a game state, without deepcopy's memo overhead."""
+    if isinstance(value, dict):
+        return {k: _copy_state_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_state_value(v) for v in value]
+    return value
 
-    history_list = session.get("history", [])
+
+def _save_state_to_history(state):
+    """Helper function to save the current game state to the history list."""
+    # A deep copy keeps later in-request mutations (e.g. a batch of throws
+    # appending to turn_scores) from leaking into the saved snapshot.
+    # Turn log entries are never changed once logged, so snapshots share them;
+    # deep-copying the whole log on every dart made a game quadratic.
+    current_state = {
+        k: _copy_state_value(v) if isinstance(v, (dict, list)) else v
+        for k, v in state.items()
+        if k not in ("history", THROWS_KEY, "turn_log") and k not in SYNC_KEYS
+    }
+    if "turn_log" in state:
+        current_state["turn_log"] = list(state["turn_log"])
+
+    history_list = state.get("history", [])
     history_list.append(current_state)
 
     # Keep history from growing too large (e.g., last 50 states)
     if len(history_list) > 50:
         history_list = history_list[-50:]
 
-    session["history"] = history_list
+    state["history"] = history_list
 
 
-def _next_player():
+def _next_player(state):
     """Helper function to switch to the next player and reset the turn."""
     # The 'is_bust_turn' flag indicates the turn was already logged by the bust logic.
     # We only log here if it's a normal, completed turn.
-    if not session.get("is_bust_turn", False):
-        if session.get("turn_scores"):  # Only log if at least one dart was thrown
-            previous_player_num = session["current_player"]
-            previous_player_name = session[f"player{previous_player_num}_name"]
-            turn_scores_data = session.get("turn_scores", [])
-            turn_reprs = " ".join(item["repr"] for item in turn_scores_data)
-            turn_total = sum(item["score"] for item in turn_scores_data)
-            session.get("turn_log", []).insert(
-                0, f"{previous_player_name}: {turn_total} ({turn_reprs})"
-            )
+    if not state.get("is_bust_turn", False):
+        if state.get("turn_scores"):  # Only log if at least one dart was thrown
+            _log_turn(state, state["current_player"])
 
     # --- Determine next player ---
-    if session.get("teams_mode"):
+    if state.get("teams_mode"):
         # Team order: 1 -> 2 -> 3 -> 4 -> 1
-        session["current_player"] = (session["current_player"] % 4) + 1
+        state["current_player"] = (state["current_player"] % 4) + 1
     else:
         # Standard 2-player order: 1 -> 2 -> 1
-        session["current_player"] = 2 if session["current_player"] == 1 else 1
+        state["current_player"] = 2 if state["current_player"] == 1 else 1
 
-    session["turn_scores"] = []
+    state["turn_scores"] = []
 
     # --- Update message and suggestions for the new player ---
-    current_player_num = session["current_player"]
-    player_name = session[f"player{current_player_num}_name"]
+    current_player_num = state["current_player"]
+    player_name = state[f"player{current_player_num}_name"]
 
     # Determine current team (Team 1 for players 1 & 3, Team 2 for players 2 & 4)
     current_team = 1 if current_player_num in [1, 3] else 2
 
-    if session["game_mode"] == "around_the_world":
+    if state["game_mode"] == "around_the_world":
         team_target_key = f"team{current_team}_target"
-        team_target = session[team_target_key]
+        team_target = state[team_target_key]
         target_display = _get_target_display(team_target)
-        if not session.get("is_bust_turn"):
-            session["message"] = f"{player_name} to throw for {target_display}."
-        session["checkout_suggestions"] = []
+        if not state.get("is_bust_turn"):
+            state["message"] = f"{player_name} to throw for {target_display}."
     else:
-        team_score_key = f"team{current_team}_score"
-        team_score = session[team_score_key]
-        session["checkout_suggestions"] = get_checkout_suggestions(team_score, 3)
-        if not session.get("is_bust_turn"):
-            session["message"] = f"{player_name} to throw."
+        if not state.get("is_bust_turn"):
+            state["message"] = f"{player_name} to throw."
 
-    session["is_bust_turn"] = (
+    state["is_bust_turn"] = (
         False  # Reset bust flag for the new turn, after all message logic
     )
 
-# --- API Endpoints ---
-
-
-@app.route("/api/state")
-def get_state():
-    """Get the current game state. Initializes a game if one isn't started."""
-    if "game_mode" not in session:
-        _start_game("501")
-    return jsonify(dict(session))
-
 
-@app.route("/api/score", methods=["POST"])
-def record_score():
+def _is_duplicate_throw(state, seq=None, key=None, client=None):
     """
-    Main endpoint to handle a thrown dart.
-    This applies the Darts 501 rules (bust, win on double).
+    Checks a throw's client sequence number or idempotency key against the
+    game's dedup windows, recording it if it is new.
+    Each sequence keeps the highest number seen and a bitmask of which of the
+    SEQ_WINDOW numbers up to it were seen (bit i for highest - i), so a throw
+    overtaken by a later one is still applied once it arrives. Numbers older
+    than the window are taken for retries. Each scorer that names itself with
+    a `client` id has its own sequence, as several may share a game. Opaque
+    keys are kept in a small bounded window.
     """
-    if session.get("game_over", False):
-        return jsonify(dict(session))
+    recent_keys = state.get("recent_keys", [])
+    if key is not None and key in recent_keys:
+        return True
+    last_seqs = state.get("last_seqs", {})
+    seq_masks = state.get("seq_masks", {})
+    if client is None:
+        # Games saved before the masks were kept treat everything seen as applied
+        last_seq, mask = state.get("last_seq", 0), state.get("seq_mask", SEQ_WINDOW_FULL)
+    else:
+        last_seq, mask = last_seqs.get(client, 0), seq_masks.get(client, SEQ_WINDOW_FULL)
+    if seq is not None:
+        if seq > last_seq:
+            shift = seq - last_seq
+            mask = (mask << shift | 1) & SEQ_WINDOW_FULL if shift < SEQ_WINDOW else 1
+            last_seq = seq
+        elif last_seq - seq >= SEQ_WINDOW or mask >> (last_seq - seq) & 1:
+            return True
+        else:
+            mask |= 1 << (last_seq - seq)
+
+    if seq is not None and client is None:
+        state["last_seq"], state["seq_mask"] = last_seq, mask
+    elif seq is not None:
+        last_seqs = {c: s for c, s in last_seqs.items() if c != client}
+        last_seqs[client] = last_seq
+        state["last_seqs"] = dict(list(last_seqs.items())[-MAX_CLIENTS:])
+        seq_masks = {**seq_masks, client: mask}
+        state["seq_masks"] = {c: seq_masks[c] for c in state["last_seqs"] if c in seq_masks}
+    if key is not None:
+        state["recent_keys"] = (recent_keys + [key])[-DEDUP_WINDOW:]
+    return False
+
+
+def _apply_throw(state, base_score, multiplier):
+    """
+    Applies a single dart to the game state.
+    This applies the Darts 501 rules (bust, win on double), as well as the
+    Cricket and Around the World rules. The state is modified in place.
+    """
+    if state.get("game_over", False):
+        return
 
-    data = request.json
-    base_score = int(data.get("base_score", 0))
-    multiplier = int(data.get("multiplier", 1))
     score = base_score * multiplier
 
     throw_repr = get_throw_string(base_score, multiplier)
-    throw_data = {"score": score, "repr": throw_repr}
-
-    # Log the game action
-    app.logger.info(f"IP: {request.remote_addr} - Score recorded: {throw_repr}")
+    throw_data = encode_dart(base_score, multiplier)
 
     # Save the current state *before* making changes, so 'undo' works
-    _save_state_to_history()
+    _save_state_to_history(state)
 
-    current_player_num = session["current_player"]
-    player_name = session[f"player{current_player_num}_name"]
+    current_player_num = state["current_player"]
+    player_name = state[f"player{current_player_num}_name"]
     current_team = 1 if current_player_num in [1, 3] else 2
 
+    # Keep every dart of the game for the archive
+    if state.get("game_mode") == "around_the_world":
+        score_before = state[f"team{current_team}_target"]
+    else:
+        score_before = state[f"team{current_team}_score"]
+    state.setdefault(THROWS_KEY, []).append(
+        _pack_throw(current_player_num, throw_data, score_before)
+    )
+
     # --- Cricket Logic ---
-    if session.get("game_mode") == "cricket":
-        cricket_numbers = [20, 19, 18, 17, 16, 15, 25]
+    if state.get("game_mode") == "cricket":
         team_key = f"team{current_team}"
         opponent_team_key = "team2" if current_team == 1 else "team1"
 
-        session["turn_scores"].append(throw_data)
+        state["turn_scores"].append(throw_data)
 
-        if base_score in cricket_numbers:
+        if base_score in CRICKET_NUMBERS:
             # Handle bullseye scoring (DB=2 hits, SB=1 hit)
             hits = 2 if base_score == 25 and multiplier == 2 else multiplier
 
             marks_key = str(base_score)
-            current_marks = session["cricket_marks"][team_key][marks_key]
+            current_marks = state["cricket_marks"][team_key][marks_key]
 
             points_scored_this_throw = 0
             opponent_is_closed = (
-                session["cricket_marks"][opponent_team_key][marks_key] >= 3
+                state["cricket_marks"][opponent_team_key][marks_key] >= 3
             )
 
             for _ in range(hits):
@@ -264,50 +860,46 @@ def record_score():
                     current_marks += 1
                 elif not opponent_is_closed:
                     # Number is owned by current team and open for opponent, so score points
-                    session[f"{team_key}_score"] += base_score
+                    state[f"{team_key}_score"] += base_score
                     points_scored_this_throw += base_score  # Also track for the message
 
             if points_scored_this_throw > 0:
-                session["message"] = f"{player_name} scored {points_scored_this_throw}!"
+                state["message"] = f"{player_name} scored {points_scored_this_throw}!"
             else:
-                session["message"] = f"{player_name} marked {throw_repr}."
-            session["cricket_marks"][team_key][marks_key] = current_marks
+                state["message"] = f"{player_name} marked {throw_repr}."
+            state["cricket_marks"][team_key][marks_key] = current_marks
 
             # Check for win condition
-            my_marks = session["cricket_marks"][team_key]
+            my_marks = state["cricket_marks"][team_key]
             all_closed = all(v >= 3 for v in my_marks.values())
 
-            if all_closed and session[f"{team_key}_score"] >= session[
+            if all_closed and state[f"{team_key}_score"] >= state[
                 f"{opponent_team_key}_score"
             ]:
-                session["game_over"] = True
-                session["winner"] = current_team
+                state["game_over"] = True
+                state["winner"] = current_team
                 team_name = f"Team {current_team}"
-                session["message"] = f"GAME SHOT! {player_name} wins Cricket for {team_name}!"
+                state["message"] = f"GAME SHOT! {player_name} wins Cricket for {team_name}!"
                 # Log the final turn
-                turn_total = sum(item["score"] for item in session["turn_scores"])
-                turn_reprs = " ".join(item["repr"] for item in session["turn_scores"])
-                session.get("turn_log", []).insert(
-                    0, f"{player_name}: {turn_total} ({turn_reprs})"
-                )
-                return jsonify(dict(session))
+                _log_turn(state, current_player_num)
+                return
 
         else:
             # Missed a cricket number
-            session["message"] = f"{player_name} threw {throw_repr} (Miss)."
+            state["message"] = f"{player_name} threw {throw_repr} (Miss)."
 
         # Check if turn is over (3 darts thrown)
-        if len(session["turn_scores"]) == 3:
-            _next_player()
+        if len(state["turn_scores"]) == DARTS_PER_TURN:
+            _next_player(state)
 
-        return jsonify(dict(session))
+        return
 
     # --- Around the World Logic ---
-    if session.get("game_mode") == "around_the_world":
+    if state.get("game_mode") == "around_the_world":
         team_target_key = f"team{current_team}_target"
-        current_target = session[team_target_key]
+        current_target = state[team_target_key]
 
-        session["turn_scores"].append(throw_data)
+        state["turn_scores"].append(throw_data)
 
         if base_score == current_target:
             # Team hit their target
@@ -316,35 +908,31 @@ def record_score():
                 next_target = 25  # Bull is next
 
             if current_target == 25:  # Hit the final bull
-                session["game_over"] = True
-                session["winner"] = current_team
-                session["message"] = f"GAME SHOT! {player_name} wins Around the World!"
-                return jsonify(dict(session))
+                state["game_over"] = True
+                state["winner"] = current_team
+                state["message"] = f"GAME SHOT! {player_name} wins Around the World!"
+                return
 
             # Advance the team's target
-            session[team_target_key] = next_target
+            state[team_target_key] = next_target
             target_display = _get_target_display(next_target)
-            session["message"] = (
+            state["message"] = (
                 f"{player_name} hit {current_target}! Now on {target_display}."
             )
         else:
             # Missed the target
             target_display = _get_target_display(current_target)
-            session["message"] = f"{player_name} needs {target_display}."
+            state["message"] = f"{player_name} needs {target_display}."
 
         # Check if turn is over (3 darts thrown)
-        if len(session["turn_scores"]) == 3:
-            _next_player()
+        if len(state["turn_scores"]) == DARTS_PER_TURN:
+            _next_player(state)
 
-        return jsonify(dict(session))
+        return
 
     # --- 501/X01 Logic ---
-    if session.get("game_mode") == "around_the_world":
-        # This block should not be reached if the above block is correct, but as a safeguard:
-        return jsonify(dict(session))
-
     team_score_key = f"team{current_team}_score"
-    current_team_score = session[team_score_key]
+    current_team_score = state[team_score_key]
     remaining_score = current_team_score - score
 
     is_bust = False
@@ -355,90 +943,395 @@ def record_score():
     elif remaining_score == 1:  # Cannot checkout from a score of 1
         is_bust = True
     elif (
-        session["win_on_double"] and remaining_score == 0 and multiplier != 2
+        state["win_on_double"] and remaining_score == 0 and multiplier != 2
     ):  # Must finish on a double
         is_bust = True  # Must finish on a double
 
     if is_bust:
         # On a bust, the player's score reverts to what it was at the start of their turn.
-        history = session.get("history", [])
+        history = state.get("history", [])
         # The state before the current turn started is the one we want.
         # Since we save state *before* each throw, the start of the turn is
         # the state right before the first dart of this turn was recorded.
-        # The number of darts thrown so far is len(session['turn_scores']).
+        # The number of darts thrown so far is len(state['turn_scores']).
         # The history list includes the current (partial) turn's states.
         # So we need to go back len(turn_scores) + 1 states in history.
-        turn_start_index = max(0, len(history) - len(session["turn_scores"]) - 1)
+        turn_start_index = max(0, len(history) - len(state["turn_scores"]) - 1)
         turn_start_state = history[turn_start_index]
 
         # Add the busting throw to the list to be logged
-        session["turn_scores"].append(throw_data)
+        state["turn_scores"].append(throw_data)
 
         # Log the bust turn immediately
-        turn_reprs = " ".join(item["repr"] for item in session["turn_scores"])
-        session.get("turn_log", []).insert(0, f"{player_name}: BUST ({turn_reprs})")
+        _log_turn(state, current_player_num, is_bust=True)
 
         # Revert score and set message
-        session[team_score_key] = turn_start_state[team_score_key]
-        session["message"] = f"{player_name} BUST! Score reset for turn."
-        session["is_bust_turn"] = (
+        state[team_score_key] = turn_start_state[team_score_key]
+        state["message"] = f"{player_name} BUST! Score reset for turn."
+        state["is_bust_turn"] = (
             True  # Flag this turn as a bust to prevent double-logging
         )
-        _next_player()
-        return jsonify(dict(session))
+        _next_player(state)
+        return
 
     # Check for a win
     is_win = remaining_score == 0 and (multiplier == 2)  # Double out is always required
     if is_win:
-        session[team_score_key] = 0
-        session["game_over"] = True
-        session["winner"] = current_team
+        state[team_score_key] = 0
+        state["game_over"] = True
+        state["winner"] = current_team
         team_name = f"Team {current_team}"
-        session["message"] = f"GAME SHOT! {player_name} wins for {team_name}!"
+        state["message"] = f"GAME SHOT! {player_name} wins for {team_name}!"
 
         # Append the final throw and log the winning turn
-        session["turn_scores"].append(throw_data)
-        turn_total = sum(item["score"] for item in session["turn_scores"])
-        turn_reprs = " ".join(item["repr"] for item in session["turn_scores"])
-        session.get("turn_log", []).insert(
-            0, f"{player_name}: {turn_total} ({turn_reprs})"
-        )
-
-        return jsonify(dict(session))
+        state["turn_scores"].append(throw_data)
+        _log_turn(state, current_player_num)
+        return
 
     # Valid score (no bust, no win)
-    session[team_score_key] = remaining_score
+    state[team_score_key] = remaining_score
 
-    session["turn_scores"].append(throw_data)
-    darts_left_for_next_throw = 3 - len(session["turn_scores"])
-    session["checkout_suggestions"] = get_checkout_suggestions(
-        remaining_score, darts_left_for_next_throw
-    )
-    session["message"] = (
+    state["turn_scores"].append(throw_data)
+    state["message"] = (
         f"{player_name} scored {score}."  # player_name is already defined
     )
 
     # Check if turn is over (3 darts thrown)
-    if len(session["turn_scores"]) == 3:
-        _next_player()
+    if len(state["turn_scores"]) == DARTS_PER_TURN:
+        _next_player(state)
+
+
+def _finish_game(state):
+    """Archives a game that just ended and reports it if it was a tournament match."""
+    _archive_game(state)
+    if state.get("tournament_match"):
+        _report_tournament_match(state)
+
+
+def _report_tournament_match(state):
+    """
+    Passes the winner of a tournament match on to its tournament, which frees
+    the board and schedules the next matches. Like archiving, failures are
+    only logged.
+    """
+    import tournament  # Loaded on first use to keep startup light
+
+    tournament_id, match_id = state.pop("tournament_match")
+    winner = state.get(f"player{state['winner']}_name")
+    try:
+        conn = tournament.connect(app.config["ARCHIVE_PATH"])
+        tournament.record_result(conn, tournament_id, match_id, winner)
+    except (tournament.TournamentError, tournament.archive.sqlite3.Error) as e:
+        app.logger.warning(f"Could not report match {match_id} of {tournament_id}: {e}")
+
+
+def _archive_game(state):
+    """
+    Writes a finished game and every dart of it to the archive, and updates
+    the players' profiles. Scoring must not depend on the archive, so failures
+    are only logged.
+    """
+    import archive  # Loaded on first use to keep startup light
+    import players
+
+    game = {
+        "id": state["game_id"],
+        "mode": state["game_mode"],
+        "teams_mode": int(bool(state.get("teams_mode"))),
+        "winner": state.get("winner"),
+        "team1_score": state.get("team1_score"),
+        "team2_score": state.get("team2_score"),
+        "finished_at": time.time(),
+        "source": "live",
+    }
+    for i in range(1, 5):
+        game[f"player{i}_name"] = state.get(f"player{i}_name")
+
+    throws = []
+    for dart, packed in enumerate(state.get(THROWS_KEY, [])):
+        player_num, code, score_before = _unpack_throw(packed)
+        base_score, multiplier = decode_dart(code)
+        throws.append(
+            {
+                "dart": dart,
+                "player": player_num,
+                "team": 1 if player_num in [1, 3] else 2,
+                "base_score": base_score,
+                "multiplier": multiplier,
+                "score_before": score_before,
+            }
+        )
+
+    try:
+        conn = players.connect(app.config["ARCHIVE_PATH"])
+        archive.record_game(conn, game, throws)
+        players.record_game(conn, game, throws)
+    except archive.sqlite3.Error as e:
+        app.logger.warning(f"Could not archive game {game['id']}: {e}")
+
+
+def _bump_state_version(state):
+    """
+    Marks the game state as changed.
+    A new session starts from a random version rather than 0, so a browser that
+    lost its cookie can't get a 304 for an ETag cached from its previous game.
+    """
+    state["state_version"] = state.get("state_version", secrets.randbits(32)) + 1
+
 
-    return jsonify(dict(session))
+def _conditional_response(build_response):
+    """
+    Returns 304 Not Modified if the client already holds the current state
+    version, otherwise builds the response. Either way it is tagged with the
+    version, so idle scoreboards can poll cheaply.
+    """
+    etag = str(session.get("state_version", 0))
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(build_response())
+    # Weak, because the same state may be sent gzip or brotli encoded
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# Switched on and off by /admin/profiler; see profiler.py
+_profilers = {}
+
+
+def _request_profiler():
+    """
+    This process's profiler, or None while the admin routes are disabled. It
+    follows the profile shared through the archive database, so a profile
+    started through any worker runs in all of them.
+    """
+    if not app.config["ADMIN_TOKEN"]:
+        return None
+    path = app.config["ARCHIVE_PATH"]
+    if path not in _profilers:
+        _profilers[path] = profiler.Profiler(path)
+    return _profilers[path]
+
+
+@app.before_request
+def _profile_request():
+    """Lets the profiler choose this request, when it is switched on."""
+    request_profiler = _request_profiler()
+    if request_profiler is None:
+        return
+    request_profiler.poll()
+    if request_profiler.enabled and not request.path.startswith("/admin/"):
+        request_profiler.begin(request.endpoint or "unknown")
+
+
+@app.teardown_request
+def _end_request_profile(exc):
+    request_profiler = _request_profiler()
+    if request_profiler is not None:
+        request_profiler.end()
+
+
+@app.before_request
+def _track_state_changes():
+    """Any POST to the game API may change the game, so it moves the state version on."""
+    if request.method == "POST" and not request.path.startswith("/admin/"):
+        _bump_state_version(session)
+
+
+@app.after_request
+def _compress_response(response):
+    """Compresses larger text responses with brotli or gzip, if the client accepts it."""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    if brotli is not None and request.accept_encodings["br"]:
+        response.set_data(brotli.compress(data))
+        response.headers["Content-Encoding"] = "br"
+    elif request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+# --- API Endpoints ---
+
+
+@app.route("/api/state")
+def get_state():
+    """Get the current game state. Initializes a game if one isn't started."""
+    if "game_mode" not in session:
+        _start_game(session, "501")
+        _bump_state_version(session)
+    return _conditional_response(lambda: jsonify(_render_state(session)))
+
+
+@app.route("/api/rules")
+def get_rules():
+    """Exports the rule tables the client needs to score throws while offline."""
+    return jsonify(
+        {
+            "valid_modes": VALID_MODES,
+            "cricket_numbers": CRICKET_NUMBERS,
+            "darts_per_turn": DARTS_PER_TURN,
+            "max_batch_size": MAX_BATCH_SIZE,
+            "checkouts": CHECKOUTS,
+        }
+    )
+
+
+def _client_id(data):
+    """Returns the scorer id a throw request names, or None; raises ValueError if invalid."""
+    client = data.get("client") if isinstance(data, dict) else None
+    if client is not None and (
+        not isinstance(client, str) or not 0 < len(client) <= MAX_CLIENT_ID_LENGTH
+    ):
+        raise ValueError("Invalid client id.")
+    return client
+
+
+def _idempotency_key():
+    """Returns the request's Idempotency-Key header, or None; raises ValueError if invalid."""
+    key = request.headers.get("Idempotency-Key")
+    if key is not None and not 0 < len(key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters.")
+    return key
+
+
+@app.route("/api/score", methods=["POST"])
+def record_score():
+    """
+    Main endpoint to handle a thrown dart.
+    This applies the Darts 501 rules (bust, win on double).
+    A throw may carry a 'seq' number (per 'client', if it names one) or an
+    Idempotency-Key header; a retried request with the same value is absorbed
+    without re-applying it.
+    """
+    if session.get("game_over", False):
+        return jsonify(_render_state(session))
+
+    data = request.json
+    base_score = int(data.get("base_score", 0))
+    multiplier = int(data.get("multiplier", 1))
+    try:
+        encode_dart(base_score, multiplier)
+    except ValueError:
+        return jsonify({"error": "Invalid dart."}), 400
+    seq = data.get("seq")
+    try:
+        seq = int(seq) if seq is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "seq must be an integer."}), 400
+    if seq is not None and seq < 1:
+        return jsonify({"error": "Sequence numbers start at 1."}), 400
+    try:
+        client = _client_id(data)
+        key = _idempotency_key()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if _is_duplicate_throw(session, seq, key, client):
+        app.logger.info(f"IP: {request.remote_addr} - Duplicate throw ignored")
+        return jsonify(_render_state(session))
+
+    # Log the game action
+    throw_repr = get_throw_string(base_score, multiplier)
+    app.logger.info(f"IP: {request.remote_addr} - Score recorded: {throw_repr}")
+
+    _apply_throw(session, base_score, multiplier)
+    if session["game_over"]:
+        _finish_game(session)
+    return jsonify(_render_state(session))
+
+
+@app.route("/api/score/batch", methods=["POST"])
+def record_score_batch():
+    """
+    Reconciles throws queued by an offline client.
+    Each throw carries a client sequence number. Sequence numbers already
+    applied are skipped, so a batch can be resent safely after a dropped
+    response. Scorers sharing a game send their own
+    'client' id, so each is tracked separately (see last_seqs).
+    """
+    if "game_mode" not in session:
+        _start_game(session, "501")
+
+    data = request.get_json(silent=True)
+    throws = data.get("throws", []) if isinstance(data, dict) else None
+    if not isinstance(throws, list) or len(throws) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Expected at most {MAX_BATCH_SIZE} throws."}), 400
+    try:
+        client = _client_id(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    darts = []
+    for throw in throws:
+        # A throw without a sequence number could never be told apart from a retry
+        try:
+            seq = int(throw["seq"])
+            base_score = int(throw.get("base_score", 0))
+            multiplier = int(throw.get("multiplier", 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return jsonify({"error": "Each throw needs a seq, base_score and multiplier."}), 400
+        if seq < 1:
+            return jsonify({"error": "Sequence numbers start at 1."}), 400
+        try:
+            encode_dart(base_score, multiplier)
+        except ValueError:
+            return jsonify({"error": "Invalid dart."}), 400
+        darts.append((seq, base_score, multiplier))
+
+    was_over = session.get("game_over", False)
+    applied = 0
+    for seq, base_score, multiplier in sorted(darts):
+        if _is_duplicate_throw(session, seq, client=client):
+            continue  # Already applied by an earlier (retried) batch
+        # Throws after the game ended are acknowledged but have no effect
+        _apply_throw(session, base_score, multiplier)
+        applied += 1
+    if session["game_over"] and not was_over:
+        _finish_game(session)
+
+    if client is None:
+        session["last_seq"] = session.get("last_seq", 0)
+        last_seq = session["last_seq"]
+    else:
+        last_seq = session.get("last_seqs", {}).get(client, 0)
+    app.logger.info(
+        f"IP: {request.remote_addr} - Synced {applied} queued throw(s) up to seq {last_seq}"
+    )
+    return jsonify(_render_state(session))
 
 
 @app.route("/api/undo", methods=["POST"])
 def undo_score():
     """Reverts the game state to the previous state from history."""
     if session.get("game_over", False):
-        return jsonify(dict(session))
+        return jsonify(_render_state(session))
 
     history = session.get("history", [])
     if len(history) > 1:
-        # Create a new history list that is one step shorter
+        # The last snapshot was taken just before the last throw, so restoring
+        # it reverts exactly that throw
         new_history = history[:-1]
-        last_state = new_history[-1]  # The new last state
-        # Update the session with the values from the last state
+        last_state = history[-1]
+        # Update the session with the values from the last state.
+        # The sync position is not part of the game, so undo keeps it.
+        sync_state = {k: session[k] for k in SYNC_KEYS if k in session}
+        throws = session.get(THROWS_KEY, [])[:-1]
         session.clear()
         session.update(last_state)
+        session.update(sync_state)
+        session[THROWS_KEY] = throws
         # The history list also needs to be part of the reverted state
         session["history"] = new_history
         session["message"] = "Undo successful. Last throw reverted."
@@ -446,24 +1339,26 @@ def undo_score():
         # This is the initial state, can't undo past it
         session["message"] = "Cannot undo further."
 
-    return jsonify(dict(session))
+    return jsonify(_render_state(session))
 
 
 @app.route("/api/reset", methods=["POST"])
 def reset_game():
     """Resets the game to a new mode (501, 401, etc.)."""
     game_mode = str(request.json.get("mode", "501"))
-    valid_modes = ["101", "201", "301", "401", "501", "around_the_world", "cricket"]
-    if game_mode not in valid_modes:
+    if game_mode not in VALID_MODES:
         game_mode = "501"  # Default to 501 if an invalid mode is passed
     app.logger.info(f"IP: {request.remote_addr} - New game started: {game_mode}")
-    _start_game(game_mode)
-    return jsonify(dict(session))
+    _start_game(session, game_mode)
+    return jsonify(_render_state(session))
 
 
 @app.route("/api/names", methods=["POST"])
 def update_names():
     """Updates the player names in the session."""
+    if session.get("tournament_match"):
+        # The winner is reported to the tournament by name
+        return jsonify({"error": "Names can't be changed during a tournament match."}), 409
     data = request.json
     name_map = {}
     new_names = {}
@@ -480,19 +1375,10 @@ def update_names():
 
         new_names[player_key] = new_name
 
-    # Update names in the current session
+    # Update names in the current session. The turn log refers to players by
+    # number, so it picks up the new names when it is rendered.
     session.update(new_names)
 
-    # Update names in the turn log and history if there were changes
-    if name_map:
-        # Update turn log
-        new_turn_log = []
-        for log_item in session.get("turn_log", []):
-            for old, new in name_map.items():
-                log_item = log_item.replace(f"{old}:", f"{new}:")
-            new_turn_log.append(log_item)
-        session["turn_log"] = new_turn_log
-
     # Refresh the message bar with the potentially new name
     # This is a trick to regenerate the message without changing the player
     session["message"] = (
@@ -501,7 +1387,7 @@ def update_names():
         else session["message"]
     )
 
-    return jsonify(dict(session))
+    return jsonify(_render_state(session))
 
 
 @app.route("/api/settings", methods=["POST"])
@@ -513,8 +1399,8 @@ def update_settings():
         # When toggling teams, always reset the current player to 1
         session["current_player"] = 1
     # Reset the game with the new setting
-    _start_game(session.get("game_mode", "501"))
-    return jsonify(dict(session))
+    _start_game(session, session.get("game_mode", "501"))
+    return jsonify(_render_state(session))
 
 
 @app.route("/api/stats")
@@ -522,65 +1408,489 @@ def get_stats():
     """Calculates and returns game statistics from the turn log."""
     if "turn_log" not in session:
         return jsonify({"error": "No game data available."}), 404
+    return _conditional_response(lambda: jsonify(_calculate_stats(session)))
 
+
+def _calculate_stats(state):
+    """Totals score and darts thrown per active player from the turn log."""
     stats = {}
-    player_names = []
-    if session.get("teams_mode"):
-        player_names = [session.get(f"player{i}_name") for i in range(1, 5)]
-    else:
-        player_names = [session.get(f"player{i}_name") for i in range(1, 3)]
+    player_count = 4 if state.get("teams_mode") else 2
+    player_names = {
+        i: state.get(f"player{i}_name") for i in range(1, player_count + 1)
+    }
 
     # Initialize stats dictionary for active players
-    for name in player_names:
+    for name in player_names.values():
         if name:  # Ensure name is not None
             stats[name] = {"total_score": 0, "darts_thrown": 0, "average": 0.0}
 
-    for log_item in session["turn_log"]:
-        try:
-            player_name, rest = log_item.split(":", 1)
-            player_name = player_name.strip()
-
-            if player_name not in stats:
-                continue
-
-            score_part, throws_part = rest.split("(", 1)
-            score_part = score_part.strip()
-
-            # Count darts thrown in the turn
-            throws = throws_part.replace(")", "").strip().split()
-            stats[player_name]["darts_thrown"] += len(throws)
+    for player_num, codes, is_bust in state["turn_log"]:
+        player_name = player_names.get(player_num)
+        if player_name not in stats:
+            continue
 
-            # Add score (0 for a bust)
-            if score_part.upper() != "BUST":
-                stats[player_name]["total_score"] += int(score_part)
-        except (ValueError, IndexError):
-            continue  # Skip malformed log entries
+        stats[player_name]["darts_thrown"] += len(codes)
+        # Add score (0 for a bust)
+        if not is_bust:
+            stats[player_name]["total_score"] += sum(_dart_score(c) for c in codes)
 
     for name, player_stats in stats.items():
         if player_stats["darts_thrown"] > 0:
             player_stats["average"] = (
                 player_stats["total_score"] / player_stats["darts_thrown"]
             ) * 3
-    return jsonify(stats)
+    return stats
 
 
-# --- Frontend (HTML/CSS/JS) ---
+@app.route("/api/export.ndjson")
+def export_throws():
+    """Streams every archived throw as NDJSON, one JSON object per line."""
+    import archive  # Loaded on first use to keep startup light
+
+    path = app.config["ARCHIVE_PATH"]
+
+    def generate():
+        for throw in archive.iter_throws(archive.connect(path)):
+            yield json.dumps(throw, separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+# Hits ingested per board are debounced by these, keyed by board name
+_hit_filters = {}
 
 
-def load_template():
-    """Load the HTML template from file."""
+@app.route("/api/boards/<board>/bind", methods=["POST"])
+def bind_board(board):
+    """
+    Makes this browser's game the game of a physical board, so that hits
+    ingested for the board are scored into it. Browsers bound to the same
+    board share its game. Needs the "memory" session store.
+    """
+    if app.config["SESSION_STORE"] != "memory":
+        return jsonify({"error": "Binding a board needs DARTS_SESSION_STORE=memory."}), 409
+    key = BOARD_KEY_PREFIX + board
+    existing = _stored_game(key)
+    if existing is not None and existing is not session._get_current_object():
+        session.clear()
+        session.update(existing)
+    elif "game_mode" not in session:
+        _start_game(session)
+    session["board"] = board
+    session.game_key = key
+    session.modified = True
+    app.logger.info(f"IP: {request.remote_addr} - Bound to board {board}")
+    return jsonify(_render_state(session))
+
+
+@app.route("/api/ingest", methods=["POST"])
+def ingest_hits():
+    """
+    Scores a batch of raw hit events from auto-scoring boards (see ingest.py
+    for the event format) into the games bound to those boards. Returns how
+    many were scored or dropped, and the new state of each board's game.
+    """
+    import ingest  # Loaded on first use to keep startup light
+
+    data = request.get_json(silent=True)
+    events = data.get("events") if isinstance(data, dict) else data
+    if not isinstance(events, list) or len(events) > ingest.MAX_INGEST_BATCH:
+        return jsonify({"error": "Expected a list of hit events."}), 400
+
+    accepted = 0
+    rejected = {"invalid": 0, "unbound": 0, "debounced": 0, "game_over": 0}
+    changed = {}
+    for event in events:
+        try:
+            board = str(event["board"])
+            base_score, multiplier = ingest.parse_event(event)
+            t = float(event["t"])
+            event_id = int(event["id"]) if event.get("id") is not None else None
+        except (KeyError, TypeError, ValueError, AttributeError):
+            rejected["invalid"] += 1
+            continue
+        key = BOARD_KEY_PREFIX + board
+        state = changed.get(key) or _stored_game(key)
+        if state is None or not _holds_game(state):
+            rejected["unbound"] += 1
+            continue
+        if not _hit_filters.setdefault(board, ingest.HitFilter()).accept(t, event_id):
+            rejected["debounced"] += 1
+            continue
+        if state.get("game_over"):
+            rejected["game_over"] += 1
+            continue
+
+        if key not in changed:
+            _bump_state_version(state)
+            changed[key] = state
+        _apply_throw(state, base_score, multiplier)
+        if state["game_over"]:
+            _finish_game(state)
+        accepted += 1
+
+    current = session._get_current_object()
+    for key, state in changed.items():
+        if state is not current:  # save_session saves the request's own game
+            _save_stored_game(key, state)
+    if accepted:
+        app.logger.info(
+            f"IP: {request.remote_addr} - Ingested {accepted} hit(s) on {len(changed)} board(s)"
+        )
+    return jsonify(
+        {
+            "accepted": accepted,
+            "rejected": rejected,
+            "boards": {s["board"]: _render_state(s) for s in changed.values()},
+        }
+    )
+
+
+@app.route("/api/boards")
+def get_boards():
+    """
+    Returns every board's game for spectator screens. All viewers share one
+    snapshot, and one that is still current gets a 304.
+    """
+    snapshot = board_overview.get()
+    if request.if_none_match.contains_weak(snapshot["etag"]):
+        response = app.response_class(status=304)
+    else:
+        response = _precompressed_response(snapshot, "application/json")
+    response.set_etag(snapshot["etag"], weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/api/tournaments", methods=["GET", "POST"])
+def tournaments():
+    """
+    Lists tournaments, or creates one from a JSON body with name, format
+    (knockout or round_robin), players in seed order, boards and mode.
+    """
+    import tournament  # Loaded on first use to keep startup light
+
+    conn = tournament.connect(app.config["ARCHIVE_PATH"])
+    if request.method == "GET":
+        return jsonify(tournament.list_tournaments(conn))
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object."}), 400
+    kind = data.get("format", "knockout")
+    mode = data.get("mode", "501")
+    if kind not in tournament.FORMATS or mode not in VALID_MODES:
+        return jsonify({"error": "Invalid tournament format or game mode."}), 400
+    players, boards = data.get("players", []), data.get("boards", ["Board 1"])
+    for names in (players, boards):
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            return jsonify({"error": "players and boards must be lists of names."}), 400
+    players = [p.strip() for p in players if p.strip()]
+    boards = [b.strip() for b in boards if b.strip()]
+    name = data.get("name") or "Tournament"
+    if not isinstance(name, str):
+        return jsonify({"error": "name must be a string."}), 400
+    create = (
+        tournament.create_knockout if kind == "knockout" else tournament.create_round_robin
+    )
     try:
-        with open("templates/index.html") as f:
-            return f.read()
-    except FileNotFoundError:
-        return "<h1>Error: index.html not found in templates directory.</h1>"
+        t = create(name, players, boards, mode)
+    except tournament.TournamentError as e:
+        return jsonify({"error": str(e)}), 400
+    tournament.save(conn, t)
+    app.logger.info(f"IP: {request.remote_addr} - Tournament created: {t['name']}")
+    return jsonify(tournament.view(t)), 201
+
+
+@app.route("/api/tournaments/<tournament_id>")
+def get_tournament(tournament_id):
+    """Returns a tournament's matches, boards and (for round robins) standings."""
+    import tournament  # Loaded on first use to keep startup light
+
+    t = tournament.load(tournament.connect(app.config["ARCHIVE_PATH"]), tournament_id)
+    if t is None:
+        return jsonify({"error": "No such tournament."}), 404
+    return jsonify(tournament.view(t))
+
+
+@app.route("/api/tournaments/<tournament_id>/matches/<int:match_id>/start", methods=["POST"])
+def start_tournament_match(tournament_id, match_id):
+    """
+    Starts a match that has been put on a board as this board's game. When
+    the game ends, its winner is reported to the tournament.
+    """
+    import tournament  # Loaded on first use to keep startup light
+
+    conn = tournament.connect(app.config["ARCHIVE_PATH"])
+    t = tournament.load(conn, tournament_id, lazy=True)
+    if t is None or not 0 <= match_id < len(t["matches"]):
+        return jsonify({"error": "No such match."}), 404
+    match = t["matches"][match_id]
+    if match["status"] != "playing":
+        return jsonify({"error": "This match is not on a board."}), 409
+
+    session["teams_mode"] = False
+    session["player1_name"], session["player2_name"] = match["players"]
+    _start_game(session, t["mode"])
+    session["tournament_match"] = [tournament_id, match_id]
+    app.logger.info(
+        f"IP: {request.remote_addr} - Tournament match started: "
+        f"{' vs '.join(match['players'])} on {match['board']}"
+    )
+    return jsonify(_render_state(session))
+
+
+@app.route("/api/tournaments/<tournament_id>/matches/<int:match_id>/result", methods=["POST"])
+def report_tournament_result(tournament_id, match_id):
+    """Records a match result by hand, e.g. a walkover or a leg scored elsewhere."""
+    import tournament  # Loaded on first use to keep startup light
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("winner"), str):
+        return jsonify({"error": "Expected a JSON object naming the winner."}), 400
+    winner = data["winner"]
+    conn = tournament.connect(app.config["ARCHIVE_PATH"])
+    try:
+        t = tournament.record_result(conn, tournament_id, match_id, winner)
+    except tournament.TournamentError as e:
+        return jsonify({"error": str(e)}), 400
+    if t is None:
+        return jsonify({"error": "No such tournament."}), 404
+    return jsonify(tournament.view(tournament.load(conn, tournament_id)))
+
+
+@app.route("/api/analytics")
+def get_analytics():
+    """
+    Per-dart analytics over every archived game: a summary of all players, or
+    with ?player=<name> that player's segment heatmap, treble 20 rate and
+    success on each finishing double.
+    """
+    import analytics  # Loaded on first use to keep startup light
+
+    store = analytics.get_store(app.config["ARCHIVE_PATH"])
+    player = request.args.get("player")
+    if player is None:
+        return jsonify({"players": analytics.player_summary(store)})
+    if player not in store.player_ids:
+        return jsonify({"error": f"No archived darts for {player}."}), 404
+    return jsonify(analytics.player_report(store, player))
+
+
+@app.route("/api/players")
+def list_players():
+    """Lists player profiles, optionally only names starting with ?q=."""
+    import players  # Loaded on first use to keep startup light
+
+    conn = players.connect(app.config["ARCHIVE_PATH"])
+    return jsonify(players.list_players(conn, request.args.get("q", "")))
+
+
+@app.route("/api/players/<name>")
+def get_player(name):
+    """Returns one player's profile and their most recent games."""
+    import players  # Loaded on first use to keep startup light
+
+    profile = players.get_profile(players.connect(app.config["ARCHIVE_PATH"]), name)
+    if profile is None:
+        return jsonify({"error": f"No player named {name}."}), 404
+    return jsonify(profile)
+
+
+@app.route("/api/leaderboard")
+def get_leaderboard():
+    """
+    Returns the top players by rating, average, checkout or win_rate
+    (?by=, default rating), at most ?limit= of them, with at least ?min_games=.
+    """
+    import players  # Loaded on first use to keep startup light
+
+    by = request.args.get("by", "rating")
+    if by not in players.LEADERBOARDS:
+        return jsonify({"error": f"Unknown leaderboard: {by}."}), 400
+    limit = max(1, min(request.args.get("limit", 10, type=int), 100))
+    min_games = request.args.get("min_games", 1, type=int)
+    conn = players.connect(app.config["ARCHIVE_PATH"])
+    return jsonify({"by": by, "players": players.leaderboard(conn, by, limit, min_games)})
+
+
+# --- Admin ---
+
+
+def _admin_denied():
+    """Returns an error response unless the request carries the admin token."""
+    token = app.config.get("ADMIN_TOKEN")
+    if not token:
+        return jsonify({"error": "Admin routes are disabled; set DARTS_ADMIN_TOKEN."}), 404
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not secrets.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({"error": "Invalid admin token."}), 403
+    return None
+
+
+@app.route("/admin/profiler", methods=["GET", "POST", "DELETE"])
+def admin_profiler():
+    """
+    Shows the profiler's status, starts a profile (POST with every, endpoint,
+    seconds and interval_ms, all optional) or stops it (DELETE), in every
+    worker. The status sums the counts of all workers, lists each by pid under
+    "workers" and gives the pid of the one that answered.
+    """
+    denied = _admin_denied()
+    if denied:
+        return denied
+    request_profiler = _request_profiler()
+
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        endpoint = data.get("endpoint")
+        try:
+            every = int(data.get("every", 1))
+            seconds = float(data.get("seconds", profiler.DEFAULT_SECONDS))
+            interval_ms = float(data.get("interval_ms", profiler.DEFAULT_INTERVAL * 1000))
+            # NaN passes every comparison below and would keep a profile running forever
+            if not (math.isfinite(seconds) and math.isfinite(interval_ms)):
+                raise ValueError
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({"error": "every, seconds and interval_ms must be numbers."}), 400
+        if endpoint is not None and endpoint not in app.view_functions:
+            return jsonify({"error": f"Unknown endpoint: {endpoint}."}), 400
+        if every < 1 or seconds <= 0 or not 1 <= interval_ms <= 1000:
+            error = "Expected every >= 1, seconds > 0 and interval_ms from 1 to 1000."
+            return jsonify({"error": error}), 400
+        request_profiler.start(every, endpoint, seconds, interval_ms / 1000)
+        app.logger.info(f"IP: {request.remote_addr} - Profiler started")
+    elif request.method == "DELETE":
+        request_profiler.stop()
+    return jsonify(request_profiler.status())
+
+
+@app.route("/admin/profiler/stacks")
+def admin_profiler_stacks():
+    """
+    Returns the stacks sampled so far in folded format, for flamegraph.pl or
+    speedscope, optionally for one ?endpoint= only. The stacks of every worker
+    are merged.
+    """
+    denied = _admin_denied()
+    if denied:
+        return denied
+    request_profiler = _request_profiler()
+    return Response(
+        request_profiler.folded(request.args.get("endpoint")), mimetype="text/plain"
+    )
+
+
+# --- Frontend (HTML/CSS/JS) ---
+
+
+# CSS and JavaScript are read once, lightly minified, fingerprinted with a hash
+# of their content and pre-compressed. A fingerprinted URL never changes
+# content, so browsers can cache it for a year and never revalidate it.
+STATIC_DIR = os.path.join(app.root_path, "static")
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_MIMETYPES = {".css": "text/css", ".js": "text/javascript"}
+_assets = {}  # Source filename -> asset
+_assets_by_url = {}  # Fingerprinted filename -> asset
+
+
+def _minify_css(text):
+    """Strips comments and collapses whitespace."""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    return re.sub(r"\s*([{};,])\s*", r"\1", text).strip()
+
+
+def _minify_js(text):
+    """Strips indentation, blank lines and whole-line comments."""
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+def _load_assets():
+    """Builds the fingerprinted, pre-compressed copies of the static files."""
+    assets = {}
+    for filename in sorted(os.listdir(STATIC_DIR)):
+        stem, ext = os.path.splitext(filename)
+        if ext not in ASSET_MIMETYPES:
+            continue
+        with open(os.path.join(STATIC_DIR, filename), encoding="utf-8") as f:
+            text = f.read()
+        minify = _minify_css if ext == ".css" else _minify_js
+        data = minify(text).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        assets[filename] = {
+            "filename": f"{stem}.{digest}{ext}",
+            "mimetype": ASSET_MIMETYPES[ext],
+            "identity": data,
+            "gzip": gzip.compress(data, compresslevel=9),
+            "br": brotli.compress(data) if brotli is not None else None,
+        }
+    _assets.clear()
+    _assets.update(assets)
+    _assets_by_url.clear()
+    _assets_by_url.update({a["filename"]: a for a in assets.values()})
+
+
+_load_assets()
+
+
+@app.template_global()
+def asset_url(filename):
+    """Returns the fingerprinted URL of a static file, e.g. /assets/app.1a2b3c4d5e6f.js"""
+    if app.debug or filename not in _assets:
+        _load_assets()  # Pick up edits while developing
+    return f"/assets/{_assets[filename]['filename']}"
+
+
+def _precompressed_response(variants, mimetype):
+    """Responds with the best encoding the client accepts of pre-compressed content."""
+    body, encoding = variants["identity"], None
+    if variants["br"] is not None and request.accept_encodings["br"]:
+        body, encoding = variants["br"], "br"
+    elif variants["gzip"] is not None and request.accept_encodings["gzip"]:
+        body, encoding = variants["gzip"], "gzip"
+
+    response = app.response_class(body, mimetype=mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.route("/assets/<filename>")
+def serve_asset(filename):
+    """Serves a fingerprinted static file with long-lived, immutable caching."""
+    asset = _assets_by_url.get(filename)
+    if asset is None:
+        abort(404)
+
+    response = _precompressed_response(asset, asset["mimetype"])
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return response
 
 
 @app.route("/")
 def index():
     """Serve the main HTML page."""
     app.logger.info(f"IP: {request.remote_addr} - Connection established.")
-    return render_template_string(load_template())
+    try:
+        response = app.make_response(render_template("index.html"))
+    except TemplateNotFound:
+        return "<h1>Error: index.html not found in templates directory.</h1>"
+    # The page is a small shell; revalidate it each time so new asset URLs are picked up
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag(weak=True)
+    return response.make_conditional(request)
+
+
+@app.route("/spectate")
+def spectate():
+    """Serve the read-only overview of every board, for TVs and spectators."""
+    response = app.make_response(render_template("spectate.html"))
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag(weak=True)
+    return response.make_conditional(request)
 
 
 # --- Run the App ---
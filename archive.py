@@ -0,0 +1,316 @@
+"""
+SQLite archive of finished games, one row per dart.
+
+Games are archived by app.py when they finish. This module also streams every
+archived throw out as NDJSON and bulk-imports NDJSON exports (our own, or
+another scorer's) in batched transactions with bounded memory:
+
+    python archive.py export > throws.ndjson
+    python archive.py import other-scorer.ndjson [--batch-size 20000]
+
+The database path defaults to darts.db next to app.py; set DARTS_DB to change it.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get(
+    "DARTS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "darts.db")
+)
+IMPORT_BATCH_SIZE = 10000
+SEGMENTS = (*range(21), 25)  # The numbers a dart can score, 0 being a miss
+MAX_PLAYERS = 4
+# A finish is possible on a double from 40 or less, or on the bull from 50
+MAX_DOUBLE_FINISH = 40
+BULL_FINISH = 50
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS games (
+        id TEXT PRIMARY KEY,
+        mode TEXT NOT NULL,
+        teams_mode INTEGER NOT NULL DEFAULT 0,
+        player1_name TEXT,
+        player2_name TEXT,
+        player3_name TEXT,
+        player4_name TEXT,
+        winner INTEGER,
+        team1_score INTEGER,
+        team2_score INTEGER,
+        finished_at REAL,
+        source TEXT NOT NULL DEFAULT 'live'
+    )""",
+    """CREATE TABLE IF NOT EXISTS throws (
+        game_id TEXT NOT NULL,
+        dart INTEGER NOT NULL,
+        player INTEGER NOT NULL,
+        team INTEGER NOT NULL,
+        base_score INTEGER NOT NULL,
+        multiplier INTEGER NOT NULL,
+        score_before INTEGER,
+        PRIMARY KEY (game_id, dart)
+    ) WITHOUT ROWID""",
+    # One row per write of a game or its throws, in order, so readers that keep
+    # a copy (analytics.py) can tell which games changed since they last looked
+    """CREATE TABLE IF NOT EXISTS game_changes (
+        seq INTEGER PRIMARY KEY,
+        game_id TEXT NOT NULL
+    )""",
+]
+
+GAME_COLUMNS = [
+    "id", "mode", "teams_mode", "player1_name", "player2_name", "player3_name",
+    "player4_name", "winner", "team1_score", "team2_score", "finished_at", "source",
+]
+THROW_COLUMNS = [
+    "game_id", "dart", "player", "team", "base_score", "multiplier", "score_before",
+]
+
+_local = threading.local()
+
+
+def connect(path=DEFAULT_PATH, schema=()):
+    """
+    Returns this thread's connection to the archive, creating the schema if
+    needed. Modules keeping their own tables in the archive database pass
+    their CREATE statements as `schema`; each list is run once per thread.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+        _local.ready = set()
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        connections[path] = conn
+    if schema and (path, tuple(schema)) not in _local.ready:
+        with conn:
+            for statement in schema:
+                conn.execute(statement)
+        _local.ready.add((path, tuple(schema)))
+    return conn
+
+
+def checkout_double(score):
+    """The segment of the double that finishes from `score` (25 for the bull), or None."""
+    if score == BULL_FINISH:
+        return 25
+    if 1 < score <= MAX_DOUBLE_FINISH and score % 2 == 0:
+        return score // 2
+    return None
+
+
+def record_game(conn, game, throws):
+    """
+    Stores a finished game and its throws in one transaction.
+    `game` maps GAME_COLUMNS to values; each throw maps THROW_COLUMNS (without
+    game_id) to values.
+    """
+    with conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO games ({', '.join(GAME_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(GAME_COLUMNS))})",
+            [game.get(c) for c in GAME_COLUMNS],
+        )
+        conn.executemany(
+            f"INSERT OR REPLACE INTO throws ({', '.join(THROW_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(THROW_COLUMNS))})",
+            [[game["id"]] + [t.get(c) for c in THROW_COLUMNS[1:]] for t in throws],
+        )
+        conn.execute("INSERT INTO game_changes (game_id) VALUES (?)", (game["id"],))
+
+
+def iter_throws(conn):
+    """Yields every archived throw joined with its game, ordered by game and dart."""
+    cursor = conn.execute(
+        """SELECT t.game_id, g.mode, g.teams_mode, g.winner, g.finished_at,
+                  t.dart, t.player, t.team, t.base_score, t.multiplier, t.score_before,
+                  CASE t.player WHEN 1 THEN g.player1_name WHEN 2 THEN g.player2_name
+                                WHEN 3 THEN g.player3_name ELSE g.player4_name END
+           FROM throws t JOIN games g ON g.id = t.game_id
+           ORDER BY t.game_id, t.dart"""
+    )
+    keys = [
+        "game_id", "mode", "teams_mode", "winner", "finished_at", "dart", "player",
+        "team", "base_score", "multiplier", "score_before", "player_name",
+    ]
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(keys, row))
+
+
+def export_ndjson(conn, out):
+    """Streams every archived throw to `out` as one JSON object per line."""
+    count = 0
+    for throw in iter_throws(conn):
+        out.write(json.dumps(throw, separators=(",", ":")) + "\n")
+        count += 1
+    return count
+
+
+def validate_dart(base_score, multiplier):
+    """Raises ValueError unless the dart is one a board can score (no T25, D0, ...)."""
+    if base_score not in SEGMENTS or multiplier not in (1, 2, 3):
+        raise ValueError(f"Invalid dart: {base_score} x {multiplier}")
+    if (base_score == 25 and multiplier == 3) or (base_score == 0 and multiplier != 1):
+        raise ValueError(f"Invalid dart: {base_score} x {multiplier}")
+
+
+def parse_throw_string(text):
+    """Parses a throw written as T20, D16, S5, 20, SB, DB, Bull or MISS."""
+    text = text.strip().upper()
+    if not text:
+        raise ValueError("Empty throw")
+    if text in ("MISS", "M", "0"):
+        return 0, 1
+    if text in ("SB", "25", "OUTER BULL"):
+        return 25, 1
+    if text in ("DB", "BULL", "50", "D25"):
+        return 25, 2
+    multiplier = {"S": 1, "D": 2, "T": 3}.get(text[0])
+    base_score = int(text[1:] if multiplier else text)
+    if not 1 <= base_score <= 20:
+        raise ValueError(f"Invalid throw: {text}")
+    return base_score, multiplier or 1
+
+
+def _throw_from_record(record):
+    """Normalizes one imported NDJSON record into (game row, throw row)."""
+    if "base_score" in record:
+        base_score = int(record["base_score"])
+        multiplier = int(record.get("multiplier", 1))
+    else:
+        base_score, multiplier = parse_throw_string(str(record["throw"]))
+    validate_dart(base_score, multiplier)
+    player = int(record.get("player", 1))
+    if not 1 <= player <= MAX_PLAYERS:
+        raise ValueError(f"Invalid player: {player}")
+    game = {
+        "id": str(record["game_id"]),
+        "mode": str(record.get("mode", "501")),
+        "teams_mode": int(bool(record.get("teams_mode", False))),
+        "winner": record.get("winner"),
+        "finished_at": record.get("finished_at"),
+        "source": record.get("source", "import"),
+        f"player{player}_name": record.get("player_name"),
+    }
+    throw = [
+        game["id"],
+        int(record["dart"]),
+        player,
+        int(record.get("team", 1 if player in (1, 3) else 2)),
+        base_score,
+        multiplier,
+        record.get("score_before"),
+    ]
+    return game, throw
+
+
+def import_ndjson(conn, lines, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Imports throws from NDJSON lines. Each record needs game_id, dart and either
+    base_score/multiplier or a throw string like "T20"; other fields are optional.
+    Lines that aren't JSON objects, or hold a dart no board can score or a
+    player other than 1-4, are skipped.
+    Rows are written in transactions of `batch_size` throws, so memory stays
+    bounded however large the input is. Re-importing a file replaces its throws.
+    Returns (throws imported, lines skipped).
+    """
+    imported = skipped = 0
+    records = (line for line in lines if line.strip())
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return imported, skipped
+
+        games, throws = {}, []
+        for line in batch:
+            try:
+                game, throw = _throw_from_record(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            known = games.setdefault(game["id"], game)
+            for key, value in game.items():  # Names can arrive on any line
+                if value is not None and known.get(key) is None:
+                    known[key] = value
+            throws.append(throw)
+
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO games (id, mode, teams_mode, finished_at, source) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (g["id"], g["mode"], g["teams_mode"], g["finished_at"], g["source"])
+                    for g in games.values()
+                ],
+            )
+            for i in range(1, 5):
+                column = f"player{i}_name"
+                conn.executemany(
+                    f"UPDATE games SET {column} = ? WHERE id = ? AND {column} IS NULL",
+                    [(g[column], g["id"]) for g in games.values() if g.get(column)],
+                )
+            conn.executemany(
+                "UPDATE games SET winner = ? WHERE id = ? AND winner IS NULL",
+                [(g["winner"], g["id"]) for g in games.values() if g["winner"]],
+            )
+            conn.executemany(
+                f"INSERT OR REPLACE INTO throws ({', '.join(THROW_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(THROW_COLUMNS))})",
+                throws,
+            )
+            conn.executemany(
+                "INSERT INTO game_changes (game_id) VALUES (?)", [(g,) for g in games]
+            )
+        imported += len(throws)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import archived throws.")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="archive database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write every throw as NDJSON")
+    export_parser.add_argument("--out", default="-", help="output file (default stdout)")
+    import_parser = commands.add_parser("import", help="load throws from NDJSON files")
+    import_parser.add_argument("files", nargs="+", help="NDJSON files, or - for stdin")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    start = time.perf_counter()
+    if args.command == "export":
+        out = sys.stdout if args.out == "-" else open(args.out, "w")
+        with out:
+            count = export_ndjson(conn, out)
+        print(f"Exported {count} throws in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    else:
+        total = skipped = 0
+        for filename in args.files:
+            f = sys.stdin if filename == "-" else open(filename)
+            with f:
+                imported, bad = import_ndjson(conn, f, args.batch_size)
+            total += imported
+            skipped += bad
+        print(
+            f"Imported {total} throws in {time.perf_counter() - start:.1f}s "
+            f"({skipped} invalid lines skipped)",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
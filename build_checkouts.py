@@ -0,0 +1,23 @@
+"""
+Precompiles checkouts.json into checkouts.pickle, the table app.py loads at
+startup. Run it whenever checkouts.json changes (the Docker build runs it):
+
+    python build_checkouts.py
+"""
+
+import json
+import pickle
+
+from app import CHECKOUTS_JSON_PATH, CHECKOUTS_PICKLE_PATH, build_checkout_table
+
+
+def main():
+    with open(CHECKOUTS_JSON_PATH, "r") as f:
+        table = build_checkout_table(json.load(f))
+    with open(CHECKOUTS_PICKLE_PATH, "wb") as f:
+        pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"Wrote {CHECKOUTS_PICKLE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
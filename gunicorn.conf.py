@@ -0,0 +1,33 @@
+# Gunicorn settings for the Docker image.
+#
+# The app is preloaded in the master process, so the checkout table, the
+# compressed assets and the compiled templates are built once and shared by
+# the workers through copy-on-write instead of being rebuilt by each one.
+import gc
+
+bind = "0.0.0.0:5054"
+workers = 4
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Objects loaded by the master are never freed, so take them out of the
+    # garbage collector's reach. Otherwise collections in the workers write
+    # to those pages and every worker ends up with its own copy.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # In memory mode, pick up the games that were in progress when this
+    # worker (or the whole server) last stopped.
+    import app
+
+    recovered = app.recover_live_games()
+    if recovered:
+        server.log.info(f"Recovered {recovered} games in progress")
+
+
+def worker_exit(server, worker):
+    import app
+
+    app.flush_live_games()
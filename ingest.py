@@ -0,0 +1,294 @@
+"""
+Ingestion of hits from auto-scoring dartboards and camera systems.
+
+A board sends raw hit events, which /api/ingest validates, debounces, maps to
+segments and scores with the same rules as a tap on /api/score. An event is
+a JSON object with the hit position in mm from the centre of the bull (y up):
+
+    {"board": "oche-1", "id": 17, "t": 1712345678901, "x": -3.2, "y": 101.5}
+
+or, from boards that detect the segment themselves:
+
+    {"board": "oche-1", "id": 18, "t": 1712345679420, "segment": 20, "multiplier": 3}
+
+`t` is the board's clock in milliseconds and `id` an optional, increasing
+event number used to drop resends. A board must first be bound to a game
+with POST /api/boards/<board>/bind (in DARTS_SESSION_STORE=memory mode).
+
+Boards that can only send datagrams go through the UDP relay, which batches
+them into /api/ingest requests. The simulator stands in for any number of
+boards, over HTTP or through the relay:
+
+    python ingest.py relay --listen 0.0.0.0:5055 --url http://127.0.0.1:5054
+    python ingest.py simulate --url http://127.0.0.1:5054 --boards 20 --duration 30
+    python ingest.py simulate --url http://127.0.0.1:5054 --udp 127.0.0.1:5055
+"""
+
+import argparse
+import json
+import math
+import random
+import socket
+import threading
+import time
+
+import archive
+
+# Clockwise order of the numbers on a board, starting from the top
+SEGMENT_ORDER = [20, 1, 18, 4, 13, 6, 10, 15, 2, 17, 3, 19, 7, 16, 8, 11, 14, 9, 12, 5]
+# Ring radii in mm (WDF regulation board)
+INNER_BULL_RADIUS = 6.35
+OUTER_BULL_RADIUS = 15.9
+TREBLE_RING = (99.0, 107.0)
+DOUBLE_RING = (162.0, 170.0)
+# Hits further out than the edge of the board can only be sensor noise
+BOARD_RADIUS = 225.5
+# A second hit on the same board within this window is the same dart
+# bouncing or being reported twice
+DEBOUNCE_MS = 80
+# After this long without an accepted hit a board may have rebooted, restarting
+# its event ids, so its filter starts afresh; resends come well within it
+FILTER_IDLE_SECONDS = 10.0
+# A hit this far behind the last one in the board's clock means the clock restarted
+CLOCK_RESET_MS = 60_000
+MAX_INGEST_BATCH = 500
+# Game key prefix of a board's game; a test checks it matches app.py's
+BOARD_KEY_PREFIX = "board-"
+
+
+def segment_at(x, y):
+    """Maps a hit position in mm from the centre to (base_score, multiplier)."""
+    r = math.hypot(x, y)
+    if r <= INNER_BULL_RADIUS:
+        return 25, 2
+    if r <= OUTER_BULL_RADIUS:
+        return 25, 1
+    if r > DOUBLE_RING[1]:
+        return 0, 1  # Off the scoring area
+    # Angle clockwise from the top; the 20 spans -9 to 9 degrees
+    angle = math.degrees(math.atan2(x, y))
+    base_score = SEGMENT_ORDER[int(((angle + 9) % 360) // 18)]
+    if TREBLE_RING[0] <= r <= TREBLE_RING[1]:
+        return base_score, 3
+    if DOUBLE_RING[0] <= r:
+        return base_score, 2
+    return base_score, 1
+
+
+def aim_point(base_score, multiplier):
+    """The centre of a bed in mm, i.e. where a player aiming at it throws."""
+    if base_score == 25:
+        if multiplier == 2:
+            return 0.0, 0.0
+        return 0.0, (OUTER_BULL_RADIUS + INNER_BULL_RADIUS) / 2
+    if base_score == 0:
+        return 0.0, DOUBLE_RING[1] + 20
+    radius = {1: 135.0, 2: sum(DOUBLE_RING) / 2, 3: sum(TREBLE_RING) / 2}[multiplier]
+    angle = math.radians(SEGMENT_ORDER.index(base_score) * 18)
+    return radius * math.sin(angle), radius * math.cos(angle)
+
+
+def parse_event(event):
+    """Validates a hit event and returns the (base_score, multiplier) it scores."""
+    if "x" in event or "y" in event:
+        x, y = float(event["x"]), float(event["y"])
+        if not (math.isfinite(x) and math.isfinite(y)) or math.hypot(x, y) > BOARD_RADIUS:
+            raise ValueError("Hit position is off the board.")
+        return segment_at(x, y)
+    base_score, multiplier = int(event["segment"]), int(event.get("multiplier", 1))
+    archive.validate_dart(base_score, multiplier)
+    return base_score, multiplier
+
+
+class HitFilter:
+    """Drops a board's resent, out-of-order and bouncing hits."""
+
+    def __init__(self, window_ms=DEBOUNCE_MS):
+        self.window_ms = window_ms
+        self.last_t = None
+        self.last_id = None
+        self.last_accepted = None  # Server time of the last accepted hit
+
+    def accept(self, t, event_id=None, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last_accepted is not None and (
+            now - self.last_accepted > FILTER_IDLE_SECONDS or t < self.last_t - CLOCK_RESET_MS
+        ):
+            self.last_t = self.last_id = None  # The board rebooted
+        if event_id is not None:
+            if self.last_id is not None and event_id <= self.last_id:
+                return False
+            self.last_id = event_id
+        if self.last_t is not None and t < self.last_t + self.window_ms:
+            return False
+        self.last_t = t
+        self.last_accepted = now
+        return True
+
+
+# --- UDP relay ---
+
+
+def relay(listen, base_url, window=0.002):
+    """
+    Receives hit events as JSON datagrams and posts them to /api/ingest,
+    batched per board for up to `window` seconds. Each board's batch carries
+    its game cookie, so the shard router (shard.py) sends it to the right worker.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from loadtest import HttpClient, Recorder
+
+    host, _, port = listen.rpartition(":")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, int(port)))
+    recorder = Recorder()
+    local = threading.local()
+
+    def post(board, events):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = HttpClient(base_url, recorder)
+        client.cookie = f"darts_game={BOARD_KEY_PREFIX}{board}"
+        client.request("POST", "/api/ingest", {"events": events})
+
+    print(f"Relaying hits from udp://{listen} to {base_url}/api/ingest")
+    pending, deadline = {}, None
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                for board, events in pending.items():
+                    pool.submit(post, board, events)
+                pending, deadline = {}, None
+                continue
+            # A timeout of 0 would make the socket non-blocking, hence the check above
+            sock.settimeout(remaining)
+            try:
+                data, _ = sock.recvfrom(65536)
+                event = json.loads(data)
+                pending.setdefault(str(event["board"]), []).append(event)
+                if deadline is None:
+                    deadline = time.monotonic() + window
+            except socket.timeout:
+                pass
+            except (ValueError, KeyError, TypeError):
+                continue  # Not a hit event
+
+
+# --- Simulator ---
+
+
+class SimulatedBoard:
+    """An auto-scoring board with a player throwing at it."""
+
+    def __init__(self, name, client, rng, sigma):
+        self.name = name
+        self.client = client
+        self.rng = rng
+        self.sigma = sigma  # Spread of the player's darts around the aim point, in mm
+        self.state = None
+        self.event_id = 0
+        self.darts = 0
+        self.games = 0
+
+    def bind(self):
+        self.client.request("GET", "/api/state")
+        _, _, self.state = self.client.request("POST", f"/api/boards/{self.name}/bind", {})
+        if self.state is None:
+            raise RuntimeError("Binding failed; is the app running with DARTS_SESSION_STORE=memory?")
+
+    def next_events(self):
+        """One dart as a hit event, sometimes followed by a bounce of the same dart."""
+        from loadtest import choose_target
+
+        target = choose_target(self.state) if self.state else (20, 3)
+        x, y = aim_point(*target)
+        x, y = x + self.rng.gauss(0, self.sigma), y + self.rng.gauss(0, self.sigma)
+        now = time.time() * 1000
+        self.event_id += 1
+        events = [{"board": self.name, "id": self.event_id, "t": now, "x": x, "y": y}]
+        if self.rng.random() < 0.05:
+            self.event_id += 1
+            events.append(
+                {"board": self.name, "id": self.event_id, "t": now + 15, "x": x + 1, "y": y}
+            )
+        self.darts += 1
+        return events
+
+    def step(self, udp=None):
+        if self.state and self.state.get("game_over"):
+            self.games += 1
+            _, _, self.state = self.client.request("POST", "/api/reset", {"mode": "501"})
+            return
+        events = self.next_events()
+        if udp is not None:
+            sock, address = udp
+            for event in events:
+                sock.sendto(json.dumps(event).encode(), address)
+            _, _, self.state = self.client.request("GET", "/api/state")
+            return
+        _, _, result = self.client.request("POST", "/api/ingest", {"events": events})
+        if result:
+            self.state = result["boards"].get(self.name, self.state)
+
+
+def simulate(base_url, boards, duration, interval, sigma, udp_address=None, seed=1):
+    from loadtest import HttpClient, Recorder, print_report, summarize
+
+    recorder = Recorder()
+    stop = threading.Event()
+    simulated = []
+    udp = None
+    if udp_address:
+        host, _, port = udp_address.rpartition(":")
+        udp = (socket.socket(socket.AF_INET, socket.SOCK_DGRAM), (host, int(port)))
+
+    def run(i):
+        board = SimulatedBoard(
+            f"sim-{i + 1}", HttpClient(base_url, recorder), random.Random(seed + i), sigma
+        )
+        board.bind()
+        simulated.append((board.client, board))
+        while not stop.is_set():
+            board.step(udp)
+            stop.wait(interval)
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(boards)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    print_report(summarize(recorder, time.perf_counter() - start, simulated, None))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relay or simulate auto-scoring board hits.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    relay_parser = commands.add_parser("relay", help="forward UDP hit events to /api/ingest")
+    relay_parser.add_argument("--listen", default="0.0.0.0:5055")
+    relay_parser.add_argument("--url", default="http://127.0.0.1:5054")
+    relay_parser.add_argument("--window-ms", type=float, default=2.0, help="batching window")
+    sim_parser = commands.add_parser("simulate", help="throw darts at simulated boards")
+    sim_parser.add_argument("--url", default="http://127.0.0.1:5054")
+    sim_parser.add_argument("--udp", help="send hits to a relay at host:port instead of over HTTP")
+    sim_parser.add_argument("--boards", type=int, default=10)
+    sim_parser.add_argument("--duration", type=float, default=30, help="seconds")
+    sim_parser.add_argument("--interval", type=float, default=0.5, help="seconds between darts")
+    sim_parser.add_argument("--sigma", type=float, default=15.0, help="throwing spread in mm")
+    sim_parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "relay":
+        relay(args.listen, args.url, args.window_ms / 1000)
+    else:
+        simulate(
+            args.url, args.boards, args.duration, args.interval, args.sigma, args.udp, args.seed
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Write-behind persistence of games in progress.
+
+In memory mode (see app.GameSessionInterface) a game lives in one worker's
+memory. So that a worker crash or a lost cookie doesn't end it, every change
+is handed to a WriteBehind, which acknowledges it at once and keeps only the
+latest state of each game. A background thread writes whatever changed to the
+live_games table in one transaction every `interval` seconds, so at most one
+interval of darts can be lost.
+"""
+
+import atexit
+import os
+import threading
+import time
+
+import archive
+
+# Rows of games nobody has touched for this long are dropped on recovery
+LIVE_GAME_TTL = 30 * 24 * 3600
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS live_games (
+        key TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        finished INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL
+    )""",
+]
+
+
+class WriteBehind:
+    """Buffers the latest state of each changed game and group-commits them."""
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.pending = {}  # Game key -> (state, finished, updated_at)
+        self.writing = {}  # The batch being committed
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.thread = None
+        self.pid = None
+        self.flushes = 0
+        atexit.register(self.flush)
+
+    def connect(self):
+        return archive.connect(self.path, SCHEMA)
+
+    def save(self, key, state, finished=False):
+        """Queues a game's serialized state; returns without touching the disk."""
+        with self.lock:
+            self.pending[key] = (state, int(finished), time.time())
+            if self.thread is None or self.pid != os.getpid():
+                # Threads don't survive a fork, so each worker starts its own
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.wake.notify()
+
+    def load(self, key):
+        """Returns the last saved state of a game, or None."""
+        with self.lock:
+            for queued in (self.pending, self.writing):
+                if key in queued:
+                    return queued[key][0]
+        row = self.connect().execute(
+            "SELECT state FROM live_games WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def changed_since(self, prefix, since):
+        """Returns {key: updated_at} of the saved games with keys starting `prefix`."""
+        # Keys with the prefix sort between it and the prefix with its last character bumped
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        rows = self.connect().execute(
+            "SELECT key, updated_at FROM live_games WHERE key >= ? AND key < ? AND updated_at >= ?",
+            (prefix, end, since),
+        )
+        return dict(rows)
+
+    def flush(self):
+        """Writes every queued change in one transaction."""
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            self.writing = batch
+        if not batch:
+            return 0
+        try:
+            conn = self.connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO live_games (key, state, finished, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(key, *row) for key, row in batch.items()],
+                )
+        except archive.sqlite3.Error:
+            with self.lock:  # Keep the batch for the next flush, unless superseded
+                for key, row in batch.items():
+                    self.pending.setdefault(key, row)
+            raise
+        finally:
+            with self.lock:
+                self.writing = {}
+        self.flushes += 1
+        return len(batch)
+
+    def recover(self, limit, owned=None):
+        """
+        Returns (key, state) for up to `limit` unfinished games, newest first;
+        only those whose key passes `owned`, if given.
+        """
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM live_games WHERE updated_at < ?", (time.time() - LIVE_GAME_TTL,)
+            )
+        if owned is None:
+            return conn.execute(
+                "SELECT key, state FROM live_games WHERE finished = 0 "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        keys = conn.execute(
+            "SELECT key FROM live_games WHERE finished = 0 ORDER BY updated_at DESC"
+        )
+        # Only the owned games' states are read and returned
+        mine = [key for (key,) in keys if owned(key)][:limit]
+        return [
+            (key, conn.execute("SELECT state FROM live_games WHERE key = ?", (key,)).fetchone()[0])
+            for key in mine
+        ]
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.wake.wait()
+            # Let changes from other requests collect, then commit them together
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except archive.sqlite3.Error as e:
+                print(f"WARNING: Could not save live games: {e}")
@@ -0,0 +1,412 @@
+"""
+Load generator for capacity planning. Drives realistic games through the real
+HTTP endpoints and reports throughput, latency percentiles and the memory used
+by each Gunicorn worker.
+
+Each simulated board plays X01, Cricket or Around the World with weighted
+random darts, an occasional undo and the odd rename. Each spectator follows a
+board the way a scoreboard TV would, polling /api/state with If-None-Match.
+
+Examples:
+    # Start a local Gunicorn (gunicorn.conf.py) and run 40 boards for 60 seconds
+    python loadtest.py --spawn --boards 40 --spectators 80 --duration 60
+
+    # Run against a server that is already up
+    python loadtest.py --url http://127.0.0.1:5054 --boards 10 --duration 30
+
+Only the standard library is used, so it runs anywhere the app does.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+# Clockwise order of the numbers on a board, used to miss into a neighbour
+BOARD_ORDER = [20, 1, 18, 4, 13, 6, 10, 15, 2, 17, 3, 19, 7, 16, 8, 11, 14, 9, 12, 5]
+CRICKET_NUMBERS = [20, 19, 18, 17, 16, 15, 25]
+GAME_MODES = ["501", "301", "cricket", "around_the_world"]
+# Chance of hitting the aimed-at bed, by multiplier
+HIT_RATES = {1: 0.85, 2: 0.25, 3: 0.3}
+UNDO_RATE = 0.03
+RENAME_RATE = 0.005
+
+
+def throw_at(rng, base_score, multiplier):
+    """Returns the (base_score, multiplier) actually hit when aiming at a bed."""
+    r = rng.random()
+    if base_score == 25:
+        if r < 0.15:
+            return 25, 2
+        if r < 0.5:
+            return 25, 1
+        return rng.choice(BOARD_ORDER), 1
+    if r < HIT_RATES[multiplier]:
+        return base_score, multiplier
+    if multiplier > 1 and r < 0.8:
+        return base_score, 1  # Hit the number but not the ring
+    if r < 0.96:
+        i = BOARD_ORDER.index(base_score)
+        neighbour = BOARD_ORDER[(i + rng.choice((-1, 1))) % len(BOARD_ORDER)]
+        return neighbour, 1
+    return 0, 1  # Off the board
+
+
+def choose_target(state):
+    """Picks what a sensible player would aim at for the current state."""
+    team = 1 if state["current_player"] in (1, 3) else 2
+    mode = state["game_mode"]
+    if mode == "around_the_world":
+        return state[f"team{team}_target"], 1
+    if mode == "cricket":
+        mine = state["cricket_marks"][f"team{team}"]
+        theirs = state["cricket_marks"][f"team{2 if team == 1 else 1}"]
+        for number in CRICKET_NUMBERS:
+            if mine[str(number)] < 3:
+                return number, 1 if number == 25 else 3
+        for number in CRICKET_NUMBERS:
+            if theirs[str(number)] < 3:
+                return number, 1 if number == 25 else 3
+        return 20, 3
+
+    score = state[f"team{team}_score"]
+    if score == 50:
+        return 25, 2
+    if score <= 40 and score % 2 == 0:
+        return score // 2, 2
+    if score <= 40:
+        return 1, 1  # Leave an even number
+    if score <= 60:
+        return score - 40 if score - 40 <= 20 else 20, 1
+    return 20, 3
+
+
+class Recorder:
+    """Collects request latencies per endpoint from all threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.not_modified = 0
+
+    def record(self, endpoint, seconds, ok, status):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(endpoint, []).append(seconds)
+                if status == 304:
+                    self.not_modified += 1
+            else:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+class HttpClient:
+    """A keep-alive connection with its own session cookie, like one browser tab."""
+
+    def __init__(self, base_url, recorder, timeout=10):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(
+            parsed.hostname, parsed.port or 80, timeout=timeout
+        )
+        self.recorder = recorder
+        self.cookies = {}
+
+    @property
+    def cookie(self):
+        """The Cookie header this client sends, e.g. to share its session."""
+        return "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+
+    @cookie.setter
+    def cookie(self, header):
+        self.cookies = dict(
+            part.strip().split("=", 1) for part in (header or "").split(";") if "=" in part
+        )
+
+    def request(self, method, path, body=None, headers=None):
+        """Sends a request; returns (status, headers, parsed JSON or None)."""
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+
+        endpoint = f"{method} {path.split('?')[0]}"
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()  # Reconnects on the next request
+            self.recorder.record(endpoint, time.perf_counter() - start, False, None)
+            return None, {}, None
+        elapsed = time.perf_counter() - start
+
+        for set_cookie in response.msg.get_all("Set-Cookie") or []:
+            name, _, value = set_cookie.split(";", 1)[0].partition("=")
+            self.cookies[name.strip()] = value
+        ok = response.status < 400
+        self.recorder.record(endpoint, elapsed, ok, response.status)
+        parsed = json.loads(data) if data and response.status == 200 else None
+        return response.status, dict(response.getheaders()), parsed
+
+
+class Board:
+    """Plays games back to back through the API, like a tablet next to a board."""
+
+    def __init__(self, send, rng):
+        self.send = send  # send(method, path, body=None, headers=None)
+        self.rng = rng
+        self.seq = 0
+        self.state = None
+        self.darts = 0
+        self.games = 0
+
+    def new_game(self):
+        mode = self.rng.choice(GAME_MODES)
+        _, _, state = self.send("POST", "/api/reset", {"mode": mode})
+        self.state = state
+
+    def step(self):
+        """Performs one user action: usually a dart, sometimes an undo or a rename."""
+        if self.state is None or self.state.get("game_over"):
+            if self.state is not None:
+                self.games += 1
+            self.new_game()
+            return
+
+        r = self.rng.random()
+        if r < UNDO_RATE and self.state.get("can_undo"):
+            _, _, state = self.send("POST", "/api/undo", {})
+        elif r < UNDO_RATE + RENAME_RATE:
+            player = self.rng.randint(1, 2)
+            name = f"Player {self.rng.randint(1, 99)}"
+            _, _, state = self.send("POST", "/api/names", {f"player{player}_name": name})
+        else:
+            base_score, multiplier = throw_at(self.rng, *choose_target(self.state))
+            self.seq += 1
+            body = {"seq": self.seq, "base_score": base_score, "multiplier": multiplier}
+            _, _, state = self.send("POST", "/api/score", body)
+            self.darts += 1
+        if state is not None:
+            self.state = state
+
+
+def run_board(base_url, recorder, board_clients, stop, seed, think_time):
+    client = HttpClient(base_url, recorder)
+    board = Board(client.request, random.Random(seed))
+    board_clients.append((client, board))
+    client.request("GET", "/api/state")
+    while not stop.is_set():
+        board.step()
+        if think_time:
+            time.sleep(think_time)
+
+
+def run_spectator(base_url, recorder, board_client, stop, interval):
+    client = HttpClient(base_url, recorder)
+    etag = None
+    while not stop.is_set():
+        # A scoreboard shows the board's game, so it shares the board's session
+        client.cookie = board_client.cookie
+        headers = {"If-None-Match": etag} if etag else {}
+        _, response_headers, _ = client.request("GET", "/api/state", headers=headers)
+        etag = response_headers.get("ETag", etag)
+        stop.wait(interval)
+
+
+def find_workers(master_pid):
+    """Returns the PIDs of the processes forked by a Gunicorn master."""
+    workers = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master_pid:
+            workers.append(int(entry))
+    return sorted(workers)
+
+
+def worker_memory(pid):
+    """Returns (RSS, PSS) in KiB. PSS splits copy-on-write pages between workers."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        return None
+    return values.get("Rss"), values.get("Pss")
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed, boards, master_pid):
+    endpoints = {}
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values.sort()
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(endpoint, 0),
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.5) * 1000,
+            "p90_ms": percentile(values, 0.9) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+            "mean_ms": statistics.fmean(values) * 1000,
+        }
+    total = sum(len(v) for v in recorder.latencies.values())
+    report = {
+        "duration_s": elapsed,
+        "requests": total,
+        "rps": total / elapsed,
+        "errors": sum(recorder.errors.values()),
+        "not_modified": recorder.not_modified,
+        "darts": sum(b.darts for _, b in boards),
+        "games_finished": sum(b.games for _, b in boards),
+        "endpoints": endpoints,
+        "workers": {},
+    }
+    if master_pid:
+        for pid in find_workers(master_pid):
+            memory = worker_memory(pid)
+            if memory:
+                report["workers"][pid] = {"rss_kib": memory[0], "pss_kib": memory[1]}
+    return report
+
+
+def print_report(report):
+    print(
+        f"\n{report['requests']} requests in {report['duration_s']:.1f}s "
+        f"({report['rps']:.0f} req/s), {report['errors']} errors, "
+        f"{report['not_modified']} not modified"
+    )
+    print(f"{report['darts']} darts thrown, {report['games_finished']} games finished\n")
+    print(f"{'endpoint':<22}{'req':>8}{'req/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for endpoint, s in report["endpoints"].items():
+        print(
+            f"{endpoint:<22}{s['requests']:>8}{s['rps']:>9.1f}{s['p50_ms']:>8.1f}ms"
+            f"{s['p90_ms']:>7.1f}ms{s['p99_ms']:>7.1f}ms{s['max_ms']:>7.1f}ms"
+        )
+    if report["workers"]:
+        print(f"\n{'worker pid':<12}{'RSS':>12}{'PSS':>12}")
+        for pid, memory in report["workers"].items():
+            print(f"{pid:<12}{memory['rss_kib']:>9} KiB{memory['pss_kib']:>9} KiB")
+
+
+def spawn_gunicorn(port, workers):
+    """Starts Gunicorn with the production config on a local port."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "SECRET_KEY": os.environ.get("SECRET_KEY", "loadtest")}
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "app:app",
+        ],
+        cwd=here,
+        env=env,
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/rules")
+            conn.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Gunicorn did not start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5054")
+    parser.add_argument("--boards", type=int, default=10)
+    parser.add_argument("--spectators", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="pause between a board's actions, in seconds")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="spectator polling interval, in seconds")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start a local Gunicorn using gunicorn.conf.py")
+    parser.add_argument("--workers", type=int, default=4, help="workers for --spawn")
+    parser.add_argument("--gunicorn-pid", type=int,
+                        help="master PID of an existing Gunicorn, for memory stats")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    process = None
+    master_pid = args.gunicorn_pid
+    if args.spawn:
+        port = urllib.parse.urlsplit(args.url).port or 5054
+        process = spawn_gunicorn(port, args.workers)
+        master_pid = process.pid
+
+    recorder = Recorder()
+    stop = threading.Event()
+    boards = []
+    threads = []
+    try:
+        for i in range(args.boards):
+            t = threading.Thread(
+                target=run_board,
+                args=(args.url, recorder, boards, stop, args.seed + i, args.think_time),
+                daemon=True,
+            )
+            threads.append(t)
+            t.start()
+        while len(boards) < args.boards and any(t.is_alive() for t in threads):
+            time.sleep(0.01)
+        for i in range(args.spectators):
+            board_client = boards[i % len(boards)][0]
+            t = threading.Thread(
+                target=run_spectator,
+                args=(args.url, recorder, board_client, stop, args.poll_interval),
+                daemon=True,
+            )
+            threads.append(t)
+            t.start()
+
+        start = time.perf_counter()
+        stop.wait(args.duration)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for t in threads:
+            t.join(timeout=5)
+        report = summarize(recorder, elapsed, boards, master_pid)
+    finally:
+        stop.set()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Player profiles and leaderboards, kept in the archive database.
+
+A profile is created the first time a name finishes a game and is matched
+case-insensitively afterwards. When a game is archived, each player's totals
+and Elo rating are updated from that game alone, and the leaderboard columns
+(rating, 3-dart average, checkout %, win rate) each have an index, so a
+top-N lookup reads N rows off the index instead of sorting every player.
+"""
+
+import time
+
+import archive
+
+INITIAL_RATING = 1500.0
+ELO_K = 32
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS players (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+        rating REAL NOT NULL DEFAULT 1500,
+        games INTEGER NOT NULL DEFAULT 0,
+        wins INTEGER NOT NULL DEFAULT 0,
+        darts INTEGER NOT NULL DEFAULT 0,
+        x01_darts INTEGER NOT NULL DEFAULT 0,
+        x01_points INTEGER NOT NULL DEFAULT 0,
+        checkout_attempts INTEGER NOT NULL DEFAULT 0,
+        checkouts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL,
+        last_played REAL,
+        average REAL GENERATED ALWAYS AS
+            (CASE WHEN x01_darts > 0 THEN x01_points * 3.0 / x01_darts END) STORED,
+        checkout_pct REAL GENERATED ALWAYS AS
+            (CASE WHEN checkout_attempts > 0
+                  THEN checkouts * 100.0 / checkout_attempts END) STORED,
+        win_rate REAL GENERATED ALWAYS AS
+            (CASE WHEN games > 0 THEN wins * 1.0 / games END) STORED
+    )""",
+    """CREATE TABLE IF NOT EXISTS game_players (
+        game_id TEXT NOT NULL,
+        player_id INTEGER NOT NULL,
+        seat INTEGER NOT NULL,
+        team INTEGER NOT NULL,
+        won INTEGER NOT NULL,
+        rating_before REAL NOT NULL,
+        rating_after REAL NOT NULL,
+        PRIMARY KEY (game_id, player_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS game_players_by_player ON game_players (player_id)",
+    "CREATE INDEX IF NOT EXISTS players_by_rating ON players (rating DESC)",
+    "CREATE INDEX IF NOT EXISTS players_by_average ON players (average DESC)",
+    "CREATE INDEX IF NOT EXISTS players_by_checkout_pct ON players (checkout_pct DESC)",
+    "CREATE INDEX IF NOT EXISTS players_by_win_rate ON players (win_rate DESC)",
+]
+
+# Leaderboard name -> indexed column it is ordered by
+LEADERBOARDS = {
+    "rating": "rating",
+    "average": "average",
+    "checkout": "checkout_pct",
+    "win_rate": "win_rate",
+}
+PROFILE_COLUMNS = [
+    "name", "rating", "games", "wins", "darts", "average", "checkout_pct", "win_rate",
+    "last_played",
+]
+
+
+def connect(path=archive.DEFAULT_PATH):
+    """Returns this thread's archive connection with the player tables created."""
+    return archive.connect(path, SCHEMA)
+
+
+def _game_totals(game, throws):
+    """
+    Per-seat totals for one game: darts thrown and, for X01, points scored and
+    checkout attempts/hits. Points are how far each dart moved its team's
+    score, so darts in a bust turn cancel out.
+    """
+    totals = {}
+    x01 = game["mode"].isdigit()
+    by_team = {}
+    for throw in throws:
+        by_team.setdefault(throw["team"], []).append(throw)
+        seat = totals.setdefault(
+            throw["player"],
+            {"darts": 0, "x01_darts": 0, "x01_points": 0, "checkout_attempts": 0, "checkouts": 0},
+        )
+        seat["darts"] += 1
+    if not x01:
+        return totals
+
+    for team, team_throws in by_team.items():
+        final_score = game.get(f"team{team}_score") or 0
+        after = [t["score_before"] for t in team_throws[1:]] + [final_score]
+        for throw, score_after in zip(team_throws, after):
+            seat = totals[throw["player"]]
+            before = throw["score_before"]
+            seat["x01_darts"] += 1
+            seat["x01_points"] += before - score_after
+            target = archive.checkout_double(before)
+            if target is not None:
+                seat["checkout_attempts"] += 1
+                if throw["multiplier"] == 2 and throw["base_score"] == target:
+                    seat["checkouts"] += 1
+    return totals
+
+
+def _elo_deltas(ratings, winner):
+    """
+    Rating change for each team given {team: [member ratings]}. A team is rated
+    as the average of its members and every member gets the team's change.
+    """
+    team1 = sum(ratings[1]) / len(ratings[1])
+    team2 = sum(ratings[2]) / len(ratings[2])
+    expected1 = 1 / (1 + 10 ** ((team2 - team1) / 400))
+    delta1 = ELO_K * ((1 if winner == 1 else 0) - expected1)
+    return {1: delta1, 2: -delta1}
+
+
+def record_game(conn, game, throws):
+    """
+    Updates the profiles of everyone who played a finished game.
+    `game` and `throws` are the rows given to archive.record_game. Recording the
+    same game twice has no effect.
+    """
+    if conn.execute("SELECT 1 FROM game_players WHERE game_id = ?", (game["id"],)).fetchone():
+        return
+    seat_count = 4 if game.get("teams_mode") else 2
+    now = time.time()
+    totals = _game_totals(game, throws)
+
+    with conn:
+        seats = {}  # player id -> (seat, team); a name in two seats plays the first
+        ratings = {}
+        for seat in range(1, seat_count + 1):
+            name = (game.get(f"player{seat}_name") or f"Player {seat}").strip()
+            conn.execute(
+                "INSERT INTO players (name, created_at) VALUES (?, ?) "
+                "ON CONFLICT (name) DO NOTHING",
+                (name, now),
+            )
+            player_id, rating = conn.execute(
+                "SELECT id, rating FROM players WHERE name = ?", (name,)
+            ).fetchone()
+            if player_id not in seats:
+                seats[player_id] = (seat, 1 if seat in (1, 3) else 2)
+                ratings[player_id] = rating
+
+        teams = {1: [], 2: []}
+        for player_id, (seat, team) in seats.items():
+            teams[team].append(ratings[player_id])
+        winner = game.get("winner")
+        rated = winner in (1, 2) and teams[1] and teams[2]
+        deltas = _elo_deltas(teams, winner) if rated else {1: 0.0, 2: 0.0}
+
+        for player_id, (seat, team) in seats.items():
+            seat_totals = totals.get(seat, {})
+            won = int(team == winner)
+            rating_after = ratings[player_id] + deltas[team]
+            conn.execute(
+                """UPDATE players SET rating = ?, games = games + 1, wins = wins + ?,
+                       darts = darts + ?, x01_darts = x01_darts + ?,
+                       x01_points = x01_points + ?,
+                       checkout_attempts = checkout_attempts + ?,
+                       checkouts = checkouts + ?, last_played = ?
+                   WHERE id = ?""",
+                (
+                    rating_after,
+                    won,
+                    seat_totals.get("darts", 0),
+                    seat_totals.get("x01_darts", 0),
+                    seat_totals.get("x01_points", 0),
+                    seat_totals.get("checkout_attempts", 0),
+                    seat_totals.get("checkouts", 0),
+                    game.get("finished_at") or now,
+                    player_id,
+                ),
+            )
+            conn.execute(
+                "INSERT INTO game_players VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (game["id"], player_id, seat, team, won, ratings[player_id], rating_after),
+            )
+
+
+def leaderboard(conn, by="rating", limit=10, min_games=1):
+    """Top `limit` players by one of LEADERBOARDS, best first."""
+    column = LEADERBOARDS[by]
+    rows = conn.execute(
+        f"SELECT {', '.join(PROFILE_COLUMNS)} FROM players "
+        f"WHERE {column} IS NOT NULL AND games >= ? ORDER BY {column} DESC LIMIT ?",
+        (min_games, limit),
+    ).fetchall()
+    return [dict(zip(PROFILE_COLUMNS, row)) for row in rows]
+
+
+def list_players(conn, prefix=""):
+    """Every profile whose name starts with `prefix`, alphabetically."""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = conn.execute(
+        f"SELECT {', '.join(PROFILE_COLUMNS)} FROM players "
+        "WHERE name LIKE ? ESCAPE '\\' ORDER BY name",
+        (escaped + "%",),
+    ).fetchall()
+    return [dict(zip(PROFILE_COLUMNS, row)) for row in rows]
+
+
+def get_profile(conn, name, recent=10):
+    """A player's profile with their most recent games, or None if unknown."""
+    row = conn.execute(
+        f"SELECT id, {', '.join(PROFILE_COLUMNS)} FROM players WHERE name = ?", (name,)
+    ).fetchone()
+    if row is None:
+        return None
+    profile = dict(zip(PROFILE_COLUMNS, row[1:]))
+    games = conn.execute(
+        """SELECT g.id, g.mode, g.finished_at, gp.won, gp.rating_before, gp.rating_after
+           FROM game_players gp JOIN games g ON g.id = gp.game_id
+           WHERE gp.player_id = ?
+           ORDER BY g.finished_at DESC LIMIT ?""",
+        (row[0], recent),
+    ).fetchall()
+    profile["recent_games"] = [
+        {
+            "game_id": game_id,
+            "mode": mode,
+            "finished_at": finished_at,
+            "won": bool(won),
+            "rating_change": round(after - before, 1),
+        }
+        for game_id, mode, finished_at, won, before, after in games
+    ]
+    return profile
@@ -0,0 +1,330 @@
+"""
+On-demand sampling profiler for requests in production.
+
+While it is switched on (see the /admin/profiler routes in app.py), some
+requests are chosen for profiling: every Nth one, or those of one endpoint.
+A background thread looks at the stacks of the threads serving the chosen
+requests every `interval` seconds, via sys._current_frames(), and counts
+each stack it sees per endpoint. Requests that weren't chosen, and the app
+as a whole while the profiler is off, pay only for a check of a flag and of
+the clock.
+
+Under gunicorn or shard.py the admin requests may each reach another worker,
+so a profiler given the archive database shares its profile through it: a
+profile started or stopped by one worker is picked up by the others within
+SHARE_SECONDS, each worker publishes its samples there as often, and the
+status and stacks are merged across workers when read.
+
+The sampler only runs when it gets the GIL, so while profiling the
+interpreter's switch interval is lowered to the sampling interval. Otherwise
+a request thread would hold on to the GIL for 5 ms at a time, and samples
+would pile up wherever it happened to release it rather than where the time
+goes. Calls that release the GIL (system calls, I/O) are still somewhat
+over-counted, so read short ones near the top of a stack with that in mind.
+
+The counts are served in the folded format ("frame;frame;frame count" per
+line) read by flamegraph.pl, speedscope and most other flame graph tools.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.005  # Seconds between samples
+DEFAULT_SECONDS = 60  # How long a profile runs unless stopped earlier
+MAX_SECONDS = 3600
+# Frames below this are the server's own, the same for every request
+ROOT_FUNCTION = "wsgi_app"
+# How often a worker follows the shared profile and publishes its samples
+SHARE_SECONDS = 1.0
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS profiler_runs (
+        id INTEGER PRIMARY KEY,
+        enabled INTEGER NOT NULL,
+        every INTEGER NOT NULL,
+        endpoint TEXT,
+        interval REAL NOT NULL,
+        until REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS profiler_workers (
+        run INTEGER NOT NULL,
+        pid INTEGER NOT NULL,
+        requests INTEGER NOT NULL,
+        profiled TEXT NOT NULL,
+        PRIMARY KEY (run, pid)
+    )""",
+    """CREATE TABLE IF NOT EXISTS profiler_stacks (
+        run INTEGER NOT NULL,
+        endpoint TEXT NOT NULL,
+        stack TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (run, endpoint, stack)
+    )""",
+]
+# The latest profile, which every worker follows
+LATEST_RUN = "(SELECT max(id) FROM profiler_runs)"
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)})"
+
+
+def fold_stack(frame):
+    """Formats a thread's stack root first, from the app's WSGI entry point down."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        if frame.f_code.co_name == ROOT_FUNCTION:
+            break
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """
+    Samples the stacks of the requests chosen for profiling. Given the path of
+    the archive database, it follows the profile shared by every worker.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = False
+        self.every = 1  # Profile every Nth request...
+        self.endpoint = None  # ...or every request of this endpoint
+        self.interval = DEFAULT_INTERVAL
+        self.until = 0.0
+        self.requests = 0  # Requests seen while enabled
+        self.profiled = Counter()  # Endpoint -> requests profiled
+        self.stacks = {}  # Endpoint -> Counter of folded stacks
+        self.active = {}  # Thread id -> endpoint of the request it is serving
+        self.lock = threading.Lock()
+        self.thread = None
+        self.switch_interval = None  # The interpreter's own, while profiling
+        self.run = None  # Id of the shared profile this worker takes part in
+        self.unshared = {}  # Endpoint -> Counter of stacks not yet published
+        self.next_poll = 0.0
+
+    def _connect(self):
+        import archive  # Loaded on first use to keep startup light
+
+        return archive.connect(self.path, SCHEMA)
+
+    def start(self, every=1, endpoint=None, seconds=DEFAULT_SECONDS, interval=DEFAULT_INTERVAL):
+        """Starts a new profile in every worker, discarding the last one."""
+        every, seconds = max(1, int(every)), min(seconds, MAX_SECONDS)
+        run = None
+        if self.path is not None:
+            conn = self._connect()
+            with conn:
+                run = conn.execute(
+                    "INSERT INTO profiler_runs (enabled, every, endpoint, interval, until) "
+                    "VALUES (1, ?, ?, ?, ?)",
+                    (every, endpoint or None, interval, time.time() + seconds),
+                ).lastrowid
+                for table in ("profiler_workers", "profiler_stacks"):
+                    conn.execute(f"DELETE FROM {table} WHERE run < ?", (run,))
+                conn.execute("DELETE FROM profiler_runs WHERE id < ?", (run,))
+        self._start(run, every, endpoint, seconds, interval)
+
+    def _start(self, run, every, endpoint, seconds, interval):
+        with self.lock:
+            self.run = run
+            self.every = every
+            self.endpoint = endpoint or None
+            self.interval = interval
+            self.until = time.monotonic() + seconds
+            self.requests = 0
+            self.profiled = Counter()
+            self.stacks = {}
+            self.unshared = {}
+            self.active = {}
+            self.enabled = True
+            if self.switch_interval is None:
+                self.switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(interval, self.switch_interval))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """Stops the profile in every worker."""
+        if self.path is not None:
+            with self._connect() as conn:
+                conn.execute("UPDATE profiler_runs SET enabled = 0")
+        self._stop()
+
+    def _stop(self):
+        with self.lock:
+            self.enabled = False
+            self.active = {}
+            if self.switch_interval is not None:
+                sys.setswitchinterval(self.switch_interval)
+                self.switch_interval = None
+        self.share()
+
+    def poll(self, force=False):
+        """
+        Follows the shared profile, starting or stopping this worker's part in
+        it. Called on every request, it reads the database at most every
+        SHARE_SECONDS unless forced.
+        """
+        if self.path is None or not force and time.monotonic() < self.next_poll:
+            return
+        self.next_poll = time.monotonic() + SHARE_SECONDS
+        row = self._connect().execute(
+            "SELECT id, enabled, every, endpoint, interval, until FROM profiler_runs "
+            f"WHERE id = {LATEST_RUN}"
+        ).fetchone()
+        if row is None:
+            return
+        run, enabled, every, endpoint, interval, until = row
+        seconds = until - time.time()
+        if enabled and seconds > 0 and run != self.run:
+            self._start(run, every, endpoint, seconds, interval)
+        elif self.enabled and not (enabled and run == self.run):
+            self._stop()
+
+    def share(self):
+        """Publishes this worker's request counts and new samples to the database."""
+        if self.path is None:
+            return
+        with self.lock:
+            run, unshared, self.unshared = self.run, self.unshared, {}
+            requests, profiled = self.requests, dict(self.profiled)
+        if run is None:
+            return
+        conn = self._connect()
+        with conn:
+            if requests:  # Workers only answering the admin routes have nothing to report
+                conn.execute(
+                    "INSERT OR REPLACE INTO profiler_workers (run, pid, requests, profiled) "
+                    "VALUES (?, ?, ?, ?)",
+                    (run, os.getpid(), requests, json.dumps(profiled)),
+                )
+            conn.executemany(
+                "INSERT INTO profiler_stacks (run, endpoint, stack, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (run, endpoint, stack) DO UPDATE SET count = count + excluded.count",
+                [
+                    (run, endpoint, stack, count)
+                    for endpoint, stacks in unshared.items()
+                    for stack, count in stacks.items()
+                ],
+            )
+
+    def begin(self, endpoint):
+        """Called as a request starts; decides whether it is profiled."""
+        if not self.enabled:
+            return
+        if time.monotonic() >= self.until:
+            self._stop()
+            return
+        with self.lock:
+            self.requests += 1
+            if self.endpoint is not None:
+                chosen = endpoint == self.endpoint
+            else:
+                chosen = self.requests % self.every == 0
+            if chosen:
+                self.active[threading.get_ident()] = endpoint
+                self.profiled[endpoint] += 1
+
+    def end(self):
+        """Called as a request finishes, after its response and session are written."""
+        if self.active:
+            with self.lock:
+                self.active.pop(threading.get_ident(), None)
+
+    def sample(self):
+        """Records the current stack of every request being profiled."""
+        frames = sys._current_frames()
+        with self.lock:
+            for thread_id, endpoint in self.active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stack = fold_stack(frame)
+                    self.stacks.setdefault(endpoint, Counter())[stack] += 1
+                    if self.path is not None:
+                        self.unshared.setdefault(endpoint, Counter())[stack] += 1
+
+    def _run(self):
+        next_share = time.monotonic() + SHARE_SECONDS
+        while True:
+            with self.lock:
+                if not self.enabled:
+                    self.thread = None
+                    return
+                interval = self.interval
+            time.sleep(interval)
+            if time.monotonic() >= self.until:
+                self._stop()
+                continue
+            self.sample()
+            if self.path is not None and time.monotonic() >= next_share:
+                # Also stops a worker without requests once another stops the profile
+                next_share = time.monotonic() + SHARE_SECONDS
+                self.share()
+                self.poll()
+
+    def status(self):
+        """The profile's settings and counts, merged across workers if shared."""
+        self.poll(force=True)
+        self.share()
+        with self.lock:
+            status = {
+                "enabled": self.enabled,
+                "every": self.every,
+                "endpoint": self.endpoint,
+                "interval_ms": self.interval * 1000,
+                "seconds_left": max(0.0, self.until - time.monotonic()) if self.enabled else 0,
+                "requests": self.requests,
+                "profiled": dict(self.profiled),
+                "samples": {e: sum(c.values()) for e, c in self.stacks.items()},
+                "pid": os.getpid(),  # Of the worker answering
+            }
+        if self.path is not None:
+            conn = self._connect()
+            workers = {
+                pid: {"requests": requests, "profiled": json.loads(profiled)}
+                for pid, requests, profiled in conn.execute(
+                    f"SELECT pid, requests, profiled FROM profiler_workers WHERE run = {LATEST_RUN}"
+                )
+            }
+            profiled = Counter()
+            for worker in workers.values():
+                profiled.update(worker["profiled"])
+            status["workers"] = workers
+            status["requests"] = sum(w["requests"] for w in workers.values())
+            status["profiled"] = dict(profiled)
+            status["samples"] = dict(
+                conn.execute(
+                    "SELECT endpoint, sum(count) FROM profiler_stacks "
+                    f"WHERE run = {LATEST_RUN} GROUP BY endpoint"
+                )
+            )
+        return status
+
+    def folded(self, endpoint=None):
+        """The sampled stacks in folded format, each prefixed with its endpoint."""
+        if self.path is not None:
+            self.poll(force=True)
+            self.share()
+            stacks = {}
+            for name, stack, count in self._connect().execute(
+                f"SELECT endpoint, stack, count FROM profiler_stacks WHERE run = {LATEST_RUN}"
+            ):
+                stacks.setdefault(name, Counter())[stack] = count
+        else:
+            with self.lock:
+                stacks = {e: Counter(c) for e, c in self.stacks.items()}
+        lines = []
+        for name in sorted(stacks):
+            if endpoint is not None and name != endpoint:
+                continue
+            for stack, count in stacks[name].most_common():
+                lines.append(f"{name};{stack} {count}")
+        return "\n".join(lines) + ("\n" if lines else "")
@@ -0,0 +1,240 @@
+"""
+Replays every archived game through the current rules and reports the games
+that come out differently: another winner, other final scores, or a dart
+thrown by another player or from another score than was recorded. Run it
+after changing the rules in app.py to see which past games were affected.
+
+Games are split into chunks by rowid and replayed across a process pool,
+each worker reading its chunk from its own read-only connection. The report
+ends with the replay rate, so the tool doubles as a benchmark of the rules:
+
+    python rescore.py [--workers 4] [--chunk-size 500] [--source live] [--json]
+
+It exits with status 1 when any game was scored differently or couldn't be
+replayed at all (e.g. a dart no board can score).
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import time
+from collections import Counter, defaultdict
+
+import archive
+
+CHUNK_SIZE = 500  # Games per task sent to a worker
+MAX_LISTED = 20  # Differing games listed in the report
+RESULT_FIELDS = ("winner", "team1_score", "team2_score")
+
+
+def _rules():
+    """The rules engine under test: app.py's own scoring functions."""
+    # Replaying needs no sessions, so a throwaway key stops app.py warning about it
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(24))
+    import app  # Loaded on first use (in each worker) to keep startup light
+
+    return app
+
+
+def _open(path):
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def replay_game(rules, game, darts):
+    """
+    Replays one game's darts, each (player, base_score, multiplier, score_before),
+    on a fresh state. Returns the differences from what was recorded, as
+    {"field", "dart", "recorded", "replayed"} dicts; only the first dart that
+    differs is reported, as every later one would too.
+    """
+    state = {"teams_mode": bool(game["teams_mode"])}
+    for i in range(1, 5):
+        if game[f"player{i}_name"]:
+            state[f"player{i}_name"] = game[f"player{i}_name"]
+    rules._start_game(state, game["mode"])
+    target_mode = game["mode"] == "around_the_world"
+
+    diffs = []
+    for dart, (player, base_score, multiplier, score_before) in enumerate(darts):
+        if state["game_over"]:
+            diffs.append(
+                {"field": "darts", "dart": dart, "recorded": len(darts), "replayed": dart}
+            )
+            break
+        if not diffs:
+            team = 1 if state["current_player"] in (1, 3) else 2
+            before = state[f"team{team}_target" if target_mode else f"team{team}_score"]
+            if player != state["current_player"]:
+                diffs.append(
+                    {"field": "player", "dart": dart, "recorded": player,
+                     "replayed": state["current_player"]}
+                )
+            elif score_before is not None and score_before != before:
+                diffs.append(
+                    {"field": "score_before", "dart": dart, "recorded": score_before,
+                     "replayed": before}
+                )
+        rules._apply_throw(state, base_score, multiplier)
+
+    for field in RESULT_FIELDS:
+        # Imported games may not have recorded their result
+        if game[field] is not None and game[field] != state.get(field):
+            diffs.append(
+                {"field": field, "dart": None, "recorded": game[field],
+                 "replayed": state.get(field)}
+            )
+    return diffs
+
+
+def _empty_report():
+    return {"games": 0, "darts": 0, "skipped": 0, "differing": 0, "invalid": 0,
+            "fields": Counter(), "listed": [], "invalid_listed": []}
+
+
+def _merge(report, part):
+    for key in ("games", "darts", "skipped", "differing", "invalid"):
+        report[key] += part[key]
+    report["fields"].update(part["fields"])
+    for key in ("listed", "invalid_listed"):
+        report[key].extend(part[key][: MAX_LISTED - len(report[key])])
+
+
+def rescore_chunk(path, first_rowid, last_rowid, source=None):
+    """Replays the games with rowids in [first_rowid, last_rowid]; returns a partial report."""
+    rules = _rules()
+    where = "g.rowid BETWEEN ? AND ?" + (" AND g.source = ?" if source else "")
+    params = (first_rowid, last_rowid) + ((source,) if source else ())
+    conn = _open(path)
+    try:
+        games = conn.execute(
+            "SELECT id, mode, teams_mode, player1_name, player2_name, player3_name, "
+            f"player4_name, winner, team1_score, team2_score, source FROM games g WHERE {where} "
+            "ORDER BY g.rowid",
+            params,
+        ).fetchall()
+        darts = defaultdict(list)
+        for game_id, *dart in conn.execute(
+            "SELECT t.game_id, t.player, t.base_score, t.multiplier, t.score_before "
+            f"FROM games g JOIN throws t ON t.game_id = g.id WHERE {where} "
+            "ORDER BY g.rowid, t.dart",
+            params,
+        ):
+            darts[game_id].append(dart)
+    finally:
+        conn.close()
+
+    report = _empty_report()
+    columns = ("id", "mode", "teams_mode", "player1_name", "player2_name", "player3_name",
+               "player4_name", "winner", "team1_score", "team2_score", "source")
+    for row in games:
+        game = dict(zip(columns, row))
+        if game["mode"] not in rules.VALID_MODES:
+            report["skipped"] += 1  # Another scorer's game type
+            continue
+        game_darts = darts.get(game["id"], [])
+        try:
+            diffs = replay_game(rules, game, game_darts)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            # A dart the rules refuse (e.g. one imported as T25); the rest go on
+            report["invalid"] += 1
+            if len(report["invalid_listed"]) < MAX_LISTED:
+                report["invalid_listed"].append(
+                    {"game_id": game["id"], "mode": game["mode"], "source": game["source"],
+                     "error": repr(e)}
+                )
+            continue
+        report["games"] += 1
+        report["darts"] += len(game_darts)
+        if diffs:
+            report["differing"] += 1
+            report["fields"].update(d["field"] for d in diffs)
+            if len(report["listed"]) < MAX_LISTED:
+                report["listed"].append(
+                    {"game_id": game["id"], "mode": game["mode"], "source": game["source"],
+                     "diffs": diffs}
+                )
+    return report
+
+
+def rescore(path=archive.DEFAULT_PATH, workers=None, chunk_size=CHUNK_SIZE, source=None):
+    """Replays the whole archive across `workers` processes and returns the report."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    conn = _open(path)
+    try:
+        low, high = conn.execute("SELECT min(rowid), max(rowid) FROM games").fetchone()
+    finally:
+        conn.close()
+
+    report = _empty_report()
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if low is not None:
+        # Workers are started clean rather than forked, as the caller (e.g. the
+        # app's tests) may be running threads that hold locks
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(rescore_chunk, path, first, min(first + chunk_size - 1, high), source)
+                for first in range(low, high + 1, chunk_size)
+            ]
+            for future in as_completed(futures):
+                _merge(report, future.result())
+    report["seconds"] = time.perf_counter() - start
+    report["workers"] = workers
+    report["fields"] = dict(report["fields"])
+    return report
+
+
+def _describe(diff):
+    where = f"dart {diff['dart']} " if diff["dart"] is not None else ""
+    return f"{where}{diff['field']}: recorded {diff['recorded']}, replayed {diff['replayed']}"
+
+
+def print_report(report, out=sys.stdout):
+    seconds = max(report["seconds"], 1e-9)
+    print(
+        f"Replayed {report['games']} games ({report['darts']} darts) in {seconds:.1f}s "
+        f"with {report['workers']} workers: {report['games'] / seconds:.0f} games/s, "
+        f"{report['darts'] / seconds:.0f} darts/s",
+        file=out,
+    )
+    if report["skipped"]:
+        print(f"Skipped {report['skipped']} games in modes these rules don't play", file=out)
+    if report["invalid"]:
+        print(f"{report['invalid']} games could not be replayed", file=out)
+        for game in report["invalid_listed"]:
+            print(f"  {game['game_id']} ({game['mode']}, {game['source']}): {game['error']}",
+                  file=out)
+    print(f"{report['differing']} games scored differently", file=out)
+    for field, count in sorted(report["fields"].items()):
+        print(f"  {field}: {count}", file=out)
+    for game in report["listed"]:
+        print(f"{game['game_id']} ({game['mode']}, {game['source']})", file=out)
+        for diff in game["diffs"]:
+            print(f"  {_describe(diff)}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay archived games through the current rules.")
+    parser.add_argument("--db", default=archive.DEFAULT_PATH, help="archive database path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="games per task")
+    parser.add_argument("--source", help="only games from this source, e.g. live")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = rescore(args.db, args.workers, args.chunk_size, args.source)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 1 if report["differing"] or report["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
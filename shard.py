@@ -0,0 +1,340 @@
+"""
+Runs the scorer sharded by game: one single-worker backend per core, with a
+router in front that sends every request for a game to the same backend.
+
+Each backend keeps its games in memory (DARTS_SESSION_STORE=memory), so a
+dart is applied to a state that is already loaded, with no cookie decoding
+and no locking shared with other processes. The router picks the backend
+by consistent hashing of the game cookie. If a backend can't be reached, its
+games go to the next backend on the ring, which carries on from the signed
+cookie; when it is back, only those games return to it. A request the
+backend may already have applied (a POST that timed out, say) is not sent
+anywhere else, so a dart is never scored twice. A batch of hits from
+auto-scoring boards (/api/ingest) is split by board, as each board's game
+lives on the backend owning the board.
+
+    python shard.py --workers 4 --bind 0.0.0.0:5054
+
+The router can also be run on its own, in front of backends started
+elsewhere, with the backend addresses in DARTS_SHARDS:
+
+    DARTS_SHARDS=127.0.0.1:5101,127.0.0.1:5102 gunicorn -k gthread --threads 64 "shard:create_router()"
+
+Give each such backend the same DARTS_SHARDS and its own address in
+DARTS_SHARD, so that on a restart it recovers only its own saved games.
+"""
+
+import argparse
+import bisect
+import hashlib
+import http.client
+import json
+import os
+import secrets
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import ingest
+
+GAME_COOKIE_NAME = "darts_game"  # A test checks it matches app.py's
+# Points per backend on the ring; more points spread games more evenly
+VIRTUAL_NODES = 100
+# How long a backend that refused a connection is skipped before it is retried
+RETRY_SECONDS = 5.0
+BACKEND_TIMEOUT = 10.0
+# Requests that can be sent again after a backend got them without changing the outcome
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+STREAM_CHUNK = 64 * 1024
+INGEST_PATH = "/api/ingest"
+BASE_PORT = 5101
+# Headers that belong to one connection and must not be forwarded
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+}
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping game keys to nodes, skipping nodes marked down."""
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        self.nodes = list(nodes)
+        points = sorted(
+            (_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes)
+        )
+        self.hashes = [h for h, _ in points]
+        self.owners = [node for _, node in points]
+        self.down_until = {}
+
+    def mark_down(self, node, seconds=RETRY_SECONDS):
+        self.down_until[node] = time.monotonic() + seconds
+
+    def is_up(self, node):
+        return self.down_until.get(node, 0) <= time.monotonic()
+
+    def candidates(self, key):
+        """Yields each distinct node in ring order from the key's position, live ones first."""
+        start = bisect.bisect(self.hashes, _hash(key))
+        seen, down = [], []
+        for i in range(len(self.owners)):
+            node = self.owners[(start + i) % len(self.owners)]
+            if node in seen or node in down:
+                continue
+            if self.is_up(node):
+                seen.append(node)
+                yield node
+            else:
+                down.append(node)
+        yield from down  # Try them anyway rather than fail the request
+
+    def node_for(self, key):
+        return next(self.candidates(key))
+
+
+class BackendUnavailable(Exception):
+    """The request didn't reach the backend, or may safely be sent to it again."""
+
+
+def _stream(conn, response):
+    """Passes a backend's response body on as it arrives, e.g. a long NDJSON export."""
+    try:
+        while True:
+            chunk = response.read1(STREAM_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if not response.isclosed():
+            conn.close()  # The client went away mid-body; the rest can't be read later
+
+
+class Router:
+    """WSGI app proxying each request to the backend that owns its game."""
+
+    def __init__(self, backends):
+        self.ring = HashRing(backends)
+        self.local = threading.local()
+
+    def _connection(self, backend):
+        connections = getattr(self.local, "connections", None)
+        if connections is None:
+            connections = self.local.connections = {}
+        conn = connections.get(backend)
+        if conn is None:
+            host, _, port = backend.rpartition(":")
+            conn = connections[backend] = http.client.HTTPConnection(
+                host, int(port), timeout=BACKEND_TIMEOUT
+            )
+        elif conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            # A kept-alive connection with something to read was closed by the
+            # backend; reconnect rather than find out after sending a POST
+            conn.close()
+        return conn
+
+    def _forward(self, conn, method, path, headers, body):
+        """
+        Sends a request over a backend connection and returns its response. Raises
+        BackendUnavailable when the request may go to another backend: it never
+        reached this one, or its method is idempotent. Any other failure is
+        raised as is, as the backend may have applied the request.
+        """
+        for attempt in range(2):  # Reconnect once, in case the connection went stale
+            try:
+                conn.request(method, path, body=body, headers=headers)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if attempt:
+                    raise BackendUnavailable() from e
+                continue
+            try:
+                return conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if method not in IDEMPOTENT_METHODS:
+                    raise
+                if attempt:
+                    raise BackendUnavailable() from e
+
+    def __call__(self, environ, start_response):
+        cookies = environ.get("HTTP_COOKIE", "")
+        key = _game_key(cookies)
+        new_key = None
+        if key is None:
+            # Name the game here, so its first request already goes to its shard
+            key = new_key = secrets.token_hex(16)
+            cookies = f"{cookies}; {GAME_COOKIE_NAME}={key}" if cookies else f"{GAME_COOKIE_NAME}={key}"
+
+        headers = {
+            name[5:].replace("_", "-").title(): value
+            for name, value in environ.items()
+            if name.startswith("HTTP_") and name[5:].replace("_", "-").lower() not in HOP_BY_HOP
+        }
+        headers["Cookie"] = cookies
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else None
+        path = environ.get("PATH_INFO", "/")
+        if environ.get("QUERY_STRING"):
+            path += "?" + environ["QUERY_STRING"]
+
+        method = environ["REQUEST_METHOD"]
+        if method == "POST" and environ.get("PATH_INFO") == INGEST_PATH:
+            status, response_headers, content = self._ingest(key, path, headers, body)
+        else:
+            status, response_headers, content = self._proxy(key, method, path, headers, body)
+        if new_key and not any(
+            name.lower() == "set-cookie" and value.startswith(GAME_COOKIE_NAME + "=")
+            for name, value in response_headers
+        ):
+            response_headers.append(
+                ("Set-Cookie", f"{GAME_COOKIE_NAME}={key}; HttpOnly; Path=/; SameSite=Lax")
+            )
+        start_response(status, response_headers)
+        return content
+
+    def _proxy(self, key, method, path, headers, body):
+        """Sends a request to the backend owning `key`; returns (status, headers, body)."""
+        for backend in self.ring.candidates(key):
+            conn = self._connection(backend)
+            try:
+                response = self._forward(conn, method, path, headers, body)
+            except BackendUnavailable:
+                self.ring.mark_down(backend)
+                continue
+            except TimeoutError:
+                return _error("504 Gateway Timeout", "The scorer backend did not answer in time.")
+            except (OSError, http.client.HTTPException):
+                return _error("502 Bad Gateway", "The scorer backend did not answer.")
+            response_headers = [
+                (name, value)
+                for name, value in response.getheaders()
+                if name.lower() not in HOP_BY_HOP
+            ]
+            response_headers.append(("X-Darts-Shard", backend))
+            return f"{response.status} {response.reason}", response_headers, _stream(conn, response)
+        return _error("502 Bad Gateway", "No scorer backend is available.")
+
+    def _ingest(self, key, path, headers, body):
+        """
+        Hits are scored into their board's game, which lives on the backend
+        owning the board's key, so a batch holding several boards' hits is
+        split by board and the backends' replies are added up.
+        """
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            data = None
+        events = data.get("events") if isinstance(data, dict) else data
+        if not isinstance(events, list) or len(events) > ingest.MAX_INGEST_BATCH:
+            return self._proxy(key, "POST", path, headers, body)  # For the backend to refuse
+        batches = {}
+        for event in events:
+            board = event.get("board") if isinstance(event, dict) else None
+            board_key = key if board is None else ingest.BOARD_KEY_PREFIX + str(board)
+            batches.setdefault(board_key, []).append(event)
+        if len(batches) <= 1:
+            return self._proxy(next(iter(batches), key), "POST", path, headers, body)
+
+        headers = {**headers, "Content-Type": "application/json"}
+        merged = {"accepted": 0, "rejected": {}, "boards": {}}
+        for board_key, batch in batches.items():
+            status, response_headers, content = self._proxy(
+                board_key, "POST", path, headers, json.dumps({"events": batch}).encode()
+            )
+            content = b"".join(content)
+            if not status.startswith("200"):
+                return status, response_headers, [content]
+            reply = json.loads(content)
+            merged["accepted"] += reply["accepted"]
+            for reason, count in reply["rejected"].items():
+                merged["rejected"][reason] = merged["rejected"].get(reason, 0) + count
+            merged["boards"].update(reply["boards"])
+        return "200 OK", [("Content-Type", "application/json")], [json.dumps(merged).encode()]
+
+
+def _error(status, message):
+    return status, [("Content-Type", "text/plain")], [f"{message}\n".encode()]
+
+
+def _game_key(cookie_header):
+    """Returns the game key from a Cookie header, or None."""
+    for part in cookie_header.split(";"):
+        name, _, value = part.strip().partition("=")
+        if name == GAME_COOKIE_NAME and value:
+            return value.partition(".")[0]
+    return None
+
+
+def create_router(backends=None):
+    """Builds the router for the given backends, or those listed in DARTS_SHARDS."""
+    if backends is None:
+        backends = [b for b in os.environ.get("DARTS_SHARDS", "").split(",") if b]
+    if not backends:
+        raise ValueError("No backends given; set DARTS_SHARDS to host:port,host:port,...")
+    return Router(backends)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the scorer sharded by game.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bind", default="0.0.0.0:5054", help="address the router listens on")
+    parser.add_argument("--base-port", type=int, default=BASE_PORT, help="port of the first backend")
+    parser.add_argument("--router-workers", type=int, default=1)
+    parser.add_argument("--router-threads", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    backends = [f"127.0.0.1:{args.base_port + i}" for i in range(args.workers)]
+    # Backends must share a secret key to carry on each other's games from the cookie
+    backend_env = dict(
+        os.environ,
+        DARTS_SESSION_STORE="memory",
+        SECRET_KEY=os.environ.get("SECRET_KEY") or secrets.token_hex(24),
+    )
+    # Each backend is its own Gunicorn master with one worker, so a crashed
+    # worker is restarted by its master on the same port.
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py",
+             "--workers", "1", "--bind", backend, "app:app"],
+            cwd=here,
+            env=dict(backend_env, DARTS_SHARD=backend, DARTS_SHARDS=",".join(backends)),
+        )
+        for backend in backends
+    ]
+    processes.append(
+        subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--workers", str(args.router_workers),
+             "--worker-class", "gthread", "--threads", str(args.router_threads),
+             "--bind", args.bind, "shard:create_router()"],
+            cwd=here,
+            env=dict(os.environ, DARTS_SHARDS=",".join(backends)),
+        )
+    )
+
+    def stop(*_):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    stop()
+    for process in processes:
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,806 @@
+document.addEventListener('DOMContentLoaded', () => {
+    let currentMultiplier = 1;
+    let currentState = {}; // Store the latest state globally for easy access
+    let activeMultiplierButton = null;
+    let isGameRunning = true;
+
+    const team1Board = document.getElementById('team1_board');
+    const team1Score = document.getElementById('team1_score');
+    const team2Board = document.getElementById('team2_board');
+    const team2Score = document.getElementById('team2_score');
+
+    const p1NameInput = document.getElementById('p1_name_input');
+    const p2NameInput = document.getElementById('p2_name_input');
+    const p3NameInput = document.getElementById('p3_name_input');
+    const p4NameInput = document.getElementById('p4_name_input');
+
+    const messageBar = document.getElementById('message_bar');
+    const turnDisplay = document.getElementById('current_turn_display');
+    const checkoutContainer = document.getElementById('checkout_container');
+    const checkoutSuggestions = document.getElementById('checkout_suggestions');
+    const turnHistoryLog = document.getElementById('turn_history_log');
+
+    const x01Scoreboard = document.getElementById('x01_scoreboard');
+    const cricketScoreboard = document.getElementById('cricket_scoreboard');
+
+
+    const btnDouble = document.getElementById('btn_double');
+    const btnTriple = document.getElementById('btn_triple');
+    const btnUndo = document.getElementById('btn_undo');
+    const btnBull = document.getElementById('btn_bull');
+    const btnOuterBull = document.querySelector('.score-btn[data-score="25"]');
+    const btnMiss = document.querySelector('.score-btn[data-score="0"]');
+    const btnNewGame = document.getElementById('newGameBtn');
+    const gameModeSelect = document.getElementById('gameModeSelect');
+    const statsBtn = document.getElementById('statsBtn');
+    const statsModal = document.getElementById('statsModal');
+    const closeStatsBtn = document.getElementById('closeStatsBtn');
+    const teamsModeBtn = document.getElementById('teamsModeBtn');
+
+    // --- Offline-first scoring ---
+    // Throws are scored locally with the server's rule tables (/api/rules),
+    // queued in IndexedDB and synced to /api/score/batch in sequence order.
+    // The last rules and acknowledged state are kept there too, so the game
+    // still opens when the page is reloaded offline.
+    // The server skips sequence numbers it has already applied, so a batch
+    // can be resent safely after a dropped response. Sequence numbers are per
+    // browser, so the server tracks them by this browser's client id; other
+    // scorers bound to the same board have their own.
+    let rules = null;
+    let serverState = null; // Last state acknowledged by the server
+    let pendingThrows = []; // Throws not yet acknowledged, in sequence order
+    let nextSeq = 1;
+    let syncPromise = null;
+    let retryTimer = null;
+    let retryDelay = 1000;
+    let batchLimit = null; // 1 while looking for the throw in a batch the server refused
+    const BOARD_POLL_MS = 1000; // How often a scorer bound to an auto-scoring board refreshes
+    const clientId = localStorage.getItem('darts_client_id') || (() => {
+        const bytes = crypto.getRandomValues(new Uint8Array(8));
+        const id = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+        localStorage.setItem('darts_client_id', id);
+        return id;
+    })();
+
+    // The last of this browser's sequence numbers the server has applied
+    function ackedSeq(state) {
+        return (state.last_seqs || {})[clientId] || 0;
+    }
+
+    const dbPromise = new Promise((resolve, reject) => {
+        const request = indexedDB.open('darts', 2);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            if (!db.objectStoreNames.contains('throws')) db.createObjectStore('throws', { keyPath: 'seq' });
+            if (!db.objectStoreNames.contains('snapshots')) db.createObjectStore('snapshots');
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+    function run(storeName, mode, fn) {
+        return dbPromise.then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction(storeName, mode);
+            const request = fn(tx.objectStore(storeName));
+            tx.oncomplete = () => resolve(request.result);
+            tx.onerror = () => reject(tx.error);
+        }));
+    }
+    const throwQueue = {
+        add: item => run('throws', 'readwrite', store => store.put(item)),
+        all: () => run('throws', 'readonly', store => store.getAll()),
+        remove: seq => run('throws', 'readwrite', store => store.delete(seq)),
+        ackUpTo: seq => run('throws', 'readwrite', store => store.delete(IDBKeyRange.upperBound(seq))),
+    };
+    const snapshots = {
+        get: key => run('snapshots', 'readonly', store => store.get(key)),
+        put: (key, value) => run('snapshots', 'readwrite', store => store.put(value, key)),
+    };
+
+    // Every state the server acknowledges is kept for the next offline reload
+    function acceptState(state) {
+        serverState = state;
+        snapshots.put('state', state).catch(() => {});
+    }
+
+    // Fetches rules or state, falling back to the copy kept from the last visit
+    async function fetchOrCached(url, key) {
+        try {
+            const response = await fetch(url);
+            if (!response.ok) throw new Error(`Could not load ${url}`);
+            const data = await response.json();
+            snapshots.put(key, data).catch(() => {});
+            return { data, cached: false };
+        } catch (err) {
+            const data = await snapshots.get(key);
+            if (data === undefined) throw err;
+            return { data, cached: true };
+        }
+    }
+
+    function throwRepr(baseScore, multiplier) {
+        if (baseScore === 0) return 'MISS';
+        if (baseScore === 25) return multiplier === 2 ? 'DB' : 'SB';
+        const prefix = { 1: 'S', 2: 'D', 3: 'T' }[multiplier] || '';
+        return `${prefix}${baseScore}`;
+    }
+
+    function targetDisplay(target) {
+        return target === 25 ? 'Bull' : String(target);
+    }
+
+    function checkoutFor(score, dartsLeft) {
+        if (score > 1 && score <= 170) {
+            const all = rules.checkouts[String(score)] || [];
+            return all.filter(s => s.split(',').length <= dartsLeft);
+        }
+        return [];
+    }
+
+    function logTurn(state, playerName, label) {
+        const total = state.turn_scores.reduce((sum, t) => sum + t.score, 0);
+        const reprs = state.turn_scores.map(t => t.repr).join(' ');
+        state.turn_log.unshift(`${playerName}: ${label === undefined ? total : label} (${reprs})`);
+    }
+
+    // Mirrors _next_player() in app.py
+    function nextPlayer(state) {
+        if (!state.is_bust_turn && state.turn_scores.length > 0) {
+            logTurn(state, state[`player${state.current_player}_name`]);
+        }
+        if (state.teams_mode) {
+            state.current_player = (state.current_player % 4) + 1;
+        } else {
+            state.current_player = state.current_player === 1 ? 2 : 1;
+        }
+        state.turn_scores = [];
+
+        const playerName = state[`player${state.current_player}_name`];
+        const team = [1, 3].includes(state.current_player) ? 1 : 2;
+        if (state.game_mode === 'around_the_world') {
+            if (!state.is_bust_turn) {
+                state.message = `${playerName} to throw for ${targetDisplay(state[`team${team}_target`])}.`;
+            }
+            state.checkout_suggestions = [];
+        } else {
+            state.checkout_suggestions = checkoutFor(state[`team${team}_score`], rules.darts_per_turn);
+            if (!state.is_bust_turn) state.message = `${playerName} to throw.`;
+        }
+        state.is_bust_turn = false;
+    }
+
+    // Mirrors _apply_throw() in app.py
+    function applyThrow(state, baseScore, multiplier) {
+        if (state.game_over) return;
+        const score = baseScore * multiplier;
+        const repr = throwRepr(baseScore, multiplier);
+        const playerName = state[`player${state.current_player}_name`];
+        const team = [1, 3].includes(state.current_player) ? 1 : 2;
+        const turnOver = () => state.turn_scores.length === rules.darts_per_turn;
+
+        if (state.game_mode === 'cricket') {
+            const teamKey = `team${team}`;
+            const opponentKey = team === 1 ? 'team2' : 'team1';
+            state.turn_scores.push({ score, repr });
+            if (rules.cricket_numbers.includes(baseScore)) {
+                const hits = baseScore === 25 && multiplier === 2 ? 2 : multiplier;
+                const key = String(baseScore);
+                let marks = state.cricket_marks[teamKey][key];
+                const opponentClosed = state.cricket_marks[opponentKey][key] >= 3;
+                let points = 0;
+                for (let i = 0; i < hits; i++) {
+                    if (marks < 3) {
+                        marks += 1;
+                    } else if (!opponentClosed) {
+                        state[`${teamKey}_score`] += baseScore;
+                        points += baseScore;
+                    }
+                }
+                state.message = points > 0 ? `${playerName} scored ${points}!` : `${playerName} marked ${repr}.`;
+                state.cricket_marks[teamKey][key] = marks;
+
+                const allClosed = Object.values(state.cricket_marks[teamKey]).every(v => v >= 3);
+                if (allClosed && state[`${teamKey}_score`] >= state[`${opponentKey}_score`]) {
+                    state.game_over = true;
+                    state.winner = team;
+                    state.message = `GAME SHOT! ${playerName} wins Cricket for Team ${team}!`;
+                    logTurn(state, playerName);
+                    return;
+                }
+            } else {
+                state.message = `${playerName} threw ${repr} (Miss).`;
+            }
+            if (turnOver()) nextPlayer(state);
+            return;
+        }
+
+        if (state.game_mode === 'around_the_world') {
+            const targetKey = `team${team}_target`;
+            const target = state[targetKey];
+            state.turn_scores.push({ score, repr });
+            if (baseScore === target) {
+                if (target === 25) {
+                    state.game_over = true;
+                    state.winner = team;
+                    state.message = `GAME SHOT! ${playerName} wins Around the World!`;
+                    return;
+                }
+                const next = target === 20 ? 25 : target + 1;
+                state[targetKey] = next;
+                state.message = `${playerName} hit ${target}! Now on ${targetDisplay(next)}.`;
+            } else {
+                state.message = `${playerName} needs ${targetDisplay(target)}.`;
+            }
+            if (turnOver()) nextPlayer(state);
+            return;
+        }
+
+        // X01
+        const scoreKey = `team${team}_score`;
+        const remaining = state[scoreKey] - score;
+        const isBust = remaining < 0 || remaining === 1 ||
+            (state.win_on_double && remaining === 0 && multiplier !== 2);
+        if (isBust) {
+            // Within a turn every scored dart was subtracted, so adding them back gives the turn start
+            const turnStart = state[scoreKey] + state.turn_scores.reduce((sum, t) => sum + t.score, 0);
+            state.turn_scores.push({ score, repr });
+            logTurn(state, playerName, 'BUST');
+            state[scoreKey] = turnStart;
+            state.message = `${playerName} BUST! Score reset for turn.`;
+            state.is_bust_turn = true;
+            nextPlayer(state);
+            return;
+        }
+        state.turn_scores.push({ score, repr });
+        if (remaining === 0 && multiplier === 2) {
+            state[scoreKey] = 0;
+            state.game_over = true;
+            state.winner = team;
+            state.message = `GAME SHOT! ${playerName} wins for Team ${team}!`;
+            logTurn(state, playerName);
+            return;
+        }
+        state[scoreKey] = remaining;
+        state.checkout_suggestions = checkoutFor(remaining, rules.darts_per_turn - state.turn_scores.length);
+        state.message = `${playerName} scored ${score}.`;
+        if (turnOver()) nextPlayer(state);
+    }
+
+    // Render the acknowledged server state with any queued throws applied on top
+    function render() {
+        const state = JSON.parse(JSON.stringify(serverState));
+        pendingThrows.forEach(t => applyThrow(state, t.base_score, t.multiplier));
+        updateUI(state);
+        if (pendingThrows.length > 0) {
+            btnUndo.disabled = false;
+            btnUndo.classList.remove('opacity-50');
+        }
+    }
+
+    // A refused batch would be refused again on every retry and hold up every
+    // later throw, so its throws are resent one by one and the refused one dropped
+    async function dropRefusedThrow(response, refused) {
+        const data = await response.json().catch(() => ({}));
+        pendingThrows = pendingThrows.filter(t => t.seq !== refused.seq);
+        await throwQueue.remove(refused.seq);
+        batchLimit = null;
+        render();
+        const repr = throwRepr(refused.base_score, refused.multiplier);
+        messageBar.textContent = `${repr} was not recorded: ${data.error || 'refused by the server.'}`;
+    }
+
+    async function sendBatch() {
+        if (pendingThrows.length === 0) return true;
+        const batch = pendingThrows.slice(0, batchLimit || rules.max_batch_size);
+        try {
+            const response = await fetch('/api/score/batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ client: clientId, throws: batch })
+            });
+            if (response.status >= 400 && response.status < 500) {
+                if (batch.length > 1) {
+                    batchLimit = 1;
+                } else {
+                    await dropRefusedThrow(response, batch[0]);
+                }
+                return true;
+            }
+            if (!response.ok) throw new Error('Sync failed'); // Retried: the server may recover
+            acceptState(await response.json());
+            const lastSeq = ackedSeq(serverState);
+            pendingThrows = pendingThrows.filter(t => t.seq > lastSeq);
+            await throwQueue.ackUpTo(lastSeq);
+            if (pendingThrows.length === 0) batchLimit = null;
+            retryDelay = 1000;
+            render();
+            return true;
+        } catch (err) {
+            scheduleRetry();
+            return false;
+        }
+    }
+
+    function syncQueue() {
+        if (!syncPromise) {
+            syncPromise = sendBatch().finally(() => { syncPromise = null; });
+        }
+        return syncPromise;
+    }
+
+    // Sync until the queue is empty; resolves false if the server is unreachable
+    async function flushQueue() {
+        while (pendingThrows.length > 0) {
+            if (!(await syncQueue())) return false;
+        }
+        return true;
+    }
+
+    function scheduleRetry() {
+        if (retryTimer) return;
+        retryTimer = setTimeout(() => {
+            retryTimer = null;
+            flushQueue();
+        }, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+    }
+
+    window.addEventListener('online', () => flushQueue());
+
+    // Server-side actions (undo, reset, names, settings) must see every queued throw first
+    async function postAction(url, payload, errorMessage) {
+        if (!(await flushQueue())) {
+            messageBar.textContent = 'Offline: throws are saved and will sync when the connection returns.';
+            return;
+        }
+        try {
+            const response = await fetch(url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload || {})
+            });
+            const data = await response.json();
+            if (!response.ok) {
+                render(); // Put back what the server kept, e.g. names it refused to change
+                messageBar.textContent = data.error || errorMessage;
+                return;
+            }
+            acceptState(data);
+            render();
+        } catch (err) {
+            messageBar.textContent = errorMessage;
+        }
+    }
+
+    function renderCricketBoard(state) {
+        const cricketNumbers = ['20', '19', '18', '17', '16', '15', '25']; // 25 is Bull
+        const container = document.getElementById('cricket_numbers');
+        const template = document.getElementById('cricket_row_template');
+        container.innerHTML = ''; // Clear previous state
+
+        // Update player names and scores
+        document.getElementById('cricket_p1_name').textContent = state.player1_name;
+        document.getElementById('cricket_p2_name').textContent = state.player2_name;
+        document.getElementById('cricket_p1_score').textContent = state.team1_score;
+        document.getElementById('cricket_p2_score').textContent = state.team2_score;
+
+        const marksSymbols = {
+            1: '/',
+            2: 'X',
+            3: '◎'
+        };
+
+        cricketNumbers.forEach(num => {
+            const clone = template.content.cloneNode(true);
+            const row = clone.querySelector('div');
+
+            const p1Marks = state.cricket_marks.team1[num];
+            const p2Marks = state.cricket_marks.team2[num];
+
+            const p1MarksEl = row.querySelector('.p1-marks');
+            const p2MarksEl = row.querySelector('.p2-marks');
+            const numberLabelEl = row.querySelector('.number-label');
+
+            numberLabelEl.textContent = (num === '25') ? 'Bull' : num;
+
+            p1MarksEl.textContent = marksSymbols[p1Marks] || '';
+            p2MarksEl.textContent = marksSymbols[p2Marks] || '';
+
+            // Add styling for closed numbers
+            if (p1Marks >= 3) {
+                p1MarksEl.classList.add('text-green-400');
+            }
+            if (p2Marks >= 3) {
+                p2MarksEl.classList.add('text-green-400');
+            }
+            if (p1Marks >= 3 && p2Marks >= 3) {
+                numberLabelEl.classList.add('text-red-500', 'line-through');
+            }
+
+            container.appendChild(row);
+        });
+    }
+
+    // Function to update the entire UI from a state object
+    function updateUI(state) {
+        currentState = state; // Keep a global copy of the state
+        p1NameInput.value = state.player1_name;
+        p2NameInput.value = state.player2_name;
+        p3NameInput.value = state.player3_name;
+        p4NameInput.value = state.player4_name;
+        messageBar.textContent = state.message; 
+
+        teamsModeBtn.textContent = state.teams_mode ? 'Teams: ON' : 'Teams: OFF';
+        teamsModeBtn.classList.toggle('active', state.teams_mode);
+
+        // Adjust player name panel for teams mode
+        const playerNamesContainer = document.getElementById('player_names_container');
+        const team1NamesPanel = document.getElementById('team1_names_panel');
+        const team2NamesPanel = document.getElementById('team2_names_panel');
+
+        if (state.teams_mode) {
+            team1NamesPanel.querySelector('h4').textContent = 'Team 1';
+            team2NamesPanel.querySelector('h4').textContent = 'Team 2';
+        } else {
+            // In solo mode, just rename the headers
+            team1NamesPanel.querySelector('h4').textContent = 'Player 1';
+            team2NamesPanel.querySelector('h4').textContent = 'Player 2';
+        }
+        p3NameInput.classList.toggle('hidden', !state.teams_mode); // Hide P3 if teams off
+        p4NameInput.classList.toggle('hidden', !state.teams_mode); // Hide P4 if teams off
+
+        // Show/hide scoreboards and UI elements based on game mode
+        const isCricket = state.game_mode === 'cricket';
+        const isAroundTheWorld = state.game_mode === 'around_the_world';
+
+        x01Scoreboard.classList.toggle('hidden', isCricket);
+        cricketScoreboard.classList.toggle('hidden', !isCricket);
+
+        if (isCricket) {
+            renderCricketBoard(state);
+            checkoutContainer.classList.add('hidden');
+        } else if (isAroundTheWorld) {
+            checkoutContainer.classList.add('hidden');
+            const t1Target = state.team1_target > 20 ? 'Bull' : state.team1_target;
+            const t2Target = state.team2_target > 20 ? 'Bull' : state.team2_target;
+            team1Score.textContent = t1Target;
+            team2Score.textContent = t2Target;
+            team1Score.classList.remove('text-7xl'); team1Score.classList.add('text-5xl');
+            team2Score.classList.remove('text-7xl'); team2Score.classList.add('text-5xl');
+        } else { // X01 games
+            team1Score.textContent = state.team1_score;
+            team2Score.textContent = state.team2_score;
+        }
+
+        // Clear all active states first
+        [team1Board, team2Board, p1NameInput, p2NameInput, p3NameInput, p4NameInput].forEach(el => {
+            el.classList.remove('active', 'inactive');
+        });
+
+        // Update active player highlight
+        const currentPlayerNum = state.current_player;
+        const activePlayerInput = document.getElementById(`p${currentPlayerNum}_name_input`);
+        if (activePlayerInput) {
+            activePlayerInput.classList.add('active');
+        }
+
+        // Highlight active team board
+        if (isCricket || [1, 3].includes(currentPlayerNum)) { // Team 1
+            team1Board.classList.add('active');
+            team2Board.classList.add('inactive');
+        } else { // Team 2 for X01
+            team2Board.classList.add('active');
+            team1Board.classList.add('inactive');
+        }
+
+        // Dynamically color team headers and scores
+        const isTeam1Active = [1, 3].includes(currentPlayerNum);
+        const team1Elements = [team1Board.querySelector('h2'), team1Score, document.getElementById('cricket_p1_name'), document.getElementById('cricket_p1_score'), team1NamesPanel.querySelector('h4')];
+        const team2Elements = [team2Board.querySelector('h2'), team2Score, document.getElementById('cricket_p2_name'), document.getElementById('cricket_p2_score'), team2NamesPanel.querySelector('h4')];
+
+        team1Elements.forEach(el => {
+            if (!el) return;
+            el.classList.toggle('text-sky-400', isTeam1Active);
+            el.classList.toggle('text-white', !isTeam1Active);
+        });
+
+        team2Elements.forEach(el => {
+            if (!el) return;
+            el.classList.toggle('text-amber-400', !isTeam1Active);
+            el.classList.toggle('text-white', isTeam1Active);
+            el.classList.remove('text-sky-400'); // Ensure P2 name isn't sky blue
+        });
+
+        // Update current turn display
+        turnDisplay.innerHTML = '';
+        state.turn_scores.forEach(throw_data => {
+            const scoreEl = document.createElement('span');
+            scoreEl.className = 'font-semibold';
+            scoreEl.textContent = `[${throw_data.repr}]`;
+            turnDisplay.appendChild(scoreEl);
+        });
+
+        // Update checkout suggestions
+        if (!isCricket && !isAroundTheWorld && Array.isArray(state.checkout_suggestions) && state.checkout_suggestions.length > 0) {
+            checkoutSuggestions.innerHTML = '';
+            state.checkout_suggestions.forEach(suggestion => {
+                const suggestionEl = document.createElement('span');
+                suggestionEl.className = 'font-semibold bg-black/20 px-2 py-1 rounded';
+                suggestionEl.textContent = suggestion;
+                checkoutSuggestions.appendChild(suggestionEl);
+            });
+            checkoutContainer.classList.remove('hidden');
+        } else {
+            checkoutContainer.classList.add('hidden');
+        }
+
+        // Update turn history
+        turnHistoryLog.innerHTML = '';
+        if (state.turn_log && state.turn_log.length > 0) {
+            state.turn_log.forEach(log_item => {
+                const logEl = document.createElement('div');
+                logEl.className = 'grid grid-cols-3 gap-4 items-center'; // Use grid for 3-column layout
+
+                // Regex to capture player, score, and throws separately
+                const match = log_item.match(/(.*?):\s*([\d]+|BUST)\s*(\(.*\))/);
+
+                if (match) {
+                    const playerPart = document.createElement('span');
+                    playerPart.textContent = match[1]; // e.g., "Player 1"
+
+                    const scorePart = document.createElement('span');
+                    scorePart.className = 'font-bold text-center'; // Bold and center the score
+                    scorePart.textContent = match[2]; // e.g., "60" or "BUST"
+
+                    const throwsPart = document.createElement('span');
+                    throwsPart.className = 'font-mono text-sky-300 text-right'; // Align throws to the right
+                    // Highlight any misses in red
+                    const throwsHtml = match[2].replace(/MISS/g, '<span class="text-red-500 font-semibold">MISS</span>');
+                    // The regex for throws now captures the parentheses, so we use the 3rd group
+                    throwsPart.innerHTML = match[3].replace(/MISS/g, '<span class="text-red-500 font-semibold">MISS</span>');
+
+                    logEl.appendChild(playerPart);
+                    logEl.appendChild(scorePart);
+                    logEl.appendChild(throwsPart);
+                } else {
+                    logEl.textContent = log_item; // Fallback for non-matching format
+                }
+                turnHistoryLog.appendChild(logEl);
+            });
+        }
+
+        // Handle game over
+        isGameRunning = !state.game_over;
+        if (state.game_over) {
+            messageBar.classList.add('bg-green-500/50', 'text-2xl', 'font-bold');
+            team1Board.classList.remove('active', 'inactive');
+            team2Board.classList.remove('active', 'inactive');
+            team1Board.classList.remove('border-green-400/80'); // Clear old winner
+            team2Board.classList.remove('border-green-400/80'); // Clear old winner
+            [p1NameInput, p2NameInput, p3NameInput, p4NameInput].forEach(el => el.classList.remove('active'));
+
+            if (state.winner === 1) {
+                team1Board.classList.add('border-green-400/80');
+            } else if (state.winner === 2) { // Winner is a team number
+                team2Board.classList.add('border-green-400/80');
+            }
+        } else {
+            messageBar.classList.remove('bg-green-500/50', 'text-2xl', 'font-bold');
+        }
+
+        // Enable/disable Undo and Redo buttons
+        const canUndo = state.can_undo;
+
+        btnUndo.disabled = !canUndo;
+        btnUndo.classList.toggle('opacity-50', !canUndo);
+    }
+
+    // Reset multiplier button visual state
+    function resetMultiplier() {
+        currentMultiplier = 1;
+        if (activeMultiplierButton) {
+            activeMultiplierButton.classList.remove('active');
+            activeMultiplierButton = null;
+        }
+        // Re-enable bull/miss buttons
+        [btnOuterBull, btnBull, btnMiss].forEach(btn => {
+            btn.disabled = false;
+            btn.classList.remove('opacity-50', 'cursor-not-allowed');
+        });
+    }
+
+    // Handle clicking a score button (0-20, 25)
+    function handleScoreClick(baseScore, multiplierOverride = null) {
+        if (!isGameRunning) return;
+
+        const queued = {
+            seq: nextSeq++,
+            base_score: baseScore,
+            multiplier: multiplierOverride || currentMultiplier
+        };
+        localStorage.setItem('darts_next_seq', String(nextSeq));
+
+        // Score the throw locally straight away, then queue it for the server
+        pendingThrows.push(queued);
+        render();
+        resetMultiplier();
+        throwQueue.add(queued).then(flushQueue, flushQueue);
+    }
+
+    // Handle clicking Double or Triple
+    function handleMultiplierClick(multiplier, button) {
+        if (!isGameRunning) return;
+
+        if (activeMultiplierButton === button) {
+            // Clicked the same button, so deselect it
+            resetMultiplier();
+        } else {
+            // Deselect old button, select new one
+            resetMultiplier();
+            currentMultiplier = multiplier;
+            activeMultiplierButton = button;
+            button.classList.add('active');
+            // Disable bull/miss buttons as they can't be multiplied
+            [btnOuterBull, btnBull, btnMiss].forEach(btn => {
+                btn.disabled = true;
+                btn.classList.add('opacity-50', 'cursor-not-allowed');
+            });
+        }
+    }
+
+    // Handle Undo
+    btnUndo.addEventListener('click', async () => {
+        if (sessionStorage.getItem('reloading')) return; // Prevent double clicks
+        sessionStorage.setItem('reloading', 'true');
+
+        // A throw still waiting in the queue can be dropped without asking the server
+        if (syncPromise) await syncPromise;
+        if (pendingThrows.length > 0) {
+            const dropped = pendingThrows.pop();
+            await throwQueue.remove(dropped.seq);
+            render();
+            messageBar.textContent = 'Undo successful. Last throw reverted.';
+        } else {
+            await postAction('/api/undo', {}, 'Error connecting to server.');
+        }
+        resetMultiplier();
+        sessionStorage.removeItem('reloading');
+    });
+
+    // Handle New Game
+    btnNewGame.addEventListener('click', async () => {
+        if (sessionStorage.getItem('reloading')) return;
+        sessionStorage.setItem('reloading', 'true');
+
+        const mode = gameModeSelect.value;
+        await postAction('/api/reset', { mode: mode }, 'Error connecting to server.');
+        resetMultiplier();
+        sessionStorage.removeItem('reloading');
+    });
+
+    // --- Stats Modal Logic ---
+    statsBtn.addEventListener('click', async () => {
+        statsModal.classList.remove('hidden');
+        document.getElementById('statsContent').innerHTML = '<div class="text-center p-4">Loading stats...</div>';
+
+        try {
+            await flushQueue(); // Include queued throws in the stats when possible
+            const response = await fetch('/api/stats');
+            if (!response.ok) throw new Error('Failed to load stats');
+            const stats = await response.json();
+
+            const statsContent = document.getElementById('statsContent');
+            statsContent.innerHTML = ''; // Clear loading message
+
+            Object.entries(stats).forEach(([playerName, data]) => {
+                const playerStatEl = document.createElement('div');
+                playerStatEl.className = 'p-4 bg-black/20 rounded-lg';
+                playerStatEl.innerHTML = `
+                    <h3 class="text-xl font-semibold text-amber-300">${playerName}</h3>
+                    <div class="grid grid-cols-2 gap-2 mt-2 text-lg">
+                        <div>
+                            <div class="text-sm text-gray-400">3-Dart Avg</div>
+                            <div class="font-bold text-2xl">${data.average.toFixed(2)}</div>
+                        </div>
+                        <div>
+                            <div class="text-sm text-gray-400">Darts Thrown</div>
+                            <div class="font-bold text-2xl">${data.darts_thrown}</div>
+                        </div>
+                    </div>
+                `;
+                statsContent.appendChild(playerStatEl);
+            });
+
+        } catch (err) {
+            document.getElementById('statsContent').textContent = 'Could not load statistics.';
+        }
+    });
+
+    closeStatsBtn.addEventListener('click', () => {
+        statsModal.classList.add('hidden');
+    });
+
+
+    // Handle Name Changes
+    async function handleNameChange() {
+        // Only send names relevant to the current mode
+        const payload = {
+            player1_name: p1NameInput.value,
+            player2_name: p2NameInput.value,
+            player3_name: p3NameInput.value,
+            player4_name: p4NameInput.value,
+        };
+        postAction('/api/names', payload, 'Error updating names.');
+    }
+    [p1NameInput, p2NameInput, p3NameInput, p4NameInput].forEach(input => {
+        input.addEventListener('blur', handleNameChange);
+    });
+
+    // Attach listeners to all score buttons
+    document.querySelectorAll('.score-btn:not(#btn_bull)').forEach(btn => {
+        btn.addEventListener('click', () => handleScoreClick(parseInt(btn.dataset.score, 10)));
+    });
+
+    // Attach listeners to multiplier buttons
+    btnDouble.addEventListener('click', () => handleMultiplierClick(2, btnDouble));
+    btnTriple.addEventListener('click', () => handleMultiplierClick(3, btnTriple));
+
+    // Special handler for Double Bull
+    btnBull.addEventListener('click', () => handleScoreClick(25, 2)); // baseScore 25, multiplier 2
+
+    // Handle Teams Mode Toggle
+    teamsModeBtn.addEventListener('click', async () => {
+        const payload = {
+            teams_mode: !currentState.teams_mode // Toggle the current state
+        };
+        await postAction('/api/settings', payload, 'Error updating settings.');
+    });
+
+    // Initial state load
+    async function initializeApp() {
+        try {
+            const [rulesResult, stateResult] = await Promise.all([
+                fetchOrCached('/api/rules', 'rules'),
+                fetchOrCached('/api/state', 'state')
+            ]);
+            rules = rulesResult.data;
+            serverState = stateResult.data;
+            const offline = rulesResult.cached || stateResult.cached;
+            pendingThrows = (await throwQueue.all()).filter(t => t.seq > ackedSeq(serverState));
+            // Never reuse a sequence number the server has already seen
+            const storedSeq = parseInt(localStorage.getItem('darts_next_seq') || '1', 10);
+            const queuedSeq = pendingThrows.length ? pendingThrows[pendingThrows.length - 1].seq + 1 : 1;
+            nextSeq = Math.max(storedSeq, queuedSeq, ackedSeq(serverState) + 1);
+            // Opening /?board=<name> binds this scorer to an auto-scoring board
+            const board = new URLSearchParams(window.location.search).get('board');
+            if (board && serverState.board !== board && !offline) {
+                const response = await fetch(`/api/boards/${encodeURIComponent(board)}/bind`, { method: 'POST' });
+                if (response.ok) acceptState(await response.json());
+            }
+            gameModeSelect.value = serverState.game_mode;
+            render();
+            if (offline) {
+                messageBar.textContent = 'Offline: showing the last saved game. Throws will sync when the connection returns.';
+            }
+            flushQueue();
+        } catch (err) {
+            messageBar.textContent = "Error connecting to server.";
+        }
+    }
+
+    // Darts from an auto-scoring board are scored on the server, so a bound
+    // board polls for them; unchanged polls are answered with 304s
+    setInterval(async () => {
+        if (!serverState || !serverState.board || pendingThrows.length > 0 || syncPromise) return;
+        try {
+            const response = await fetch('/api/state');
+            if (response.ok) {
+                acceptState(await response.json());
+                render();
+            }
+        } catch (err) {
+            // Offline; try again on the next tick
+        }
+    }, BOARD_POLL_MS);
+
+    initializeApp();
+});
@@ -0,0 +1,76 @@
+document.addEventListener('DOMContentLoaded', () => {
+    // Every screen polls the same shared snapshot; an unchanged one is a 304
+    const POLL_MS = 1000;
+    const MODE_NAMES = { around_the_world: 'Around the World', cricket: 'Cricket' };
+
+    const boardsGrid = document.getElementById('boards');
+    const noBoards = document.getElementById('no_boards');
+    const status = document.getElementById('status');
+    let shownVersion = null;
+
+    function element(tag, className, text) {
+        const el = document.createElement(tag);
+        if (className) el.className = className;
+        if (text !== undefined) el.textContent = text;
+        return el;
+    }
+
+    function teamScore(board, team) {
+        if (board.game_mode === 'around_the_world') {
+            const target = board[`team${team}_target`];
+            return target > 20 && target !== 25 ? 'Done' : (target === 25 ? 'Bull' : String(target));
+        }
+        return String(board[`team${team}_score`]);
+    }
+
+    function renderTeam(board, team) {
+        // Players 1 and 3 are team 1, players 2 and 4 team 2
+        const members = board.players.filter((_, i) => i % 2 === team - 1);
+        const playing = !board.game_over && (board.current_player - 1) % 2 === team - 1;
+        const panel = element('div', `flex-1 rounded-lg p-3 ${playing ? 'bg-sky-500/30 border border-sky-400/60' : 'bg-black/20'}`);
+        panel.append(
+            element('div', 'text-lg font-semibold truncate', members.join(' & ')),
+            element('div', 'text-5xl font-bold tabular-nums', teamScore(board, team)),
+        );
+        return panel;
+    }
+
+    function renderBoard(board) {
+        const card = element('section', 'glass-panel p-4 space-y-3');
+        const header = element('div', 'flex justify-between items-baseline');
+        header.append(
+            element('h2', 'text-2xl font-bold', board.board),
+            element('span', 'text-gray-400', MODE_NAMES[board.game_mode] || board.game_mode),
+        );
+        const teams = element('div', 'flex gap-3');
+        teams.append(renderTeam(board, 1), renderTeam(board, 2));
+        card.append(header, teams);
+        card.append(element('div', 'text-lg min-h-[1.75rem]', board.turn.join('  ')));
+        card.append(element('div', 'text-gray-300', board.message || ''));
+        if (board.last_turn) card.append(element('div', 'text-sm text-gray-400', `Last: ${board.last_turn}`));
+        return card;
+    }
+
+    function render(overview) {
+        boardsGrid.replaceChildren(...overview.boards.map(renderBoard));
+        noBoards.classList.toggle('hidden', overview.boards.length > 0);
+    }
+
+    async function poll() {
+        try {
+            const response = await fetch('/api/boards');
+            if (!response.ok) throw new Error(response.statusText);
+            const overview = await response.json();
+            if (overview.version !== shownVersion) {
+                shownVersion = overview.version;
+                render(overview);
+            }
+            status.textContent = '';
+        } catch (err) {
+            status.textContent = 'Reconnecting...';
+        }
+    }
+
+    poll();
+    setInterval(poll, POLL_MS);
+});
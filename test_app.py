@@ -1,12 +1,24 @@
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
 import pytest
 from app import app as flask_app
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     """Create and configure a new app instance for each test."""
     # A consistent secret key is needed for session testing
-    flask_app.config.update({"TESTING": True, "SECRET_KEY": "test-secret-key"})
+    flask_app.config.update(
+        {
+            "TESTING": True,
+            "SECRET_KEY": "test-secret-key",
+            "ARCHIVE_PATH": str(tmp_path / "darts.db"),
+        }
+    )
     yield flask_app
 
 
@@ -154,6 +166,13 @@ def test_undo_functionality(client):
     assert len(data["turn_scores"]) == 0
     assert "Undo successful" in data["message"]
 
+    # Undo reverts only the last of several throws
+    client.post("/api/score", json={"base_score": 20, "multiplier": 1})
+    client.post("/api/score", json={"base_score": 19, "multiplier": 1})
+    data = client.post("/api/undo").get_json()
+    assert data["team1_score"] == 481
+    assert data["turn_scores"] == [{"score": 20, "repr": "S20"}]
+
     # Test undo at the beginning of a game
     client.post("/api/reset", json={"mode": "501"})
     undo_response_at_start = client.post("/api/undo")
@@ -472,3 +491,1276 @@ def test_cricket_teams_mode(client):
     assert data["current_player"] == 3  # Should be P3's turn (Team 1)
     assert data["cricket_marks"]["team1"]["20"] == 1
     assert data["cricket_marks"]["team2"]["19"] == 1
+
+
+# --- Offline Sync Tests ---
+def test_rules_export(client):
+    """Test that the rule tables needed for offline scoring are exported."""
+    response = client.get("/api/rules")
+    assert response.status_code == 200
+    rules = response.get_json()
+    assert "cricket" in rules["valid_modes"]
+    assert rules["cricket_numbers"] == [20, 19, 18, 17, 16, 15, 25]
+    assert rules["darts_per_turn"] == 3
+    assert rules["checkouts"]["170"] == ["T20, T20, Bull"]
+
+
+def test_score_batch_applies_throws_in_sequence(client):
+    """Test that a batch of queued throws is applied in sequence order."""
+    client.post("/api/reset", json={"mode": "501"})
+    response = client.post(
+        "/api/score/batch",
+        json={
+            "throws": [
+                {"seq": 2, "base_score": 20, "multiplier": 1},
+                {"seq": 1, "base_score": 20, "multiplier": 3},
+                {"seq": 3, "base_score": 20, "multiplier": 1},
+            ]
+        },
+    )
+    data = response.get_json()
+    assert data["last_seq"] == 3
+    assert data["team1_score"] == 401
+    assert data["current_player"] == 2
+    assert "Player 1: 100 (T20 S20 S20)" in data["turn_log"][0]
+
+
+def test_score_batch_retry_is_idempotent(client):
+    """Test that resending an already applied batch does not apply it twice."""
+    client.post("/api/reset", json={"mode": "501"})
+    batch = {
+        "throws": [
+            {"seq": 1, "base_score": 20, "multiplier": 3},
+            {"seq": 2, "base_score": 19, "multiplier": 3},
+        ]
+    }
+    client.post("/api/score/batch", json=batch)
+    # The response was "lost", so the client resends with one new throw
+    batch["throws"].append({"seq": 3, "base_score": 18, "multiplier": 3})
+    data = client.post("/api/score/batch", json=batch).get_json()
+    assert data["last_seq"] == 3
+    assert data["team1_score"] == 501 - 60 - 57 - 54
+
+
+def test_score_batch_tracks_each_client_sharing_a_game(client):
+    """Test that scorers sharing a game don't have their throws taken for retries."""
+    client.post("/api/reset", json={"mode": "501"})
+    tablet_a = {"client": "a", "throws": [{"seq": 1, "base_score": 20, "multiplier": 3}]}
+    tablet_b = {"client": "b", "throws": [{"seq": 1, "base_score": 19, "multiplier": 3}]}
+    client.post("/api/score/batch", json=tablet_a)
+    data = client.post("/api/score/batch", json=tablet_b).get_json()
+    assert data["team1_score"] == 501 - 60 - 57
+    assert data["last_seqs"] == {"a": 1, "b": 1}
+    # A retry is still absorbed
+    data = client.post("/api/score/batch", json=tablet_a).get_json()
+    assert data["team1_score"] == 501 - 60 - 57
+    assert client.post("/api/score/batch", json={"client": 7, "throws": []}).status_code == 400
+
+
+def test_score_batch_rejects_throws_without_seq(client):
+    """Test that a batch is refused rather than silently dropping throws it can't order."""
+    client.post("/api/reset", json={"mode": "501"})
+    for throws in (
+        [{"base_score": 20, "multiplier": 3}],
+        [{"seq": 0, "base_score": 20, "multiplier": 3}],
+        ["T20"],
+        [{"seq": "one", "base_score": 20}],
+    ):
+        response = client.post("/api/score/batch", json={"throws": throws})
+        assert response.status_code == 400
+    assert client.get("/api/state").get_json()["team1_score"] == 501
+
+
+def test_undo_keeps_last_seq(client):
+    """Test that undo reverts the throw but not the sync sequence number."""
+    client.post("/api/reset", json={"mode": "501"})
+    client.post(
+        "/api/score/batch",
+        json={"throws": [{"seq": 1, "base_score": 20, "multiplier": 1}]},
+    )
+    data = client.post("/api/undo").get_json()
+    assert data["team1_score"] == 501
+    assert data["last_seq"] == 1
+
+    # A retried batch must not re-apply the undone throw
+    data = client.post(
+        "/api/score/batch",
+        json={"throws": [{"seq": 1, "base_score": 20, "multiplier": 1}]},
+    ).get_json()
+    assert data["team1_score"] == 501
+
+
+def test_score_retry_with_idempotency_key(client):
+    """Test that a retried throw with the same Idempotency-Key is applied once."""
+    client.post("/api/reset", json={"mode": "501"})
+    headers = {"Idempotency-Key": "board1-dart-1"}
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3}, headers=headers)
+    response = client.post(
+        "/api/score", json={"base_score": 20, "multiplier": 3}, headers=headers
+    )
+    data = response.get_json()
+    assert data["team1_score"] == 441
+    assert len(data["turn_scores"]) == 1
+    with client.session_transaction() as session:
+        assert len(session["history"]) == 2  # Initial state + one throw
+
+
+def test_score_retry_with_seq(client):
+    """Test that a single throw carrying a sequence number is deduplicated."""
+    client.post("/api/reset", json={"mode": "501"})
+    client.post("/api/score", json={"seq": 7, "base_score": 20, "multiplier": 1})
+    client.post("/api/score", json={"seq": 7, "base_score": 20, "multiplier": 1})
+    data = client.post(
+        "/api/score", json={"seq": 8, "base_score": 20, "multiplier": 1}
+    ).get_json()
+    assert data["team1_score"] == 461
+    assert data["last_seq"] == 8
+
+
+def test_score_applies_seqs_that_arrive_out_of_order(client):
+    """Test that pipelined throws overtaking each other are each applied once."""
+    client.post("/api/reset", json={"mode": "501"})
+    for seq in (2, 1, 1, 2):
+        client.post("/api/score", json={"seq": seq, "base_score": 20, "multiplier": 1})
+    data = client.post(
+        "/api/score", json={"seq": 5, "base_score": 20, "multiplier": 1}
+    ).get_json()
+    data = client.post(
+        "/api/score", json={"seq": 4, "base_score": 1, "multiplier": 1}
+    ).get_json()
+    assert data["team1_score"] == 501 - 20 - 20 - 20
+    assert data["team2_score"] == 501 - 1
+    assert data["last_seq"] == 5
+
+    # Numbers older than the window can't be told from retries
+    client.post("/api/score", json={"seq": 100, "base_score": 0, "multiplier": 1})
+    data = client.post(
+        "/api/score", json={"seq": 3, "base_score": 20, "multiplier": 1}
+    ).get_json()
+    assert data["team2_score"] == 501 - 1
+
+
+def test_score_rejects_bad_seq_and_idempotency_key(client):
+    """Test that malformed sequence numbers and oversized keys are refused, not dropped."""
+    client.post("/api/reset", json={"mode": "501"})
+    for seq in ("abc", [1], 0, -3):
+        response = client.post("/api/score", json={"seq": seq, "base_score": 20})
+        assert response.status_code == 400
+    response = client.post(
+        "/api/score", json={"base_score": 20}, headers={"Idempotency-Key": "k" * 65}
+    )
+    assert response.status_code == 400
+    assert client.get("/api/state").get_json()["team1_score"] == 501
+
+
+def test_dedup_window_is_bounded(client):
+    """Test that only the most recent idempotency keys are remembered."""
+    client.post("/api/reset", json={"mode": "cricket"})
+    for i in range(40):
+        client.post(
+            "/api/score",
+            json={"base_score": 0, "multiplier": 1},
+            headers={"Idempotency-Key": f"k{i}"},
+        )
+    with client.session_transaction() as session:
+        assert len(session["recent_keys"]) == 16
+        assert session["recent_keys"][-1] == "k39"
+        # Sync keys are not copied into every undo snapshot
+        assert "recent_keys" not in session["history"][-1]
+
+
+# --- Compact State Tests ---
+def test_dart_encoding_round_trip():
+    """Test that every dart fits in one byte and decodes to itself."""
+    import archive
+    from app import SEGMENTS, decode_dart, encode_dart
+
+    codes = set()
+    for base_score in SEGMENTS:
+        for multiplier in (1, 2, 3):
+            if (base_score, multiplier) in ((25, 3), (0, 2), (0, 3)):
+                with pytest.raises(ValueError):
+                    encode_dart(base_score, multiplier)
+                continue
+            code = encode_dart(base_score, multiplier)
+            assert 0 <= code < 256
+            assert decode_dart(code) == (base_score, multiplier)
+            codes.add(code)
+    assert len(codes) == len(SEGMENTS) * 3 - 3
+    # Codes index the archive's segments, which validate the darts
+    assert tuple(SEGMENTS) == archive.SEGMENTS
+
+
+def test_score_rejects_darts_no_board_can_score(client):
+    """Test that live scoring refuses the same darts as the archive and ingest (T25, D0, ...)."""
+    client.post("/api/reset", json={"mode": "501"})
+    for base_score, multiplier in ((25, 3), (0, 2), (0, 3)):
+        response = client.post("/api/score", json={"base_score": base_score, "multiplier": multiplier})
+        assert response.status_code == 400
+        response = client.post(
+            "/api/score/batch",
+            json={"throws": [{"seq": 1, "base_score": base_score, "multiplier": multiplier}]},
+        )
+        assert response.status_code == 400
+    assert client.get("/api/state").get_json()["team1_score"] == 501
+
+
+def test_session_stores_compact_darts(client):
+    """Test that the session keeps dart codes and the response renders them."""
+    client.post("/api/reset", json={"mode": "501"})
+    response = client.post("/api/score", json={"base_score": 20, "multiplier": 3})
+    data = response.get_json()
+    assert data["turn_scores"] == [{"score": 60, "repr": "T20"}]
+    assert data["can_undo"] is True
+    assert "history" not in data
+
+    with client.session_transaction() as session:
+        assert session["turn_scores"] == [83]
+        assert "checkout_suggestions" not in session
+
+
+def test_invalid_dart_is_rejected(client):
+    """Test that a dart that does not exist on the board is rejected."""
+    client.post("/api/reset", json={"mode": "501"})
+    response = client.post("/api/score", json={"base_score": 30, "multiplier": 1})
+    assert response.status_code == 400
+
+
+def test_renamed_player_in_turn_log(client):
+    """Test that a rename applies to turns logged before it."""
+    client.post("/api/reset", json={"mode": "501"})
+    for _ in range(3):
+        client.post("/api/score", json={"base_score": 20, "multiplier": 1})
+    data = client.post("/api/names", json={"player1_name": "Alice"}).get_json()
+    assert data["turn_log"][0] == "Alice: 60 (S20 S20 S20)"
+
+
+def test_outdated_session_layout_starts_new_game(app):
+    """Test that a cookie in an older stored layout is discarded."""
+    from app import CompactSessionSerializer
+
+    serializer = CompactSessionSerializer()
+    assert serializer.loads('{"game_mode": "501", "team1_score": 40}') == {}
+    state = {"game_mode": "301", "history": [{"game_mode": "301"}]}
+    assert serializer.loads(serializer.dumps(state)) == state
+
+
+# --- HTTP Caching Tests ---
+def test_state_conditional_get(client):
+    """Test that an unchanged state is answered with 304 Not Modified."""
+    client.post("/api/reset", json={"mode": "501"})
+    response = client.get("/api/state")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+
+    response = client.get("/api/state", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # A throw changes the state version, so the full state is sent again
+    client.post("/api/score", json={"base_score": 20, "multiplier": 1})
+    response = client.get("/api/state", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json()["team1_score"] == 481
+
+
+def test_state_version_survives_undo(client):
+    """Test that undo does not bring back an ETag that was already used."""
+    client.post("/api/reset", json={"mode": "501"})
+    etag = client.get("/api/state").headers["ETag"]
+    client.post("/api/score", json={"base_score": 20, "multiplier": 1})
+    client.post("/api/undo")
+    response = client.get("/api/state", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_stats_conditional_get(client):
+    """Test that statistics support conditional requests too."""
+    client.post("/api/reset", json={"mode": "501"})
+    etag = client.get("/api/stats").headers["ETag"]
+    response = client.get("/api/stats", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_gzip_compression(client):
+    """Test that larger responses are gzip compressed when accepted."""
+    response = client.get("/api/rules", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    rules = json.loads(gzip.decompress(response.data))
+    assert rules["darts_per_turn"] == 3
+
+    # Clients that don't ask for compression get plain responses
+    response = client.get("/api/rules")
+    assert "Content-Encoding" not in response.headers
+
+
+# --- Static Asset Tests ---
+def test_index_uses_fingerprinted_assets(client):
+    """Test that the page links fingerprinted CSS and JS instead of inlining them."""
+    response = client.get("/")
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert "<style>" not in html
+    assert "cdn.tailwindcss.com" not in html  # Utility classes are pre-built too
+    urls = re.findall(r'"(/assets/(?:app|utilities)\.[0-9a-f]{12}\.(?:css|js))"', html)
+    assert len(urls) == 3
+
+    for url in urls:
+        asset = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert asset.status_code == 200
+        assert asset.headers["Content-Encoding"] == "gzip"
+        assert "immutable" in asset.headers["Cache-Control"]
+        assert len(gzip.decompress(asset.data)) > 0
+
+
+def test_unknown_asset_is_not_found(client):
+    """Test that stale or unknown fingerprints are not served."""
+    assert client.get("/assets/app.000000000000.js").status_code == 404
+
+
+def test_index_conditional_get(client):
+    """Test that the HTML shell is revalidated with an ETag."""
+    etag = client.get("/").headers["ETag"]
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+# --- Startup Tests ---
+# Importing app.py must stay cheap: every Gunicorn worker (or the master, with
+# --preload) pays for it. Heavy optional subsystems are imported on first use.
+STARTUP_BUDGET_SECONDS = 1.5
+LAZY_MODULES = ["sqlite3", "numpy", "concurrent.futures", "multiprocessing"]
+
+
+def test_startup_time_and_lazy_imports(tmp_path):
+    """Benchmark a cold import of the app and check nothing heavy is loaded eagerly."""
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import app\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"loaded = [m for m in {LAZY_MODULES!r} if m in sys.modules]\n"
+        "print(elapsed, ','.join(loaded))\n"
+    )
+    # Run from another directory: data files must be found relative to app.py
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, _, loaded = result.stdout.strip().splitlines()[-1].partition(" ")
+    assert "checkouts.json not found" not in result.stdout
+    assert loaded == ""
+    assert float(elapsed) < STARTUP_BUDGET_SECONDS
+
+
+def test_precompiled_checkouts_match_json(tmp_path, monkeypatch):
+    """Test that the pickled checkout table is preferred and matches the JSON."""
+    import app as app_module
+
+    with open(app_module.CHECKOUTS_JSON_PATH) as f:
+        expected = app_module.build_checkout_table(json.load(f))
+
+    pickle_path = tmp_path / "checkouts.pickle"
+    monkeypatch.setattr(app_module, "CHECKOUTS_PICKLE_PATH", str(pickle_path))
+    assert not app_module._checkout_pickle_is_fresh()
+    assert app_module._load_checkout_table() == expected
+
+    import build_checkouts
+
+    monkeypatch.setattr(build_checkouts, "CHECKOUTS_PICKLE_PATH", str(pickle_path))
+    build_checkouts.main()
+    assert app_module._checkout_pickle_is_fresh()
+    assert app_module._load_checkout_table() == expected
+    assert app_module.get_checkout_suggestions(170, 3) == ["T20, T20, Bull"]
+    assert app_module.get_checkout_suggestions(170, 2) == []
+
+
+# --- Load Test Harness Tests ---
+def test_loadtest_board_plays_full_games(client):
+    """Test that a simulated board drives complete games through the API."""
+    import random
+
+    import loadtest
+
+    def send(method, path, body=None, headers=None):
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, dict(response.headers), response.get_json()
+
+    board = loadtest.Board(send, random.Random(3))
+    for _ in range(400):
+        board.step()
+    assert board.games > 0
+    assert board.darts > 300
+
+
+# --- Archive Tests ---
+def _win_501_game(client):
+    """Plays a short 501 game that Player 1 wins."""
+    client.post("/api/reset", json={"mode": "501"})
+    with client.session_transaction() as session:
+        session["team1_score"] = 100
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})  # 40 left
+    client.post("/api/score", json={"base_score": 20, "multiplier": 1})  # 20 left
+    return client.post("/api/score", json={"base_score": 10, "multiplier": 2})
+
+
+def test_finished_game_is_archived(client, app):
+    """Test that every dart of a finished game is written to the archive."""
+    import archive
+
+    client.get("/api/state")
+    client.post("/api/names", json={"player1_name": "Alice"})
+    assert _win_501_game(client).get_json()["game_over"] is True
+
+    conn = archive.connect(app.config["ARCHIVE_PATH"])
+    throws = list(archive.iter_throws(conn))
+    assert [(t["base_score"], t["multiplier"]) for t in throws] == [
+        (20, 3),
+        (20, 1),
+        (10, 2),
+    ]
+    assert [t["score_before"] for t in throws] == [100, 40, 20]
+    assert throws[0]["player_name"] == "Alice"
+    assert throws[0]["winner"] == 1
+
+
+def test_undo_removes_throw_from_game(client, app):
+    """Test that an undone dart is not archived."""
+    import archive
+
+    client.post("/api/reset", json={"mode": "101"})
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})  # 41 left
+    client.post("/api/score", json={"base_score": 1, "multiplier": 1})  # 40 left
+    client.post("/api/score", json={"base_score": 5, "multiplier": 1})
+    client.post("/api/undo")
+    data = client.post("/api/score", json={"base_score": 20, "multiplier": 2}).get_json()
+    assert data["game_over"] is True
+
+    conn = archive.connect(app.config["ARCHIVE_PATH"])
+    throws = list(archive.iter_throws(conn))
+    assert [(t["base_score"], t["multiplier"]) for t in throws] == [
+        (20, 3),
+        (1, 1),
+        (20, 2),
+    ]
+
+
+def test_export_and_import_round_trip(client, app, tmp_path):
+    """Test that exported NDJSON can be imported into another archive."""
+    import archive
+
+    _win_501_game(client)
+    response = client.get("/api/export.ndjson")
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 3
+
+    other = archive.connect(str(tmp_path / "other.db"))
+    assert archive.import_ndjson(other, lines + ["not json"], batch_size=2) == (3, 1)
+    assert list(archive.iter_throws(other)) == [json.loads(line) for line in lines]
+
+
+def test_import_throw_strings():
+    """Test importing another scorer's export that writes throws as strings."""
+    import archive
+
+    conn = archive.connect(":memory:")
+    lines = [
+        json.dumps({"game_id": "g1", "dart": i, "player": 1, "throw": t})
+        for i, t in enumerate(["T20", "Bull", "miss", "D16", "SB", "7"])
+    ]
+    assert archive.import_ndjson(conn, lines) == (6, 0)
+    throws = list(archive.iter_throws(conn))
+    assert [(t["base_score"], t["multiplier"]) for t in throws] == [
+        (20, 3),
+        (25, 2),
+        (0, 1),
+        (16, 2),
+        (25, 1),
+        (7, 1),
+    ]
+
+
+def test_import_skips_impossible_darts():
+    """Test that darts no board can score, and unknown players, are skipped."""
+    import archive
+
+    conn = archive.connect(":memory:")
+    bad = [
+        {"base_score": 30, "multiplier": 1},
+        {"base_score": -1, "multiplier": 1},
+        {"base_score": 20, "multiplier": 0},
+        {"base_score": 25, "multiplier": 3},
+        {"base_score": 0, "multiplier": 2},
+        {"base_score": 20, "multiplier": 1, "player": 7},
+        {"throw": ""},
+        {"throw": "T25"},
+    ]
+    lines = [json.dumps({"game_id": "g1", "dart": i, **r}) for i, r in enumerate(bad)]
+    lines.append(json.dumps({"game_id": "g1", "dart": 99, "throw": "T20"}))
+    assert archive.import_ndjson(conn, lines) == (1, len(bad))
+
+
+# --- Analytics Tests ---
+def test_analytics_player_report(client):
+    """Test the heatmap, treble 20 rate and double success for one player."""
+    client.get("/api/state")
+    client.post("/api/names", json={"player1_name": "Alice"})
+    _win_501_game(client)
+
+    data = client.get("/api/analytics?player=Alice").get_json()
+    assert data["darts"] == 3
+    assert data["games"] == 1
+    assert data["heatmap"] == {"10": [0, 1, 0], "20": [1, 0, 1]}
+    assert data["treble_20"] == {"attempts": 1, "hits": 1, "rate": 1.0}
+    # 40 left needs D20 (missed), then 20 left needs D10 (hit)
+    assert data["doubles"]["D20"] == {"attempts": 1, "hits": 0, "rate": 0.0}
+    assert data["doubles"]["D10"] == {"attempts": 1, "hits": 1, "rate": 1.0}
+    assert data["double_success"]["rate"] == 0.5
+
+    assert client.get("/api/analytics?player=Nobody").status_code == 404
+
+
+def test_analytics_summary_picks_up_new_games(client):
+    """Test that the summary includes games archived after the store was loaded."""
+    client.get("/api/state")
+    client.post("/api/names", json={"player1_name": "Alice"})
+    _win_501_game(client)
+    assert client.get("/api/analytics").get_json()["players"]["Alice"]["games"] == 1
+
+    _win_501_game(client)
+    summary = client.get("/api/analytics").get_json()["players"]
+    assert summary["Alice"] == {
+        "darts": 6,
+        "games": 2,
+        "treble_20_rate": 1.0,
+        "double_rate": 0.5,
+    }
+
+
+def test_dart_store_reloads_changed_games_and_skips_bad_rows(tmp_path):
+    """Test that re-archived and extended games replace their old rows."""
+    import analytics
+    import archive
+
+    conn = archive.connect(str(tmp_path / "darts.db"))
+    game = {"id": "g1", "mode": "501", "player1_name": "Alice"}
+    throw = {"player": 1, "team": 1, "multiplier": 1, "score_before": 501}
+    archive.record_game(conn, game, [dict(throw, dart=0, base_score=20)])
+    store = analytics.DartStore()
+    store.refresh(conn)
+    assert store.size == 1
+
+    # Finishing the same game again replaces it rather than adding to it
+    archive.record_game(conn, game, [dict(throw, dart=d, base_score=20) for d in range(2)])
+    # A dart no board can score, e.g. from an old import, is left out
+    with conn:
+        conn.execute("INSERT INTO throws VALUES ('g1', 2, 1, 1, 30, 1, NULL)")
+    lines = [json.dumps({"game_id": "g1", "dart": 3, "player": 1, "throw": "T19"})]
+    archive.import_ndjson(conn, lines)
+    store.refresh(conn)
+    assert store.view()["segment"].tolist() == [20, 20, 19]
+    assert analytics.segment_heatmap(store.view()) == {"19": [0, 0, 1], "20": [2, 0, 0]}
+
+
+def test_dart_store_grows_past_initial_capacity():
+    """Test that appending beyond the preallocated arrays keeps every row."""
+    import analytics
+
+    store = analytics.DartStore()
+    rows = analytics.INITIAL_CAPACITY + 10
+    store.append({name: [1] * rows for name in analytics.COLUMNS})
+    store.append({name: [2] * 5 for name in analytics.COLUMNS})
+    columns = store.view()
+    assert len(columns["segment"]) == rows + 5
+    assert columns["segment"][-6:].tolist() == [1, 2, 2, 2, 2, 2]
+
+
+# --- Player Profile Tests ---
+def test_finished_game_updates_profiles(client):
+    """Test that finishing a game creates profiles with stats and ratings."""
+    client.get("/api/state")
+    client.post("/api/names", json={"player1_name": "Alice", "player2_name": "Bob"})
+    _win_501_game(client)
+
+    alice = client.get("/api/players/alice").get_json()  # Names ignore case
+    assert alice["name"] == "Alice"
+    assert alice["games"] == 1
+    assert alice["wins"] == 1
+    assert alice["darts"] == 3
+    assert alice["average"] == 100.0  # 100 points with 3 darts
+    assert alice["checkout_pct"] == 50.0  # Missed D20, hit D10
+    assert alice["rating"] == 1516.0
+    assert alice["recent_games"][0]["rating_change"] == 16.0
+
+    bob = client.get("/api/players/Bob").get_json()
+    assert (bob["wins"], bob["rating"], bob["average"]) == (0, 1484.0, None)
+    assert client.get("/api/players/Carol").status_code == 404
+    assert [p["name"] for p in client.get("/api/players?q=a").get_json()] == ["Alice"]
+
+
+def test_leaderboard_is_updated_after_each_game(client):
+    """Test that ratings build up game by game and the leaderboard follows."""
+    client.get("/api/state")
+    client.post("/api/names", json={"player1_name": "Alice", "player2_name": "Bob"})
+    _win_501_game(client)
+    _win_501_game(client)
+
+    board = client.get("/api/leaderboard").get_json()
+    assert [p["name"] for p in board["players"]] == ["Alice", "Bob"]
+    assert board["players"][0]["rating"] > 1516.0
+    assert board["players"][0]["rating"] + board["players"][1]["rating"] == 3000.0
+
+    by_average = client.get("/api/leaderboard?by=average").get_json()["players"]
+    assert [p["name"] for p in by_average] == ["Alice"]  # Bob never threw
+    assert client.get("/api/leaderboard?limit=1").get_json()["players"][0]["name"] == "Alice"
+    # SQLite reads a negative LIMIT as no limit at all
+    assert len(client.get("/api/leaderboard?limit=-1").get_json()["players"]) == 1
+    assert client.get("/api/leaderboard?by=shoe_size").status_code == 400
+
+
+def test_team_game_rates_each_side_by_its_average():
+    """Test that a 2v2 win moves every member of each team by the same amount."""
+    import players
+
+    conn = players.connect(":memory:")
+    game = {"id": "g1", "mode": "cricket", "teams_mode": 1, "winner": 2}
+    names = ["Ann", "Ben", "Cat", "Dan"]
+    game.update({f"player{i}_name": name for i, name in enumerate(names, 1)})
+    players.record_game(conn, game, [])
+    players.record_game(conn, game, [])  # Recording twice changes nothing
+
+    ratings = {p["name"]: p["rating"] for p in players.list_players(conn)}
+    assert ratings == {"Ann": 1484.0, "Ben": 1516.0, "Cat": 1484.0, "Dan": 1516.0}
+
+
+# --- Sharding Tests ---
+@pytest.fixture
+def memory_store(app):
+    """Keeps game state in the worker's memory, as each shard does."""
+    from app import board_overview, game_store
+
+    app.config["SESSION_STORE"] = "memory"
+    game_store.clear()
+    board_overview.clear()
+    yield game_store
+    app.config["SESSION_STORE"] = "cookie"
+    game_store.clear()
+    board_overview.clear()
+
+
+def test_memory_store_keeps_game_in_worker(client, memory_store):
+    """Test that a game is served from memory and named by a stable game cookie."""
+    client.get("/api/state")
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})
+    key = client.get_cookie("darts_game").value.partition(".")[0]
+    assert memory_store.get(key)["team1_score"] == 441
+
+    client.post("/api/reset", json={"mode": "301"})
+    assert client.get_cookie("darts_game").value.partition(".")[0] == key
+    assert client.get("/api/state").get_json()["team1_score"] == 301
+
+
+def test_memory_store_falls_back_to_cookie(client, memory_store):
+    """Test that a game carries on from the cookie on a worker that doesn't hold it."""
+    client.get("/api/state")
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})
+    memory_store.clear()  # As if the game landed on another worker
+
+    data = client.post("/api/score", json={"base_score": 20, "multiplier": 1}).get_json()
+    assert data["team1_score"] == 421
+
+    # A stale copy left behind on a worker is not used either
+    key = client.get_cookie("darts_game").value.partition(".")[0]
+    stale = memory_store.get(key)
+    client.post("/api/score", json={"base_score": 1, "multiplier": 1})
+    memory_store.put(key, stale)
+    assert client.get("/api/state").get_json()["team1_score"] == 420
+
+
+def test_hash_ring_moves_only_a_dead_nodes_games():
+    """Test that marking a node down only moves the games it owned."""
+    from shard import HashRing
+
+    ring = HashRing(["a", "b", "c", "d"])
+    keys = [f"game{i}" for i in range(2000)]
+    before = {k: ring.node_for(k) for k in keys}
+    assert set(before.values()) == {"a", "b", "c", "d"}
+    assert max(list(before.values()).count(n) for n in "abcd") < 2000 * 0.4
+
+    ring.mark_down("b")
+    after = {k: ring.node_for(k) for k in keys}
+    assert all(after[k] == before[k] for k in keys if before[k] != "b")
+    assert "b" not in after.values()
+
+
+def test_router_sticks_games_to_a_shard_and_fails_over():
+    """Test that the router sends a game to one backend and moves it when that one is gone."""
+    import threading
+    from werkzeug.serving import make_server
+    from werkzeug.test import Client
+    from shard import Router
+
+    def backend(name):
+        def wsgi(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [name.encode()]
+
+        server = make_server("127.0.0.1", 0, wsgi, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    servers = {name: backend(name) for name in ("one", "two")}
+    addresses = {f"127.0.0.1:{s.server_port}": name for name, s in servers.items()}
+    router = Router(list(addresses))
+
+    owners = {}
+    for i in range(20):
+        client = Client(router)
+        client.set_cookie("darts_game", f"key{i}.1")
+        first = client.get("/api/state")
+        assert client.get("/api/state").get_data() == first.get_data()
+        owners[f"key{i}"] = first.headers["X-Darts-Shard"]
+    assert set(owners.values()) == set(addresses)
+
+    dead = next(iter(addresses))
+    servers[addresses[dead]].shutdown()
+    servers[addresses[dead]].server_close()
+    for key in owners:
+        client = Client(router)
+        client.set_cookie("darts_game", f"{key}.1")
+        assert client.get("/api/state").headers["X-Darts-Shard"] != dead
+    servers[addresses[next(a for a in addresses if a != dead)]].shutdown()
+
+
+def test_router_splits_ingested_hits_by_board():
+    """Test that each board's hits go to the backend holding the board's game."""
+    import threading
+    from werkzeug.serving import make_server
+    from werkzeug.test import Client
+    from werkzeug.wrappers import Request
+    import shard
+
+    def backend(environ, start_response):
+        events = Request(environ).get_json()["events"]
+        port = environ["SERVER_PORT"]
+        reply = {
+            "accepted": len(events),
+            "rejected": {"unbound": 1},
+            "boards": {e["board"]: f"127.0.0.1:{port}" for e in events},
+        }
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps(reply).encode()]
+
+    servers = [make_server("127.0.0.1", 0, backend, threaded=True) for _ in range(2)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    router = shard.Router([f"127.0.0.1:{s.server_port}" for s in servers])
+
+    boards = [f"oche-{i}" for i in range(8)]
+    events = [{"board": b, "t": 1000, "segment": 20} for b in boards for _ in range(2)]
+    data = Client(router).post("/api/ingest", json={"events": events}).get_json()
+    assert data["accepted"] == 16
+    assert data["rejected"] == {"unbound": 8}
+    for board in boards:
+        assert data["boards"][board] == router.ring.node_for(f"board-{board}")
+    assert len(set(data["boards"].values())) == 2
+    for server in servers:
+        server.shutdown()
+
+
+def test_router_does_not_resend_a_post_the_backend_may_have_applied(monkeypatch):
+    """Test that a POST that timed out is answered with 504 rather than sent elsewhere."""
+    import threading
+    import time
+    from werkzeug.serving import make_server
+    from werkzeug.test import Client
+    import shard
+
+    received = []
+
+    def slow(environ, start_response):
+        received.append(environ["SERVER_PORT"])
+        time.sleep(0.5)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"ok"]
+
+    servers = [make_server("127.0.0.1", 0, slow, threaded=True) for _ in range(2)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(shard, "BACKEND_TIMEOUT", 0.1)
+    router = shard.Router([f"127.0.0.1:{s.server_port}" for s in servers])
+
+    client = Client(router)
+    client.set_cookie("darts_game", "key.1")
+    assert client.post("/api/score", json={}).status_code == 504
+    assert len(received) == 1
+    for server in servers:
+        server.shutdown()
+
+
+# --- Write-Behind Persistence Tests ---
+def test_lost_cookie_recovers_from_saved_game(client, memory_store):
+    """Test that a game whose session cookie is lost carries on from the saved state."""
+    from app import flush_live_games
+
+    client.get("/api/state")
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})
+    flush_live_games()
+    memory_store.clear()  # A restarted worker...
+    client.delete_cookie("session")  # ...and a browser that dropped the cookie
+
+    assert client.get("/api/state").get_json()["team1_score"] == 441
+
+
+def test_worker_start_recovers_games_in_progress(client, app, memory_store):
+    """Test that a restarted worker loads unfinished games, but not finished ones."""
+    from app import flush_live_games, recover_live_games
+
+    client.get("/api/state")
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})
+    other = app.test_client()
+    _win_501_game(other)
+    flush_live_games()
+    memory_store.clear()
+
+    assert recover_live_games() == 1
+    key = client.get_cookie("darts_game").value.partition(".")[0]
+    assert memory_store.get(key)["team1_score"] == 441
+
+
+def test_sharded_worker_recovers_only_its_own_games(client, app, memory_store, monkeypatch):
+    """Test that a shard.py backend doesn't load copies of other backends' games."""
+    from app import flush_live_games, recover_live_games
+    from shard import HashRing
+
+    keys = []
+    for _ in range(6):
+        player = app.test_client()
+        player.get("/api/state")
+        player.post("/api/score", json={"base_score": 20, "multiplier": 1})
+        keys.append(player.get_cookie("darts_game").value.partition(".")[0])
+    flush_live_games()
+    memory_store.clear()
+
+    shards = ["127.0.0.1:5101", "127.0.0.1:5102"]
+    monkeypatch.setitem(app.config, "SHARD", shards[0])
+    monkeypatch.setitem(app.config, "SHARDS", shards)
+    mine = [k for k in keys if HashRing(shards).node_for(k) == shards[0]]
+    assert recover_live_games() == len(mine)
+    assert [k for k in keys if memory_store.get(k) is not None] == mine
+
+
+def test_write_behind_group_commits_in_background(tmp_path):
+    """Test that queued changes are written together by the background thread."""
+    import time
+    import archive
+    from livegames import WriteBehind
+
+    path = str(tmp_path / "live.db")
+    live = WriteBehind(path, interval=0.01)
+    for i in range(100):
+        live.save(f"game{i % 10}", f"state{i}")
+    assert live.load("game3") == "state93"  # Served from memory before any write
+
+    conn = archive.connect(path)
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        if live.flushes and conn.execute("SELECT COUNT(*) FROM live_games").fetchone() == (10,):
+            break
+        time.sleep(0.01)
+    assert live.load("game3") == "state93"
+    assert conn.execute("SELECT COUNT(*) FROM live_games").fetchone() == (10,)
+    assert live.flushes <= 2  # Not one write per change
+
+
+# --- Tournament Tests ---
+def _win_tournament_leg(client):
+    """Finishes the board's 501 leg with a win for the player to throw first."""
+    with client.session_transaction() as session:
+        session["team1_score"] = 100
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})
+    client.post("/api/score", json={"base_score": 20, "multiplier": 1})
+    return client.post("/api/score", json={"base_score": 10, "multiplier": 2})
+
+
+def test_knockout_advances_winners_on_game_over(client, app):
+    """Test that finishing a leg on a board advances its winner and fills the board again."""
+    response = client.post(
+        "/api/tournaments",
+        json={"name": "Friday", "players": ["Ann", "Ben", "Cat"], "boards": ["Oche"]},
+    )
+    assert response.status_code == 201
+    t = response.get_json()
+    # Ann, the top seed, has a bye; Ben plays Cat on the only board
+    assert t["boards"] == {"Oche": 1}
+    assert t["matches"][1]["players"] == ["Ben", "Cat"]
+
+    state = client.post(f"/api/tournaments/{t['id']}/matches/1/start").get_json()
+    assert (state["player1_name"], state["player2_name"]) == ("Ben", "Cat")
+    # A renamed player couldn't be matched to the bracket when the leg is won
+    assert client.post("/api/names", json={"player1_name": "Bob"}).status_code == 409
+    assert _win_tournament_leg(client).get_json()["winner"] == 1
+
+    t = client.get(f"/api/tournaments/{t['id']}").get_json()
+    assert t["matches"][1]["winner"] == "Ben"
+    assert t["matches"][2]["players"] == ["Ann", "Ben"]
+    assert t["boards"] == {"Oche": 2}
+
+    client.post(f"/api/tournaments/{t['id']}/matches/2/start")
+    _win_tournament_leg(client)
+    t = client.get(f"/api/tournaments/{t['id']}").get_json()
+    assert (t["champion"], t["finished"]) == ("Ann", True)
+    assert client.get("/api/tournaments").get_json()[0]["finished"] is True
+
+    # A new game on the board is no longer part of the tournament
+    client.post("/api/reset", json={"mode": "501"})
+    with client.session_transaction() as session:
+        assert "tournament_match" not in session
+    assert client.post("/api/names", json={"player1_name": "Bob"}).status_code == 200
+
+
+def test_round_robin_schedules_on_free_boards():
+    """Test that everyone plays everyone once and no one is on two boards at once."""
+    import tournament
+
+    players = [f"P{i}" for i in range(7)]
+    t = tournament.create_round_robin("League", players, ["A", "B", "C"])
+    assert len(t["matches"]) == 21
+    while not t["finished"]:
+        playing = [m for m in t["matches"] if m["status"] == "playing"]
+        on_board = [p for m in playing for p in m["players"]]
+        assert len(on_board) == len(set(on_board))
+        match = playing[0]
+        tournament.report_result(t, match["id"], match["players"][0])
+
+    pairs = {frozenset(m["players"]) for m in t["matches"]}
+    assert len(pairs) == 21
+    assert all(row["played"] == 6 for row in tournament.standings(t))
+    assert t["champion"] == tournament.standings(t)[0]["player"]
+
+
+def test_stored_tournament_results_touch_only_their_rows(tmp_path):
+    """Test that a result reads and writes a few rows, however many matches there are."""
+    import tournament
+
+    conn = tournament.connect(str(tmp_path / "darts.db"))
+    players = [f"P{i}" for i in range(64)]
+    t = tournament.create_round_robin("League", players, ["A", "B"])
+    tournament.save(conn, t)
+    assert len(t["matches"]) == 2016
+
+    while not t["finished"]:
+        match = next(m for m in t["matches"] if m["status"] == "playing")
+        changes = conn.total_changes
+        tournament.record_result(conn, t["id"], match["id"], match["players"][0])
+        # The match, those it feeds or puts on the board, two standings and the tournament
+        assert conn.total_changes - changes <= 8
+        tournament.report_result(t, match["id"], match["players"][0])  # The same, in memory
+
+    stored = tournament.load(conn, t["id"])
+    assert tournament.view(stored) == tournament.view(t)
+    assert stored["champion"] == t["champion"]
+
+
+def test_tournament_results_are_validated(client):
+    """Test that results are only accepted for matches on a board, from their players."""
+    t = client.post(
+        "/api/tournaments",
+        json={"players": ["Ann", "Ben", "Cat", "Dan"], "boards": ["One"], "format": "knockout"},
+    ).get_json()
+    url = f"/api/tournaments/{t['id']}/matches"
+    assert client.post(f"{url}/1/result", json={"winner": "Ben"}).status_code == 400  # Waiting
+    assert client.post(f"{url}/0/result", json={"winner": "Zed"}).status_code == 400
+    assert client.post(f"{url}/0/start").status_code == 200
+    assert client.post(f"{url}/1/start").status_code == 409
+    t = client.post(f"{url}/0/result", json={"winner": "dan"}).get_json()
+    assert t["matches"][0]["winner"] == "Dan"
+    assert t["boards"] == {"One": 1}
+    assert client.post("/api/tournaments", json={"players": ["Ann"]}).status_code == 400
+    for body in (
+        {"players": "Ann,Ben", "boards": ["One"]},  # Not split into letters
+        {"players": ["Ann", "Ben"], "boards": 3},
+        {"players": ["Ann", {"name": "Ben"}]},
+        {"players": ["Ann", "Ben"], "name": ["Cup"]},
+        ["Ann", "Ben"],
+    ):
+        assert client.post("/api/tournaments", json=body).status_code == 400
+    for body in (["Dan"], {"winner": 3}, {}):
+        assert client.post(f"{url}/2/result", json=body).status_code == 400
+
+
+# --- Ingestion Tests ---
+def test_hit_positions_map_to_segments():
+    """Test that board coordinates map to the right beds."""
+    from ingest import SEGMENT_ORDER, aim_point, segment_at
+
+    assert segment_at(0, 103) == (20, 3)
+    assert segment_at(0, 166) == (20, 2)
+    assert segment_at(-20, 60) == (5, 1)  # 5 is to the left of 20
+    assert segment_at(3, 3) == (25, 2)
+    assert segment_at(0, 12) == (25, 1)
+    assert segment_at(0, -200) == (0, 1)
+    for base_score in SEGMENT_ORDER:
+        for multiplier in (1, 2, 3):
+            assert segment_at(*aim_point(base_score, multiplier)) == (base_score, multiplier)
+
+
+def test_hit_filter_starts_afresh_after_a_board_reboots():
+    """Test that a board whose ids or clock restarted isn't dropped forever."""
+    from ingest import HitFilter
+
+    hits = HitFilter()
+    assert hits.accept(900_000, 50, now=0.0)
+    assert not hits.accept(900_000, 50, now=1.0)  # A resend
+    # The board's clock restarted from zero along with its event ids
+    assert hits.accept(2_000, 1, now=5.0)
+    # Its ids restarted, but its clock is the time of day; it was off for a while
+    assert hits.accept(990_000, 1, now=60.0)
+    assert not hits.accept(990_000, 1, now=61.0)
+
+
+def test_standalone_modules_share_the_apps_game_keys():
+    """Test that the router and ingest tools, which don't import app.py, name games alike."""
+    import app as darts_app
+    import ingest
+    import shard
+
+    assert shard.GAME_COOKIE_NAME == darts_app.GAME_COOKIE_NAME
+    assert ingest.BOARD_KEY_PREFIX == darts_app.BOARD_KEY_PREFIX
+
+
+def test_ingested_hits_are_scored_into_bound_board(client, app, memory_store):
+    """Test that hits are validated, debounced and scored into the board's game."""
+    client.get("/api/state")
+    assert client.post("/api/boards/oche-1/bind").get_json()["board"] == "oche-1"
+
+    device = app.test_client()
+    events = [
+        {"board": "oche-1", "id": 1, "t": 1000, "x": 0, "y": 103},  # T20
+        {"board": "oche-1", "id": 2, "t": 1010, "x": 1, "y": 103},  # Bounce of the same dart
+        {"board": "oche-1", "id": 1, "t": 1500, "x": 0, "y": 103},  # Resent event
+        {"board": "oche-1", "id": 3, "t": 1600, "segment": 20, "multiplier": 1},
+        {"board": "oche-1", "id": 4, "t": 2000, "x": 0, "y": 900},  # Sensor noise
+        {"board": "oche-2", "id": 1, "t": 2000, "segment": 5},
+    ]
+    data = device.post("/api/ingest", json={"events": events}).get_json()
+    assert data["accepted"] == 2
+    assert data["rejected"] == {"invalid": 1, "unbound": 1, "debounced": 2, "game_over": 0}
+    assert data["boards"]["oche-1"]["team1_score"] == 421
+
+    # The scorer bound to the board sees the darts on its next poll
+    state = client.get("/api/state").get_json()
+    assert state["team1_score"] == 421
+    assert [t["repr"] for t in state["turn_scores"]] == ["T20", "S20"]
+
+
+def test_hits_for_an_unbound_board_leave_no_game_behind(app, memory_store):
+    """Test that posting with an unbound board's cookie doesn't store a stub game."""
+    device = app.test_client()
+    device.set_cookie("darts_game", "board-oche-9")
+    hit = {"events": [{"board": "oche-9", "t": 1000, "segment": 20}]}
+    for _ in range(2):
+        data = device.post("/api/ingest", json=hit).get_json()
+        assert data["rejected"]["unbound"] == 1
+    assert memory_store.get("board-oche-9") is None
+    assert device.get("/api/boards").get_json()["boards"] == []
+
+
+def test_binding_a_board_needs_memory_store(client):
+    """Test that boards can't be bound while games live only in cookies."""
+    client.get("/api/state")
+    assert client.post("/api/boards/oche-1/bind").status_code == 409
+
+
+# --- Spectator Tests ---
+def test_board_overview_is_shared_until_a_board_changes(client, app, memory_store):
+    """Test that spectators share one snapshot that only a board's darts replace."""
+    from app import board_overview
+
+    client.get("/api/state")
+    client.post("/api/boards/oche-3/bind")
+    spectator = app.test_client()
+    response = spectator.get("/api/boards")
+    boards = response.get_json()["boards"]
+    assert [b["board"] for b in boards] == ["oche-3"]
+    assert boards[0]["players"] == ["Player 1", "Player 2"]
+    assert boards[0]["team1_score"] == 501
+    etag = response.headers["ETag"]
+
+    snapshot = board_overview.get()
+    player = app.test_client()  # A game not bound to a board
+    player.post("/api/reset", json={"mode": "301"})
+    player.post("/api/score", json={"score": 20, "multiplier": 3})
+    assert board_overview.get() is snapshot
+    assert spectator.get("/api/boards", headers={"If-None-Match": etag}).status_code == 304
+
+    event = {"board": "oche-3", "t": 10**12, "segment": 20, "multiplier": 3}
+    app.test_client().post("/api/ingest", json={"events": [event]})
+    response = spectator.get("/api/boards", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    board = response.get_json()["boards"][0]
+    assert board["team1_score"] == 441
+    assert board["turn"] == ["T20"]
+
+
+def test_board_overview_includes_boards_held_by_other_workers(client, app, memory_store):
+    """Test that every worker (or shard) shows the boards saved by the others."""
+    from app import board_overview, flush_live_games
+
+    client.get("/api/state")
+    client.post("/api/boards/oche-4/bind")
+    client.post("/api/score", json={"base_score": 20, "multiplier": 3})
+    flush_live_games()
+    memory_store.clear()  # As seen from a worker that never held the board
+    board_overview.clear()
+
+    boards = app.test_client().get("/api/boards").get_json()["boards"]
+    assert [(b["board"], b["team1_score"]) for b in boards] == [("oche-4", 441)]
+
+
+def test_spectate_page_loads_its_script(client):
+    """Test that the spectator page is served with its fingerprinted script."""
+    response = client.get("/spectate")
+    assert response.status_code == 200
+    assert b"/assets/spectate." in response.data
+    assert b"/assets/utilities." in response.data
+    assert b"cdn.tailwindcss.com" not in response.data
+
+
+# --- Re-scoring Tests ---
+def _play_101_with_bust(client):
+    """Plays a 101 game in which Player 1 busts once before winning."""
+    client.post("/api/reset", json={"mode": "101"})
+    darts = [(20, 3), (20, 3)]  # 41 left, then bust back to 101
+    darts += [(1, 1)] * 3  # Player 2
+    darts += [(20, 3), (1, 1), (20, 2)]  # 41, 40, then out on D20
+    for base_score, multiplier in darts:
+        data = client.post(
+            "/api/score", json={"base_score": base_score, "multiplier": multiplier}
+        ).get_json()
+    assert data["winner"] == 1
+
+
+def test_rescore_replays_archive_through_current_rules(client, app):
+    """Test that archived games replay to the results that were recorded."""
+    import rescore
+
+    _play_101_with_bust(client)
+    _play_101_with_bust(client)
+    report = rescore.rescore(app.config["ARCHIVE_PATH"], workers=2, chunk_size=1)
+    assert (report["games"], report["darts"], report["differing"]) == (2, 16, 0)
+
+
+def test_rescore_reports_games_scored_differently(client, app):
+    """Test that darts and results that don't match the rules are reported."""
+    import archive
+    import rescore
+
+    _play_101_with_bust(client)
+    conn = archive.connect(app.config["ARCHIVE_PATH"])
+    with conn:
+        # As if an old rules bug had not reverted the bust
+        conn.execute("UPDATE throws SET score_before = -19 WHERE dart = 5")
+        conn.execute("UPDATE games SET winner = 2")
+    report = rescore.rescore(app.config["ARCHIVE_PATH"], workers=1)
+    assert report["differing"] == 1
+    assert report["fields"] == {"score_before": 1, "winner": 1}
+    diffs = report["listed"][0]["diffs"]
+    assert diffs[0] == {"field": "score_before", "dart": 5, "recorded": -19, "replayed": 101}
+
+
+def test_rescore_reports_games_it_cannot_replay(client, app):
+    """Test that a game with a dart the rules refuse doesn't stop the others."""
+    import archive
+    import rescore
+
+    _play_101_with_bust(client)
+    _play_101_with_bust(client)
+    conn = archive.connect(app.config["ARCHIVE_PATH"])
+    with conn:
+        conn.execute(
+            "UPDATE throws SET base_score = 30 WHERE dart = 0 AND game_id = "
+            "(SELECT id FROM games ORDER BY rowid LIMIT 1)"
+        )
+    report = rescore.rescore(app.config["ARCHIVE_PATH"], workers=1)
+    assert (report["games"], report["invalid"], report["differing"]) == (1, 1, 0)
+    assert "Invalid dart" in report["invalid_listed"][0]["error"]
+
+
+# --- Profiler Tests ---
+def test_profiler_admin_routes_need_token(client, app, monkeypatch):
+    """Test that the profiler is only reachable with the admin token."""
+    assert client.get("/admin/profiler").status_code == 404  # No token configured
+    monkeypatch.setitem(app.config, "ADMIN_TOKEN", "s3cret")
+    assert client.post("/admin/profiler").status_code == 403
+
+    auth = {"Authorization": "Bearer s3cret"}
+    for bad in ({"endpoint": "nope"}, {"seconds": float("nan")}, {"every": float("inf")}):
+        assert client.post("/admin/profiler", json=bad, headers=auth).status_code == 400
+    status = client.post(
+        "/admin/profiler", json={"endpoint": "record_score", "seconds": 5}, headers=auth
+    ).get_json()
+    assert status["enabled"] is True and status["endpoint"] == "record_score"
+    assert client.delete("/admin/profiler", headers=auth).get_json()["enabled"] is False
+    assert client.get("/admin/profiler/stacks", headers=auth).mimetype == "text/plain"
+
+
+def test_profiler_folds_stacks_of_profiled_requests():
+    """Test that only chosen requests are sampled, as folded stacks per endpoint."""
+    import sys
+
+    from profiler import Profiler
+
+    switch_interval = sys.getswitchinterval()
+    profiler = Profiler()
+    profiler.start(every=2, seconds=5, interval=1.0)  # Samples by hand below
+    profiler.begin("get_state")  # Request 1 of every 2 isn't profiled
+    profiler.sample()
+    profiler.end()
+    profiler.begin("record_score")
+    profiler.sample()
+    profiler.end()
+    profiler.stop()
+
+    assert sys.getswitchinterval() == switch_interval
+    assert profiler.status()["profiled"] == {"record_score": 1}
+    [line] = profiler.folded().splitlines()
+    stack, count = line.rsplit(" ", 1)
+    assert stack.startswith("record_score;") and count == "1"
+    frames = stack.split(";")
+    assert "test_profiler_folds_stacks_of_profiled_requests (test_app.py)" in frames
+    assert frames[-1] == "Profiler.sample (profiler.py)"
+
+
+def test_profiler_is_shared_by_workers(tmp_path):
+    """Test that a profile started and stopped through one worker runs in all of them."""
+    from profiler import Profiler
+
+    path = str(tmp_path / "darts.db")
+    answering, serving = Profiler(path), Profiler(path)  # Two workers
+    answering.start(endpoint="record_score", seconds=5, interval=1.0)  # Samples by hand below
+    serving.poll()
+    assert serving.enabled and serving.endpoint == "record_score"
+    serving.begin("record_score")
+    serving.sample()
+    serving.end()
+    serving.share()  # As its sampler thread does every SHARE_SECONDS
+
+    # The worker that answers reads the samples of the one that served the request
+    status = answering.status()
+    assert status["samples"] == {"record_score": 1}
+    assert status["profiled"] == {"record_score": 1}
+    [line] = answering.folded().splitlines()
+    assert line.startswith("record_score;") and line.endswith(" 1")
+
+    answering.stop()
+    serving.poll(force=True)
+    assert not serving.enabled
+    assert Profiler(path).folded() == answering.folded()
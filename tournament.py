@@ -0,0 +1,439 @@
+"""
+Knockout and round-robin tournaments played across several boards.
+
+A tournament is a plain dict, and the functions here work on it the way
+app.py's rules work on a game state. In the archive database its matches and
+standings are rows of their own, beside a JSON row for the rest, so that a
+result reads and writes only the few rows it changes.
+
+Scheduling is event-driven. Every match counts the results it is still
+waiting for: the two feeder matches in a knockout, or each player's previous
+match in a round robin. A finished match decrements the counters of the (at
+most two) matches it feeds. A match that reaches zero joins the ready queue,
+and ready matches are handed to free boards in order. So a result costs the
+same however many entrants there are.
+"""
+
+import json
+import time
+import uuid
+from collections import deque
+from functools import partial
+
+import archive
+
+FORMATS = ("knockout", "round_robin")
+MAX_ENTRANTS = 1024
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS tournaments (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        format TEXT NOT NULL,
+        finished INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        data TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS tournament_matches (
+        tournament_id TEXT NOT NULL,
+        match_id INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (tournament_id, match_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS tournament_standings (
+        tournament_id TEXT NOT NULL,
+        player TEXT NOT NULL,
+        played INTEGER NOT NULL,
+        won INTEGER NOT NULL,
+        lost INTEGER NOT NULL,
+        PRIMARY KEY (tournament_id, player)
+    )""",
+]
+
+
+class TournamentError(ValueError):
+    """A tournament can't be created or a result can't be applied."""
+
+
+def _new_match(match_id, round_number, players, waiting):
+    return {
+        "id": match_id,
+        "round": round_number,
+        "players": players,
+        "winner": None,
+        "board": None,
+        "status": "waiting",  # waiting -> ready -> playing -> done
+        "waiting": waiting,  # Results still needed before it can be played
+        "feeds": [],  # [match id, slot] pairs this match's result is passed to
+    }
+
+
+def _new_tournament(name, kind, players, boards, mode):
+    if len(set(p.lower() for p in players)) != len(players):
+        raise TournamentError("Player names must be unique.")
+    if not 2 <= len(players) <= MAX_ENTRANTS:
+        raise TournamentError(f"A tournament needs 2 to {MAX_ENTRANTS} players.")
+    if not boards or len(set(boards)) != len(boards):
+        raise TournamentError("At least one board is needed, and board names must be unique.")
+    return {
+        "id": uuid.uuid4().hex,
+        "name": name,
+        "format": kind,
+        "mode": mode,
+        "players": list(players),
+        "boards": list(boards),
+        "matches": [],
+        "ready": deque(),  # Match ids waiting for a board, in order
+        "free_boards": deque(boards),
+        "remaining": 0,  # Matches not played yet
+        "champion": None,
+        "finished": False,
+        "created_at": time.time(),
+    }
+
+
+def _seed_order(size):
+    """Bracket positions of seeds 1..size, so the top seeds meet last (1, 8, 4, 5, ...)."""
+    order = [1]
+    while len(order) < size:
+        order = [s for seed in order for s in (seed, 2 * len(order) + 1 - seed)]
+    return order
+
+
+def create_knockout(name, players, boards, mode="501"):
+    """
+    Builds a single-elimination bracket with players listed in seed order.
+    When the field isn't a power of two, the top seeds get byes.
+    """
+    t = _new_tournament(name, "knockout", players, boards, mode)
+    size = 1
+    while size < len(players):
+        size *= 2
+
+    # Matches are numbered round by round, so match i of a round feeds match
+    # i // 2 of the next, in slot i % 2.
+    seeds = _seed_order(size)
+    first_round = [
+        [players[s - 1] if s <= len(players) else None for s in seeds[i : i + 2]]
+        for i in range(0, size, 2)
+    ]
+    matches, round_start, round_size, round_number = t["matches"], 0, size // 2, 1
+    for pair in first_round:
+        matches.append(_new_match(len(matches), 1, pair, 0))
+    while round_size > 1:
+        next_start = round_start + round_size
+        round_number += 1
+        for i in range(round_size // 2):
+            matches.append(_new_match(len(matches), round_number, [None, None], 2))
+        for i in range(round_size):
+            matches[round_start + i]["feeds"].append([next_start + i // 2, i % 2])
+        round_start, round_size = next_start, round_size // 2
+    t["remaining"] = len(matches)
+
+    for match in matches[: size // 2]:
+        if None in match["players"]:  # A bye: the seed goes straight through
+            _finish_match(t, match, next(p for p in match["players"] if p))
+        else:
+            _make_ready(t, match)
+    _dispatch(t)
+    return t
+
+
+def create_round_robin(name, players, boards, mode="501"):
+    """
+    Builds a round robin where everyone plays everyone once, paired round by
+    round with the circle method. A player's next match becomes ready as soon
+    as both of its players have finished their previous one.
+    """
+    t = _new_tournament(name, "round_robin", players, boards, mode)
+    t["standings"] = {p: {"played": 0, "won": 0, "lost": 0} for p in players}
+    circle = list(players) + ([None] if len(players) % 2 else [])
+    half = len(circle) // 2
+    last_match = {}  # Player -> their latest match so far
+    for round_number in range(1, len(circle)):
+        for i in range(half):
+            pair = [circle[i], circle[-1 - i]]
+            if None in pair:
+                continue  # Sitting this round out
+            match = _new_match(len(t["matches"]), round_number, pair, 0)
+            for player in pair:
+                previous = last_match.get(player)
+                if previous is not None:
+                    previous["feeds"].append([match["id"], None])
+                    match["waiting"] += 1
+                last_match[player] = match
+            t["matches"].append(match)
+        circle.insert(1, circle.pop())  # Rotate everyone but the first player
+    t["remaining"] = len(t["matches"])
+
+    for match in t["matches"]:
+        if match["waiting"] == 0:
+            _make_ready(t, match)
+    _dispatch(t)
+    return t
+
+
+def _make_ready(t, match):
+    match["status"] = "ready"
+    t["ready"].append(match["id"])
+
+
+def _dispatch(t):
+    """Puts ready matches on free boards, first come first served."""
+    while t["ready"] and t["free_boards"]:
+        match = t["matches"][t["ready"].popleft()]
+        match["board"] = t["free_boards"].popleft()
+        match["status"] = "playing"
+
+
+def _finish_match(t, match, winner):
+    """Records a result and passes it on to the matches that were waiting for it."""
+    match["winner"] = winner
+    match["status"] = "done"
+    if t["format"] == "round_robin":
+        for player in match["players"]:
+            row = t["standings"][player]
+            row["played"] += 1
+            row["won" if player == winner else "lost"] += 1
+
+    for match_id, slot in match["feeds"]:
+        waiting = t["matches"][match_id]
+        if slot is not None:  # Knockout: the winner moves into the next round
+            waiting["players"][slot] = winner
+        waiting["waiting"] -= 1
+        if waiting["waiting"] == 0:
+            _make_ready(t, waiting)
+
+    t["remaining"] -= 1
+    if t["remaining"] == 0:
+        # The last knockout match is the final
+        t["champion"] = winner if t["format"] == "knockout" else standings(t)[0]["player"]
+        t["finished"] = True
+
+
+def report_result(t, match_id, winner):
+    """
+    Applies the result of a match that was being played on a board, frees the
+    board and schedules whatever can now be played. Reporting a match that is
+    already done has no effect.
+    """
+    if not 0 <= match_id < len(t["matches"]):
+        raise TournamentError(f"No match {match_id} in this tournament.")
+    match = t["matches"][match_id]
+    if match["status"] == "done":
+        return False
+    if match["status"] != "playing":
+        raise TournamentError(f"Match {match_id} has not been put on a board yet.")
+    winner = next((p for p in match["players"] if p.lower() == str(winner).lower()), None)
+    if winner is None:
+        raise TournamentError(f"The winner must be one of {' or '.join(match['players'])}.")
+
+    t["free_boards"].append(match["board"])
+    _finish_match(t, match, winner)
+    _dispatch(t)
+    return True
+
+
+def standings(t):
+    """Round-robin table, most wins first."""
+    rows = [{"player": p, **row} for p, row in t.get("standings", {}).items()]
+    return sorted(rows, key=lambda row: (-row["won"], row["lost"]))
+
+
+def view(t):
+    """The tournament as shown to clients, with each board's current match."""
+    matches = [
+        {k: m[k] for k in ("id", "round", "players", "winner", "board", "status")}
+        for m in t["matches"]
+    ]
+    boards = {board: None for board in t["boards"]}
+    for m in matches:
+        if m["status"] == "playing":
+            boards[m["board"]] = m["id"]
+    result = {
+        k: t[k] for k in ("id", "name", "format", "mode", "players", "champion", "finished")
+    }
+    result["boards"] = boards
+    result["matches"] = matches
+    if t["format"] == "round_robin":
+        result["standings"] = standings(t)
+    return result
+
+
+# --- Storage ---
+
+
+class _Rows:
+    """
+    A stored tournament's matches (by id) or standings (by player), read from
+    the database as they are used. Only the rows that were read are written
+    back, which is what keeps a result's cost independent of the tournament's
+    size.
+    """
+
+    def __init__(self, read, read_all, size):
+        self.read = read
+        self.read_all = read_all
+        self.size = size
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            value = self.read(key)
+            if value is None:
+                raise KeyError(key)
+            self.loaded[key] = value
+        return self.loaded[key]
+
+    def __len__(self):
+        return self.size
+
+    def items(self):
+        """Every row, for reading only: rows not used through [] aren't written back."""
+        return [(key, self.loaded.get(key, value)) for key, value in self.read_all()]
+
+
+def connect(path=archive.DEFAULT_PATH):
+    """Returns this thread's archive connection with the tournament tables created."""
+    return archive.connect(path, SCHEMA)
+
+
+def _dumps(t):
+    data = {k: v for k, v in t.items() if k not in ("matches", "standings")}
+    data.update(
+        ready=list(t["ready"]), free_boards=list(t["free_boards"]), match_count=len(t["matches"])
+    )
+    return json.dumps(data, separators=(",", ":"))
+
+
+def _loads(data):
+    t = json.loads(data)
+    t["ready"], t["free_boards"] = deque(t["ready"]), deque(t["free_boards"])
+    return t
+
+
+def _read_match(conn, tournament_id, match_id):
+    row = conn.execute(
+        "SELECT data FROM tournament_matches WHERE tournament_id = ? AND match_id = ?",
+        (tournament_id, match_id),
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _read_matches(conn, tournament_id):
+    rows = conn.execute(
+        "SELECT match_id, data FROM tournament_matches WHERE tournament_id = ? ORDER BY match_id",
+        (tournament_id,),
+    )
+    return [(match_id, json.loads(data)) for match_id, data in rows]
+
+
+def _read_standing(conn, tournament_id, player):
+    row = conn.execute(
+        "SELECT played, won, lost FROM tournament_standings WHERE tournament_id = ? AND player = ?",
+        (tournament_id, player),
+    ).fetchone()
+    return dict(zip(("played", "won", "lost"), row)) if row else None
+
+
+def _read_standings(conn, tournament_id, players):
+    rows = {
+        player: {"played": played, "won": won, "lost": lost}
+        for player, played, won, lost in conn.execute(
+            "SELECT player, played, won, lost FROM tournament_standings WHERE tournament_id = ?",
+            (tournament_id,),
+        )
+    }
+    return [(p, rows[p]) for p in players if p in rows]  # In entry order, for ties
+
+
+def _write(conn, t):
+    """Writes a tournament's own row, and every match and standings row it holds or has read."""
+    matches, standings = t["matches"], t.get("standings", {})
+    if isinstance(matches, _Rows):
+        matches = matches.loaded.values()
+    standings = standings.loaded.items() if isinstance(standings, _Rows) else standings.items()
+    conn.execute(
+        "INSERT OR REPLACE INTO tournaments (id, name, format, finished, created_at, data) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (t["id"], t["name"], t["format"], int(t["finished"]), t["created_at"], _dumps(t)),
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO tournament_matches (tournament_id, match_id, data) "
+        "VALUES (?, ?, ?)",
+        [(t["id"], m["id"], json.dumps(m, separators=(",", ":"))) for m in matches],
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO tournament_standings (tournament_id, player, played, won, lost) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(t["id"], p, row["played"], row["won"], row["lost"]) for p, row in standings],
+    )
+
+
+def save(conn, t):
+    with conn:
+        _write(conn, t)
+
+
+def load(conn, tournament_id, lazy=False):
+    """
+    Loads a tournament, or returns None. A lazy load reads matches and
+    standings only as they are used, e.g. to apply one result.
+    """
+    row = conn.execute(
+        "SELECT data FROM tournaments WHERE id = ?", (tournament_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    t = _loads(row[0])
+    size = t.pop("match_count", None)
+    if "matches" in t:
+        return t  # Stored before matches had rows of their own; saved as rows next time
+    if lazy:
+        t["matches"] = _Rows(
+            partial(_read_match, conn, tournament_id),
+            partial(_read_matches, conn, tournament_id),
+            size,
+        )
+        if t["format"] == "round_robin":
+            t["standings"] = _Rows(
+                partial(_read_standing, conn, tournament_id),
+                partial(_read_standings, conn, tournament_id, t["players"]),
+                len(t["players"]),
+            )
+    else:
+        t["matches"] = [match for _, match in _read_matches(conn, tournament_id)]
+        if t["format"] == "round_robin":
+            t["standings"] = dict(_read_standings(conn, tournament_id, t["players"]))
+    return t
+
+
+def list_tournaments(conn):
+    rows = conn.execute(
+        "SELECT id, name, format, finished, created_at FROM tournaments "
+        "ORDER BY created_at DESC"
+    ).fetchall()
+    return [
+        {"id": i, "name": n, "format": f, "finished": bool(done), "created_at": c}
+        for i, n, f, done, c in rows
+    ]
+
+
+def record_result(conn, tournament_id, match_id, winner):
+    """
+    Reports a result in one write transaction, so results arriving from several
+    workers at once are applied one at a time. Only the match, the (at most
+    two) matches it feeds, the players' standings and the tournament's own row
+    are read and written. Returns the lazily loaded tournament, or None if
+    there is no such tournament.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        t = load(conn, tournament_id, lazy=True)
+        if t is not None and report_result(t, match_id, winner):
+            _write(conn, t)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return t